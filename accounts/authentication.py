@@ -0,0 +1,51 @@
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from .cache import cache_user, get_cached_user
+from .serializers import USER_CLAIMS
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """`JWTAuthentication` that finds the token's user in `accounts.cache` before querying for it."""
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        cached = None if user_id is None else get_cached_user(user_id)
+        if cached is None:
+            # Raises for a missing or inactive user, so only usable ones are cached.
+            user = super().get_user(validated_token)
+            cache_user(user_id, user)
+            return user
+
+        user, password_digest = cached
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != password_digest:
+            raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+        return user
+
+
+class ClaimsJWTAuthentication(CachedJWTAuthentication):
+    """
+    Makes the user a `TokenUser` built from the access token's claims (id,
+    email, is_staff), without loading it. Tokens issued without the claims
+    are authenticated as by `CachedJWTAuthentication`.
+    """
+
+    def get_user(self, validated_token):
+        if all(claim in validated_token for claim in (api_settings.USER_ID_CLAIM, *USER_CLAIMS)):
+            return api_settings.TOKEN_USER_CLASS(validated_token)
+        return super().get_user(validated_token)
+
+
+class ClaimsAuthReadMixin:
+    """
+    With JWT_CLAIMS_AUTH on, authenticates the view's safe-method requests
+    from the token's claims. Such views may only read `id`, `pk`, `email`
+    and `is_staff` off `request.user`, and must filter by `user_id`.
+    """
+
+    def get_authenticators(self):
+        if settings.JWT_CLAIMS_AUTH and self.request.method in SAFE_METHODS:
+            return [ClaimsJWTAuthentication()]
+        return super().get_authenticators()
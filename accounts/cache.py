@@ -0,0 +1,94 @@
+"""
+Users looked up by id for authentication, cached in two layers: a small
+in-process LRU (entries live USER_CACHE_LOCAL_TTL seconds) in front of the
+shared cache (USER_CACHE_TIMEOUT seconds).
+
+Saving or deleting a user drops both layers in the process that did it
+(`signals.py`); other processes' LRUs catch up within USER_CACHE_LOCAL_TTL.
+Users are cached as their field values and rebuilt on each hit, so no two
+requests share an instance. The password hash is left out of the cache:
+it comes back deferred (loaded only if something reads it, and left alone
+by `save()`), and the token revocation check gets the same MD5 digest of
+it that simplejwt puts in the tokens.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class LocalLRU:
+    """A thread-safe LRU mapping whose entries also expire after a TTL."""
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = value, time.monotonic() + ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_users = LocalLRU(settings.USER_CACHE_SIZE)
+
+
+def _key(user_id):
+    return f'accounts:user:{user_id}'
+
+
+def _fields():
+    return [f.attname for f in get_user_model()._meta.concrete_fields if f.attname != 'password']
+
+
+def get_cached_user(user_id):
+    """The cached user with this id as a fresh instance and its password digest, or None."""
+    key = _key(user_id)
+    row = local_users.get(key)
+    if row is None:
+        row = cache.get(key)
+        if row is None:
+            return None
+        local_users.set(key, row, settings.USER_CACHE_LOCAL_TTL)
+    db, values, password_digest = row
+    return get_user_model().from_db(db, _fields(), values), password_digest
+
+
+def cache_user(user_id, user):
+    key = _key(user_id)
+    row = user._state.db, [getattr(user, field) for field in _fields()], get_md5_hash_password(user.password)
+    cache.set(key, row, settings.USER_CACHE_TIMEOUT)
+    local_users.set(key, row, settings.USER_CACHE_LOCAL_TTL)
+
+
+def invalidate_user(user_id):
+    key = _key(user_id)
+    local_users.delete(key)
+    cache.delete(key)
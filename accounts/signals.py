@@ -0,0 +1,16 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+from .cache import invalidate_user
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def user_changed(sender, instance, **kwargs) -> None:
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+    # Now, so the user's next request sees the change, and again after
+    # commit in case a concurrent request cached the old row meanwhile.
+    invalidate_user(user_id)
+    transaction.on_commit(lambda: invalidate_user(user_id))
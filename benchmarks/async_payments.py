@@ -0,0 +1,170 @@
+"""
+Checkout and cancel throughput, sync views on a thread pool (like gunicorn's
+threads) vs the async views on one event loop under `src/asgi.py`, against a
+local fake Stripe (in its own process) that answers after `--latency` seconds.
+
+    python -m benchmarks.async_payments --latency 0.1 --threads 8 --concurrency 32
+
+Async requests go straight into the ASGI application, as a server would
+pass them on. Runs against a throwaway test database built from
+`DATABASES["default"]`.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.utils import setup_django, test_database, run_threads, retrying, percentile, print_table
+
+
+def seed():
+    from django.contrib.auth import get_user_model
+    from rest_framework_simplejwt.tokens import AccessToken
+    from books.models import Book
+    from borrowing.models import Borrowing
+    from payment.models import Payment
+
+    user = get_user_model().objects.create_user(email='reader@example.com', password='pass')
+    book = Book.objects.create(title='Book', author='Author', cover='HARD', inventory=5, daily_fee='1.25')
+    borrowing = Borrowing.objects.create(
+        borrow_date='2025-07-01', expected_return_date='2025-07-08', book=book, user=user
+    )
+    # A paid session, so every cancel goes all the way to a refund.
+    payment = Payment.objects.create(
+        borrowing=borrowing, session_id='cs_paid', session_url='https://example.com', money_to_pay='8.75',
+        type=Payment.TypeChoices.PAYMENT, status=Payment.StatusChoices.PAID,
+    )
+    return f'Bearer {AccessToken.for_user(user)}', borrowing, payment
+
+
+def serve_fake_stripe(latency, conn):
+    from tests.fakes import FakeStripe
+
+    stripe = FakeStripe()
+    stripe.delay = latency
+    stripe.add_session('cs_paid', status='complete', payment_status='paid', payment_intent='pi_paid')
+    stripe.intents['pi_paid'] = {'id': 'pi_paid', 'object': 'payment_intent', 'latest_charge': 'ch_paid'}
+    conn.send(stripe.url)
+    conn.recv()  # Serve until told to stop.
+    stripe.close()
+
+
+def bench_sync(path, body, token, threads, duration):
+    from django.test import Client
+
+    def request():
+        response = retrying(lambda: Client().post(
+            path, body, content_type='application/json', HTTP_AUTHORIZATION=token
+        ))
+        assert response.status_code == 200, response.content
+
+    return run_threads(request, threads, duration)
+
+
+async def asgi_post(app, path, body, token):
+    """POST `body` to the ASGI `app` and return the response status."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [
+            (b'host', b'testserver'), (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()), (b'authorization', token.encode()),
+        ],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    received = False
+    response = {}
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        # Django listens for a disconnect until the response is sent.
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+
+    await app(scope, receive, send)
+    return response['status']
+
+
+def bench_async(path, body, token, concurrency, duration):
+    from src.asgi import application
+
+    latencies = []
+
+    async def client(deadline):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status = await asgi_post(application, path, body, token)
+            assert status == 200, status
+            latencies.append(time.perf_counter() - start)
+
+    async def run():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(client(deadline) for _ in range(concurrency)))
+
+    asyncio.run(run())
+    return len(latencies), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.1, help='Seconds the fake Stripe takes per request')
+    parser.add_argument('--threads', type=int, default=8, help='Threads serving the sync views')
+    parser.add_argument('--concurrency', type=int, default=32, help='Requests in flight against the async views')
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.urls import reverse
+    from payment.gateway import reset_gateway
+
+    settings.ALLOWED_HOSTS = ['testserver']
+    database = settings.DATABASES['default']
+    if database['ENGINE'].endswith('sqlite3'):
+        # Each ASGI request has its own connection, and SQLite's shared
+        # in-memory test database fails on lock conflicts where a file waits.
+        database.setdefault('TEST', {})['NAME'] = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    conn, child_conn = multiprocessing.Pipe()
+    stripe = multiprocessing.Process(target=serve_fake_stripe, args=(args.latency, child_conn), daemon=True)
+    stripe.start()
+    settings.STRIPE_API_URL = conn.recv()
+    settings.STRIPE_POOL_SIZE = max(args.threads, 10)
+    reset_gateway()
+
+    rows = []
+    try:
+        with test_database():
+            token, borrowing, payment = seed()
+            for label, name, body in [
+                ('checkout', 'create-checkout-session', {'borrowing_id': borrowing.id}),
+                ('cancel', 'stripe-cancel', {'payment_id': payment.id}),
+            ]:
+                body = json.dumps(body).encode()
+                for mode, run in [
+                    (f'sync x{args.threads} threads',
+                     lambda: bench_sync(reverse(name), body, token, args.threads, args.duration)),
+                    (f'async x{args.concurrency} in flight',
+                     lambda: bench_async(reverse(f'async-{name}'), body, token, args.concurrency, args.duration)),
+                ]:
+                    done, latencies = run()
+                    rows.append((
+                        label, mode, done, f'{done / args.duration:.1f}',
+                        f'{percentile(latencies, 50) * 1000:.0f}', f'{percentile(latencies, 99) * 1000:.0f}',
+                    ))
+    finally:
+        conn.send('stop')
+        stripe.join()
+    print_table(('endpoint', 'views', 'requests', 'req/s', 'p50 ms', 'p99 ms'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Latency of `GET /api/books/` against PostgreSQL with a new connection per
+request, with persistent connections (CONN_MAX_AGE) and with the psycopg
+pool.
+
+    POSTGRES_DB=cinema POSTGRES_USER=... POSTGRES_PASSWORD=... POSTGRES_HOST=localhost \\
+        python -m benchmarks.db_pooling --threads 8 --duration 5
+
+Requests go through Django's WSGI handler, which opens and closes
+connections around each request as under gunicorn. The catalog cache is
+bypassed so every request queries. Runs against a throwaway test database
+built from `DATABASES["default"]`.
+"""
+import argparse
+import io
+import sys
+
+from benchmarks.utils import setup_django, test_database, run_threads, percentile, print_table
+
+
+def wsgi_get(app, path):
+    """GET `path` from the WSGI `app` and return the response status."""
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+    }
+    status = []
+    response = app(environ, lambda s, headers: status.append(s))
+    try:
+        b''.join(response)
+    finally:
+        response.close()  # Sends request_finished, which releases the connection.
+    return int(status[0].split()[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--books', type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.wsgi import get_wsgi_application
+    from django.db import connection, connections
+    from django.urls import reverse
+    import books.views
+    from books.models import Book
+
+    database = connections.settings['default']
+    if not database['ENGINE'].endswith('postgresql'):
+        parser.error('set POSTGRES_DB (and POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST) to run against Postgres')
+    settings.ALLOWED_HOSTS = ['testserver']
+    books.views.cached_catalog_response = lambda request, scope, build: build()
+    pool = database.get('OPTIONS', {}).get('pool') or {'min_size': 2, 'max_size': args.threads}
+    app = get_wsgi_application()
+    url = reverse('book-list')
+
+    def request():
+        status = wsgi_get(app, url)
+        assert status == 200, status
+
+    rows = []
+    with test_database():
+        Book.objects.bulk_create(
+            Book(title=f'Book {i}', author='Author', cover='HARD', inventory=5, daily_fee='1.25')
+            for i in range(args.books)
+        )
+        connection.close()
+        for label, conn_max_age, options in [
+            ('new connection per request', 0, {}),
+            ('persistent (CONN_MAX_AGE)', 600, {}),
+            (f'pool (max_size {pool["max_size"]})', 0, {'pool': pool}),
+        ]:
+            # Connections (and the pool) are built from these on next use.
+            connection.close_pool()
+            database['CONN_MAX_AGE'] = conn_max_age
+            database['OPTIONS'] = options
+            done, latencies = run_threads(request, args.threads, args.duration)
+            rows.append((
+                label, done, f'{done / args.duration:.0f}',
+                f'{percentile(latencies, 50) * 1000:.2f}', f'{percentile(latencies, 99) * 1000:.2f}',
+            ))
+        connection.close_pool()
+    print_table(('connections', 'requests', 'req/s', 'p50 ms', 'p99 ms'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Borrow/return throughput on one hot title, single-row vs sharded inventory.
+
+    python -m benchmarks.inventory_sharding --threads 32 --shards 16
+
+Runs against a throwaway test database built from `DATABASES["default"]`.
+SQLite serialises all writers on one database lock, so the difference only
+shows up on PostgreSQL.
+"""
+import argparse
+import time
+
+from benchmarks.utils import setup_django, test_database, run_threads, retrying, percentile, print_table
+
+
+def bench(shards, threads, duration, hold):
+    from django.db import transaction
+    from books.models import Book
+
+    book = Book.objects.create(
+        title='Blockbuster', author='Author', cover='HARD',
+        inventory=30000, daily_fee=1, inventory_shards=shards,
+    )
+    if shards:
+        Book.objects.rebalance(book.pk)
+    book.refresh_from_db()
+
+    def borrow():
+        with transaction.atomic():
+            if not Book.objects.reserve(book):
+                raise RuntimeError('Ran out of copies')
+            # Stand-in for the rest of the borrow transaction (row insert,
+            # commit round-trip) during which the counter row stays locked.
+            time.sleep(hold)
+
+    def borrow_and_return():
+        retrying(borrow)
+        retrying(lambda: Book.objects.release(book))
+
+    done, latencies = run_threads(borrow_and_return, threads, duration)
+    book.refresh_from_db()
+    assert book.available_inventory == 30000, 'inventory drifted'
+    return done / duration, percentile(latencies, 50), percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--shards', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--hold-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        rows = []
+        for label, shards in [('single-row', 0), (f'{args.shards} shards', args.shards)]:
+            ops, p50, p99 = bench(shards, args.threads, args.seconds, args.hold_ms / 1000)
+            rows.append((label, f'{ops:.0f}', f'{p50 * 1000:.2f}', f'{p99 * 1000:.2f}'))
+        print_table(('mode', 'borrow+return/s', 'p50 ms', 'p99 ms'), rows)
+
+
+if __name__ == '__main__':
+    main()
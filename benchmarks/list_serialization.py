@@ -0,0 +1,95 @@
+"""
+Rows per second served by the borrowing and payment list endpoints, through
+the regular serializers vs the `values_list()` fast path.
+
+    python -m benchmarks.list_serialization --rows 5000 --page-size 100
+
+Each run walks every page of the list as a staff user. Runs against a
+throwaway test database built from `DATABASES["default"]`.
+"""
+import argparse
+import time
+
+from benchmarks.utils import setup_django, test_database, print_table
+
+
+def seed(rows):
+    from datetime import date
+    from django.contrib.auth import get_user_model
+    from books.models import Book
+    from borrowing.models import Borrowing
+    from payment.models import Payment
+
+    User = get_user_model()
+    staff = User.objects.create_superuser(email='staff@example.com', password='pass')
+    users = User.objects.bulk_create(User(email=f'reader{i}@example.com') for i in range(50))
+    books = Book.objects.bulk_create(
+        Book(title=f'Book {i}', author='Author', cover='HARD', inventory=5, daily_fee='1.25') for i in range(200)
+    )
+    borrowings = Borrowing.objects.bulk_create(
+        Borrowing(
+            borrow_date=date(2025, 1, 1 + i % 28), expected_return_date=date(2025, 2, 1),
+            book=books[i % len(books)], user=users[i % len(users)],
+        )
+        for i in range(rows)
+    )
+    Payment.objects.bulk_create(
+        Payment(
+            borrowing=b, session_id=f'cs_{b.pk}', session_url='https://example.com', money_to_pay='9.50',
+            type=Payment.TypeChoices.PAYMENT, status=Payment.StatusChoices.PENDING,
+        )
+        for b in borrowings
+    )
+    return staff
+
+
+def walk(client, url, page_size):
+    rows = 0
+    response = client.get(url, {'page_size': page_size})
+    while True:
+        rows += len(response.data['results'])
+        if not response.data['next']:
+            return rows
+        response = client.get(response.data['next'])
+
+
+def bench(client, view, url, page_size, fast):
+    view.fast_list = fast
+    try:
+        start = time.perf_counter()
+        rows = walk(client, url, page_size)
+        return rows / (time.perf_counter() - start)
+    finally:
+        view.fast_list = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from borrowing.views import BorrowingViewSet
+    from payment.views import PaymentViewSet
+
+    settings.ALLOWED_HOSTS = ['testserver']
+    with test_database():
+        client = APIClient()
+        client.force_authenticate(user=seed(args.rows))
+        rows = []
+        for label, view, url in [
+            ('borrowings', BorrowingViewSet, reverse('borrowing-list')),
+            ('payments', PaymentViewSet, reverse('payment-list')),
+        ]:
+            before = bench(client, view, url, args.page_size, fast=False)
+            after = bench(client, view, url, args.page_size, fast=True)
+            rows.append((label, f'{before:.0f}', f'{after:.0f}', f'{after / before:.1f}x'))
+        print_table(('endpoint', 'serializer rows/s', 'fast path rows/s', 'speedup'), rows)
+
+
+if __name__ == '__main__':
+    main()
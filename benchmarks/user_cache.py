@@ -0,0 +1,58 @@
+"""
+Authenticated request throughput with the token's user loaded from the
+database on every request (plain `JWTAuthentication`) vs resolved through
+`accounts.cache`.
+
+    python -m benchmarks.user_cache --threads 4 --duration 5
+
+Each request is a GET of `/api/users/me/` with a bearer token, through the
+full middleware and DRF stack. Runs against a throwaway test database built
+from `DATABASES["default"]`.
+"""
+import argparse
+
+from benchmarks.utils import setup_django, test_database, run_threads, percentile, print_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.test import Client
+    from django.urls import reverse
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.tokens import AccessToken
+    from accounts.authentication import CachedJWTAuthentication
+
+    settings.ALLOWED_HOSTS = ['testserver']
+    url = reverse('user-profile')
+    rows = []
+    with test_database():
+        user = get_user_model().objects.create_user(email='reader@example.com', password='pass')
+        token = f'Bearer {AccessToken.for_user(user)}'
+
+        def request():
+            response = Client().get(url, HTTP_AUTHORIZATION=token)
+            assert response.status_code == 200, response.content
+
+        cached_get_user = CachedJWTAuthentication.get_user
+        for label, get_user in [('database', JWTAuthentication.get_user), ('cached', cached_get_user)]:
+            CachedJWTAuthentication.get_user = get_user
+            try:
+                done, latencies = run_threads(request, args.threads, args.duration)
+            finally:
+                CachedJWTAuthentication.get_user = cached_get_user
+            rows.append((
+                label, done, f'{done / args.duration:.0f}',
+                f'{percentile(latencies, 50) * 1000:.2f}', f'{percentile(latencies, 99) * 1000:.2f}',
+            ))
+    print_table(('user lookup', 'requests', 'req/s', 'p50 ms', 'p99 ms'), rows)
+
+
+if __name__ == '__main__':
+    main()
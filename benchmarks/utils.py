@@ -0,0 +1,82 @@
+import os
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Create a throwaway test database (like the test runner does) for the run."""
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from django.test.runner import DiscoverRunner
+
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    old_config = runner.setup_databases()
+    try:
+        yield
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+
+
+def run_threads(worker, threads, duration):
+    """
+    Call `worker()` in a loop from `threads` threads for `duration` seconds.
+    Returns (completed calls, per-call latencies in seconds).
+    """
+    from django.db import connection
+
+    barrier = threading.Barrier(threads)
+    deadline = []
+    latencies = [[] for _ in range(threads)]
+
+    def target(i):
+        try:
+            barrier.wait()
+            if not deadline:
+                deadline.append(time.perf_counter() + duration)
+            while time.perf_counter() < deadline[0]:
+                start = time.perf_counter()
+                worker()
+                latencies[i].append(time.perf_counter() - start)
+        finally:
+            connection.close()
+
+    pool = [threading.Thread(target=target, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    flat = [x for per_thread in latencies for x in per_thread]
+    return len(flat), flat
+
+
+def retrying(fn):
+    """Run `fn`, retrying while SQLite rejects a concurrent writer."""
+    from django.db import OperationalError
+
+    while True:
+        try:
+            return fn()
+        except OperationalError:
+            continue
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+
+def print_table(header, rows):
+    widths = [max(len(str(x)) for x in column) for column in zip(header, *rows)]
+    for row in [header, *rows]:
+        print('  '.join(str(x).rjust(w) for x, w in zip(row, widths)))
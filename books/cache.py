@@ -0,0 +1,108 @@
+import hashlib
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY = 'books:catalog:version'
+
+
+def get_catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock rather than 1 so an evicted counter can never
+        # come back at a value that old entries were cached under.
+        cache.add(VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+
+
+def bump_catalog_version_on_commit():
+    # Bumping before commit would let a concurrent miss cache the old rows
+    # under the new version.
+    transaction.on_commit(bump_catalog_version)
+
+
+def _not_modified(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags or etag in (e.removeprefix('W/') for e in etags)
+
+
+def _wait_for(key):
+    deadline = time.monotonic() + settings.BOOK_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.01)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def _build(key, build):
+    response = build()
+    if response.status_code != status.HTTP_200_OK:
+        return None, response
+    body = json.dumps(response.data, cls=DjangoJSONEncoder)
+    entry = {
+        'data': json.loads(body),
+        'etag': '"%s"' % hashlib.sha256(body.encode()).hexdigest()[:40],
+    }
+    cache.set(key, entry, settings.BOOK_CACHE_TIMEOUT)
+    return entry, response
+
+
+def cached_catalog_response(request, scope, build):
+    """
+    Serve `build()`'s response from the catalog cache, keyed by the current
+    catalog version so a single counter bump invalidates every entry.
+
+    Only one caller rebuilds a missing entry; the others wait for it (up to
+    BOOK_CACHE_LOCK_WAIT seconds) instead of all hitting the database.
+    """
+    raw_key = '|'.join([
+        scope,
+        request.accepted_renderer.format,
+        request.build_absolute_uri(),
+    ])
+    digest = hashlib.sha256(raw_key.encode()).hexdigest()
+    key = f'books:catalog:{get_catalog_version()}:{digest}'
+
+    entry = cache.get(key)
+    if entry is None:
+        lock_key = f'{key}:lock'
+        token = uuid.uuid4().hex
+        if cache.add(lock_key, token, settings.BOOK_CACHE_LOCK_WAIT * 2):
+            try:
+                entry, response = _build(key, build)
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+            if entry is None:
+                return response
+        else:
+            entry = _wait_for(key)
+            if entry is None:
+                entry, response = _build(key, build)
+                if entry is None:
+                    return response
+
+    if _not_modified(request, entry['etag']):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': entry['etag']})
+    return Response(entry['data'], headers={'ETag': entry['etag']})
@@ -0,0 +1,3 @@
+# Shared by the import serializer, the import_books command and the importer.
+IMPORT_FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 1000
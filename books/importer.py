@@ -0,0 +1,162 @@
+import csv
+import json
+import os
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.db import DatabaseError, transaction
+from rest_framework import serializers
+
+from .cache import bump_catalog_version_on_commit
+from .constants import DEFAULT_CHUNK_SIZE
+from .models import Book
+from .serializers import BookSerializer
+
+IMPORT_FIELDS = ['title', 'author', 'cover', 'inventory', 'daily_fee']
+
+
+@dataclass
+class ImportReport:
+    created: int = 0
+    updated: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)
+    max_errors: int = 1000
+    # Why the import stopped before the end of the file, if it did.
+    detail: str = ''
+
+    def add_error(self, row, errors):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def as_dict(self):
+        report = {
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+        if self.detail:
+            report['detail'] = self.detail
+        return report
+
+
+def guess_format(name):
+    ext = os.path.splitext(name)[1].lower()
+    return {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}.get(ext)
+
+
+def read_rows(lines, file_format):
+    """Lazily yield (row number, row dict, parse error) from a text stream."""
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield number, None, 'Expected a JSON object.'
+            continue
+        yield number, row, None
+
+
+def _validate(row, validator):
+    book_id = row.pop('id', None) or None
+    if book_id is not None:
+        try:
+            book_id = int(book_id)
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({'id': ['A valid integer is required.']})
+    data = validator.run_validation({k: row[k] for k in IMPORT_FIELDS if k in row})
+    return book_id, data
+
+
+def _write_chunk(books, existing_ids, totals):
+    new = [b for b in books if b.pk is None]
+    changed = [b for b in books if b.pk is not None]
+    with transaction.atomic():
+        Book.objects.bulk_create(new)
+        Book.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=IMPORT_FIELDS,
+        )
+        # An imported `inventory` is the total; re-spread it over the shards.
+        for book_id in Book.objects.filter(pk__in=existing_ids, inventory_shards__gt=0).values_list('pk', flat=True):
+            Book.objects.rebalance(book_id, total=totals[book_id])
+        bump_catalog_version_on_commit()
+    return len(new), len(changed)
+
+
+def _import_chunk(chunk, report):
+    validator = BookSerializer()
+    inserts, updates = [], {}
+    for number, row, parse_error in chunk:
+        if parse_error:
+            report.add_error(number, {'non_field_errors': [parse_error]})
+            continue
+        try:
+            book_id, data = _validate(dict(row), validator)
+        except serializers.ValidationError as e:
+            report.add_error(number, e.detail)
+            continue
+        if book_id is None:
+            inserts.append((number, Book(**data)))
+        else:
+            # The last row for an id wins, as if the rows were applied in order.
+            updates[book_id] = (number, Book(id=book_id, **data))
+
+    existing_ids = set(Book.objects.filter(pk__in=list(updates)).values_list('pk', flat=True))
+    valid = list(inserts)
+    for book_id, (number, book) in updates.items():
+        if book_id in existing_ids:
+            valid.append((number, book))
+        else:
+            report.add_error(number, {'id': [f'Book {book_id} does not exist.']})
+    totals = {book.pk: book.inventory for _, book in valid if book.pk is not None}
+
+    if not valid:
+        return
+    try:
+        created, updated = _write_chunk([b for _, b in valid], existing_ids, totals)
+    except DatabaseError as e:
+        for number, _ in valid:
+            report.add_error(number, {'non_field_errors': [f'Chunk rolled back: {e}']})
+        return
+    report.created += created
+    report.updated += updated
+
+
+def import_books(lines, file_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Load books from a CSV or JSON Lines text stream.
+
+    Rows are validated with BookSerializer's rules and written `chunk_size`
+    at a time, one transaction per chunk. Rows carrying an `id` update that
+    book, the rest are inserted. Invalid rows, and every row of a chunk the
+    database rejects, are reported and skipped without stopping the load.
+    Text that isn't valid UTF-8 stops it: the rows read before it are still
+    written, and `report.detail` says why the rest weren't.
+    """
+    report = ImportReport()
+    rows = read_rows(lines, file_format)
+    while True:
+        chunk = []
+        try:
+            chunk.extend(islice(rows, chunk_size))
+        except UnicodeDecodeError:
+            report.detail = 'File must be UTF-8 encoded; the import stopped at the first text that is not.'
+        if chunk:
+            _import_chunk(chunk, report)
+        if report.detail or len(chunk) < chunk_size:
+            return report
@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from books.constants import DEFAULT_CHUNK_SIZE, IMPORT_FORMATS
+from books.importer import guess_format, import_books
+
+
+class Command(BaseCommand):
+    help = "Bulk import books from a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--file-format",
+            choices=IMPORT_FORMATS,
+            help="Defaults to the file extension (.csv, .jsonl/.ndjson).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["file_format"] or guess_format(path)
+        if file_format is None:
+            raise CommandError("Cannot tell the file format; pass --file-format.")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive.")
+
+        with open(path, newline="", encoding="utf-8") as f:
+            report = import_books(f, file_format, chunk_size=options["chunk_size"])
+
+        for error in report.errors:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        if report.detail:
+            self.stderr.write(report.detail)
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report.created}, updated {report.updated}, {report.error_count} rows rejected."
+        ))
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Book',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('author', models.CharField(max_length=255)),
+                ('cover', models.CharField(choices=[('HARD', 'Hardcover'), ('SOFT', 'Softcover')], max_length=4)),
+                ('inventory', models.PositiveSmallIntegerField(help_text='Number of copies currently available')),
+                ('daily_fee', models.DecimalField(decimal_places=2, help_text='Daily fee in $USD', max_digits=8)),
+            ],
+        ),
+    ]
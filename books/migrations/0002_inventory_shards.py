@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='inventory_shards',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Number of counter rows the inventory is spread over; 0 keeps it on this row'),
+        ),
+        migrations.CreateModel(
+            name='InventoryShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('inventory', models.PositiveSmallIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='books.book')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('book', 'index'), name='unique_book_shard_index')],
+            },
+        ),
+    ]
@@ -1,4 +1,71 @@
-from django.db import models # type: ignore
+import random
+
+from django.db import models, transaction # type: ignore
+from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from .cache import bump_catalog_version_on_commit
+
+
+class BookManager(models.Manager):
+    def reserve(self, book):
+        """Take one copy off the shelf; returns False if none are left."""
+        if book.inventory_shards:
+            # Start from a random shard so concurrent borrowers of one title
+            # spread their row locks, then fall back to the others in turn.
+            shards = InventoryShard.objects.filter(book_id=book.pk, inventory__gte=1)
+            for index in random.sample(range(book.inventory_shards), book.inventory_shards):
+                if shards.filter(index=index).update(inventory=F('inventory') - 1):
+                    bump_catalog_version_on_commit()
+                    return True
+        if self.filter(pk=book.pk, inventory__gte=1).update(inventory=F('inventory') - 1):
+            bump_catalog_version_on_commit()
+            return True
+        return False
+
+    def release(self, book):
+        """Put one copy back on the shelf."""
+        if book.inventory_shards:
+            index = random.randrange(book.inventory_shards)
+            updated = InventoryShard.objects.filter(book_id=book.pk, index=index).update(inventory=F('inventory') + 1)
+        else:
+            updated = 0
+        if not updated:
+            self.filter(pk=book.pk).update(inventory=F('inventory') + 1)
+        bump_catalog_version_on_commit()
+
+    def rebalance(self, book_id, total=None):
+        """
+        Fold every shard back into one count and spread it evenly over the
+        book's current `inventory_shards`. With sharding off the whole count
+        ends up on the book row and the shard rows are dropped. `total`
+        replaces the available count instead of preserving it.
+        """
+        with transaction.atomic():
+            bump_catalog_version_on_commit()
+            book = self.select_for_update().get(pk=book_id)
+            shards = {s.index: s for s in InventoryShard.objects.select_for_update().filter(book=book)}
+            if total is None:
+                total = book.inventory + sum(s.inventory for s in shards.values())
+
+            count = book.inventory_shards
+            if not count:
+                InventoryShard.objects.filter(book=book).delete()
+                self.filter(pk=book.pk).update(inventory=total)
+                return
+
+            share, remainder = divmod(total, count)
+            to_create, to_update = [], []
+            for index in range(count):
+                amount = share + (1 if index < remainder else 0)
+                if index in shards:
+                    shards[index].inventory = amount
+                    to_update.append(shards[index])
+                else:
+                    to_create.append(InventoryShard(book=book, index=index, inventory=amount))
+            InventoryShard.objects.filter(book=book, index__gte=count).delete()
+            InventoryShard.objects.bulk_update(to_update, ['inventory'])
+            InventoryShard.objects.bulk_create(to_create)
+            self.filter(pk=book.pk).update(inventory=0)
 
 
 class Book(models.Model):
@@ -20,6 +87,54 @@ class Book(models.Model):
         decimal_places=2,
         help_text="Daily fee in $USD"
     )
+    inventory_shards = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="Number of counter rows the inventory is spread over; 0 keeps it on this row"
+    )
+
+    objects = BookManager()
+
+    @property
+    def available_inventory(self):
+        if not self.inventory_shards:
+            return self.inventory
+        return self.inventory + sum(shard.inventory for shard in self.shards.all())
 
     def __str__(self):
         return self.title
+
+
+class InventoryShard(models.Model):
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='shards'
+    )
+    index = models.PositiveSmallIntegerField()
+    inventory = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'index'], name='unique_book_shard_index'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id}#{self.index}: {self.inventory}"
+
+
+def available_inventory_expression(prefix=''):
+    """
+    `Book.available_inventory` as a query expression, for reading it with
+    `values()`. `prefix` reaches the book through relations, e.g. 'book__'.
+    """
+    shard_total = (
+        InventoryShard.objects.filter(book=OuterRef(f'{prefix}pk'))
+        .values('book')
+        .annotate(total=Sum('inventory'))
+        .values('total')
+    )
+    return Case(
+        When(**{f'{prefix}inventory_shards': 0}, then=F(f'{prefix}inventory')),
+        default=F(f'{prefix}inventory') + Coalesce(Subquery(shard_total), 0),
+        output_field=models.IntegerField(),
+    )
@@ -1,8 +1,46 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Book
+from src.sparse_fields import SparseFieldsMixin
+from .constants import DEFAULT_CHUNK_SIZE, IMPORT_FORMATS
+from .models import Book, available_inventory_expression
 
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    field_prefetches = {"inventory": "shards"}
+    row_annotations = {"inventory": available_inventory_expression}
+    inventory_shards = serializers.IntegerField(min_value=0, max_value=64, required=False, write_only=True)
+
     class Meta:
         model = Book
-        fields = ["id", "title", "author", "cover", "inventory", "daily_fee"]
+        fields = ["id", "title", "author", "cover", "inventory", "daily_fee", "inventory_shards"]
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if "inventory" in data:
+            data["inventory"] = instance.available_inventory
+        return data
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            book = super().create(validated_data)
+            if book.inventory_shards:
+                Book.objects.rebalance(book.pk)
+                book.refresh_from_db()
+        return book
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            book = super().update(instance, validated_data)
+            if book.inventory_shards or book.shards.exists():
+                # `inventory` is the total across shards, as shown on read.
+                Book.objects.rebalance(book.pk, total=validated_data.get("inventory"))
+                book.refresh_from_db()
+        return book
+
+
+class BookImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    file_format = serializers.ChoiceField(
+        choices=IMPORT_FORMATS, required=False, help_text="Defaults to the file extension."
+    )
+    chunk_size = serializers.IntegerField(min_value=1, max_value=10000, default=DEFAULT_CHUNK_SIZE)
@@ -1,14 +1,64 @@
-from rest_framework import viewsets
+import io
+
+from drf_spectacular.utils import extend_schema, extend_schema_view
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.response import Response
+from src.sparse_fields import SPARSE_FIELDS_PARAMETERS, SparseFieldsViewMixin
+from .cache import cached_catalog_response
+from .importer import guess_format, import_books
 from .models import Book
-from .serializers import BookSerializer
+from .pagination import BookPagination
+from .serializers import BookSerializer, BookImportSerializer
 
 
-class BookViewSet(viewsets.ModelViewSet):
+@extend_schema_view(
+    list=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
+    retrieve=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
+)
+class BookViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
+    pagination_class = BookPagination
+
+    def get_queryset(self):
+        return self.with_related(super().get_queryset())
 
     def get_permissions(self):
         if self.action in ["list", "retrieve"]:
             return [AllowAny()]
         return [IsAdminUser()]
+
+    def list(self, request, *args, **kwargs):
+        return cached_catalog_response(request, "list", lambda: super(BookViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_catalog_response(
+            request, "retrieve", lambda: super(BookViewSet, self).retrieve(request, *args, **kwargs)
+        )
+
+    @extend_schema(request=BookImportSerializer)
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        parser_classes=[MultiPartParser],
+        serializer_class=BookImportSerializer,
+    )
+    def import_books(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.validated_data["file"]
+        file_format = serializer.validated_data.get("file_format") or guess_format(upload.name)
+        if file_format is None:
+            return Response(
+                {"file_format": ["Cannot tell the format from the file name."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        lines = io.TextIOWrapper(upload.file, encoding="utf-8", newline="")
+        report = import_books(lines, file_format, chunk_size=serializer.validated_data["chunk_size"])
+        # A file that stops decoding partway still reports the chunks already written.
+        return Response(report.as_dict(), status=status.HTTP_400_BAD_REQUEST if report.detail else status.HTTP_200_OK)
@@ -0,0 +1,67 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from borrowing.seeding import DEFAULT_BATCH_SIZE, SEED_PASSWORD, seed_scale
+
+
+class Command(BaseCommand):
+    help = "Bulk generate users, books and borrowing/payment histories for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--books", type=int, default=5000)
+        parser.add_argument("--borrowings", type=int, default=100000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--end-date",
+            type=date.fromisoformat,
+            help="Last day of the history (YYYY-MM-DD). Defaults to today.",
+        )
+        parser.add_argument("--days", type=int, default=730, help="Length of the history in days.")
+        parser.add_argument("--overdue-ratio", type=float, default=0.1, help="Share of loans returned late.")
+        parser.add_argument("--zipf", type=float, default=1.0, help="Skew of book popularity.")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        for name in ("users", "books", "borrowings", "days"):
+            if options[name] < 0:
+                raise CommandError(f"--{name} can't be negative.")
+        if options["borrowings"] and not (options["users"] and options["books"]):
+            raise CommandError("Borrowings need at least one user and one book.")
+        if not 0 <= options["overdue_ratio"] <= 1:
+            raise CommandError("--overdue-ratio must be between 0 and 1.")
+        if options["zipf"] < 0:
+            raise CommandError("--zipf can't be negative.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        started = time.monotonic()
+
+        def progress(report):
+            if report.borrowings:
+                self.stdout.write(
+                    f"{report.borrowings}/{options['borrowings']} borrowings "
+                    f"({time.monotonic() - started:.0f}s)"
+                )
+
+        report = seed_scale(
+            options["users"],
+            options["books"],
+            options["borrowings"],
+            seed=options["seed"],
+            end_date=options["end_date"] or timezone.now().date(),
+            days=options["days"],
+            overdue_ratio=options["overdue_ratio"],
+            zipf=options["zipf"],
+            batch_size=options["batch_size"],
+            progress=progress if options["verbosity"] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report.users} users (password {SEED_PASSWORD!r}), {report.books} books, "
+            f"{report.borrowings} borrowings ({report.open_borrowings} still open), "
+            f"{report.payments} payments ({report.fines} fines) "
+            f"in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('books', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Borrowing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('borrow_date', models.DateField()),
+                ('expected_return_date', models.DateField()),
+                ('actual_return_date', models.DateField(blank=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='borrowings', to='books.book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='borrowings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-borrow_date', '-id'], name='borrowing_date_id_idx'), models.Index(fields=['user', '-borrow_date', '-id'], name='borrowing_user_date_id_idx'), models.Index(condition=models.Q(('actual_return_date__isnull', True)), fields=['user'], name='borrowing_user_active_idx'), models.Index(condition=models.Q(('actual_return_date__isnull', True)), fields=['expected_return_date'], name='borrowing_overdue_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('expected_return_date__gte', models.F('borrow_date'))), name='expected_return_after_borrow'), models.CheckConstraint(condition=models.Q(('actual_return_date__gte', models.F('borrow_date'))), name='actual_return_after_borrow')],
+            },
+        ),
+    ]
@@ -24,6 +24,22 @@ class Borrowing(models.Model):
             CheckConstraint(check=Q(expected_return_date__gte=F('borrow_date')), name='expected_return_after_borrow'),
             CheckConstraint(check=Q(actual_return_date__gte=F('borrow_date')), name='actual_return_after_borrow'),
         ]
+        indexes = [
+            # Cursor pagination order for staff and per-user listings.
+            models.Index(fields=['-borrow_date', '-id'], name='borrowing_date_id_idx'),
+            models.Index(fields=['user', '-borrow_date', '-id'], name='borrowing_user_date_id_idx'),
+            # `is_active=true` filter and the overdue scan only ever look at open loans.
+            models.Index(
+                fields=['user'],
+                condition=Q(actual_return_date__isnull=True),
+                name='borrowing_user_active_idx',
+            ),
+            models.Index(
+                fields=['expected_return_date'],
+                condition=Q(actual_return_date__isnull=True),
+                name='borrowing_overdue_idx',
+            ),
+        ]
 
     def clean(self):
         if self.expected_return_date < self.borrow_date:
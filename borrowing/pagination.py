@@ -0,0 +1,5 @@
+from src.pagination import KeysetPagination
+
+
+class BorrowingPagination(KeysetPagination):
+    ordering = ('-borrow_date', '-id')
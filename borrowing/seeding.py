@@ -0,0 +1,247 @@
+"""
+Synthetic users, books, borrowings and payments at production-like volume,
+for load tests and query plans (`manage.py seed_scale`).
+
+Everything is drawn from `random.Random` streams seeded from `seed`, so
+the same seed and end date give the same rows. Rows get explicit ids
+following the current maximum. Users and books go in with `bulk_create`;
+borrowings and their payments, by far the bulk of the data, as plain rows
+(`_insert`), one transaction per batch. No signals or outbox events fire, and book
+inventory is not adjusted for the loans that are still open.
+"""
+import random
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from accounts.models import User
+from books.cache import bump_catalog_version
+from books.models import Book
+from payment.models import Payment
+from .models import Borrowing
+
+DEFAULT_BATCH_SIZE = 10000
+SEED_PASSWORD = 'password'
+
+LOAN_DAYS = (7, 14, 21, 28)
+# Share of loans that have been paid for, are still pending, or were cancelled.
+PAYMENT_STATUS_WEIGHTS = (0.9, 0.06, 0.04)
+# Share of fines that have been paid.
+FINES_PAID = 0.7
+# Mean number of days a late return is late by.
+MEAN_DAYS_LATE = 6
+STAFF_RATIO = 0.001
+
+BORROWING_FIELDS = ('id', 'book', 'user', 'borrow_date', 'expected_return_date', 'actual_return_date')
+PAYMENT_FIELDS = (
+    'id', 'borrowing', 'type', 'status', 'session_id', 'session_url',
+    'money_to_pay', 'payment_intent_id', 'idempotency_key',
+)
+
+PAYMENT_STATUSES = (
+    Payment.StatusChoices.PAID,
+    Payment.StatusChoices.PENDING,
+    Payment.StatusChoices.CANCELLED,
+)
+
+
+@dataclass
+class SeedReport:
+    users: int = 0
+    books: int = 0
+    borrowings: int = 0
+    open_borrowings: int = 0
+    payments: int = 0
+    fines: int = 0
+
+
+def _insert(model, fields, rows):
+    """
+    Insert `rows` (tuples of database values for `fields`) with COPY on
+    PostgreSQL and a single executemany() elsewhere. Unlike bulk_create
+    this skips model instances and per-value SQL compilation, which is
+    what makes millions of rows a matter of minutes; nothing fills in
+    field defaults, so `fields` must list every NOT NULL column.
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            with cursor.cursor.copy(f'COPY {table} ({columns}) FROM STDIN') as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:
+            placeholders = ', '.join(['%s'] * len(fields))
+            cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', rows)
+
+
+def _next_id(model):
+    return (model.objects.aggregate(max_id=Max('pk'))['max_id'] or 0) + 1
+
+
+def _zipf_weights(count, exponent):
+    """Cumulative weights that make rank r as likely as 1 / r**exponent."""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def _in_batches(rows, batch_size):
+    for start in range(0, rows, batch_size):
+        yield min(batch_size, rows - start)
+
+
+def _create_users(rng, count, batch_size):
+    first_id = _next_id(User)
+    # Hashing is deliberately slow, so every seeded user shares one hash.
+    password = make_password(SEED_PASSWORD)
+    pk = first_id
+    for size in _in_batches(count, batch_size):
+        User.objects.bulk_create([
+            User(
+                id=user_id,
+                email=f'user{user_id}@seed.example.com',
+                password=password,
+                first_name=f'User{user_id}',
+                is_staff=rng.random() < STAFF_RATIO,
+            )
+            for user_id in range(pk, pk + size)
+        ], batch_size=batch_size)
+        pk += size
+    return list(range(first_id, pk))
+
+
+def _create_books(rng, count, batch_size):
+    first_id = _next_id(Book)
+    covers = Book.CoverChoices.values
+    fees = [Decimal(cents) / 100 for cents in range(25, 501, 25)]
+    pk = first_id
+    daily_fees = []
+    for size in _in_batches(count, batch_size):
+        books = [
+            Book(
+                id=book_id,
+                title=f'Book {book_id}',
+                author=f'Author {rng.randrange(max(count // 5, 1))}',
+                cover=rng.choice(covers),
+                inventory=rng.randint(1, 20),
+                daily_fee=rng.choice(fees),
+            )
+            for book_id in range(pk, pk + size)
+        ]
+        Book.objects.bulk_create(books, batch_size=batch_size)
+        daily_fees.extend(book.daily_fee for book in books)
+        pk += size
+    return list(range(first_id, pk)), daily_fees
+
+
+def seed_scale(users, books, borrowings, *, seed=0, end_date, days=730,
+               overdue_ratio=0.1, zipf=1.0, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Create `users` users, `books` books and `borrowings` borrowings of
+    those books by those users, each with its payment, plus a fine for
+    every late return.
+
+    Loans start within `days` days before `end_date`. Book popularity
+    follows a Zipf law with exponent `zipf`, and a few users borrow far
+    more than the rest. `overdue_ratio` of loans come back late; loans
+    not back by `end_date` stay open, including late ones that are now
+    overdue. `progress(report)` is called after each batch.
+    """
+    rng = random.Random(seed)
+    report = SeedReport()
+
+    user_ids = _create_users(rng, users, batch_size)
+    report.users = len(user_ids)
+    book_ids, daily_fees = _create_books(rng, books, batch_size)
+    report.books = len(book_ids)
+    if book_ids:
+        bump_catalog_version()
+    if progress:
+        progress(report)
+
+    # Popularity rank is independent of id order.
+    book_order = list(range(len(book_ids)))
+    rng.shuffle(book_order)
+    book_weights = _zipf_weights(len(book_ids), zipf)
+    user_order = list(range(len(user_ids)))
+    rng.shuffle(user_order)
+    user_weights = _zipf_weights(len(user_ids), 0.5)
+
+    dates = [
+        connection.ops.adapt_datefield_value(end_date - timedelta(days=offset))
+        for offset in range(days, -max(LOAN_DAYS) - 1, -1)
+    ]
+    end = days  # index of `end_date` in `dates`
+    fine_multiplier = Decimal(str(getattr(settings, 'FINE_MULTIPLIER', 1)))
+    paid, pending = Payment.StatusChoices.PAID, Payment.StatusChoices.PENDING
+    payment_type, fine_type = Payment.TypeChoices.PAYMENT, Payment.TypeChoices.FINE
+
+    # Draws made a batch at a time get their own streams, so that the rows
+    # don't depend on the batch size.
+    book_rng, user_rng, status_rng = (
+        random.Random(f'{seed}:{stream}') for stream in ('books', 'users', 'statuses')
+    )
+    borrowing_id = _next_id(Borrowing)
+    payment_id = _next_id(Payment)
+    for size in _in_batches(borrowings, batch_size):
+        loans, payments = [], []
+        picked_books = book_rng.choices(book_order, cum_weights=book_weights, k=size)
+        picked_users = user_rng.choices(user_order, cum_weights=user_weights, k=size)
+        statuses = status_rng.choices(PAYMENT_STATUSES, weights=PAYMENT_STATUS_WEIGHTS, k=size)
+        for book, user, status in zip(picked_books, picked_users, statuses):
+            start = rng.randrange(end + 1)
+            loan_days = rng.choice(LOAN_DAYS)
+            late = 0
+            if rng.random() < overdue_ratio:
+                late = 1 + int(rng.expovariate(1 / MEAN_DAYS_LATE))
+                back = start + loan_days + late
+            else:
+                back = start + rng.randint(1, loan_days)
+            returned = back <= end
+            loans.append((
+                borrowing_id, book_ids[book], user_ids[user],
+                dates[start], dates[start + loan_days], dates[back] if returned else None,
+            ))
+            daily_fee = daily_fees[book]
+            payments.append((
+                payment_id, borrowing_id, payment_type, status,
+                f'cs_seed_{payment_id}', '', daily_fee * loan_days, '', '',
+            ))
+            payment_id += 1
+            if late and returned:
+                payments.append((
+                    payment_id, borrowing_id, fine_type, paid if rng.random() < FINES_PAID else pending,
+                    '', '', daily_fee * late * fine_multiplier, '', '',
+                ))
+                payment_id += 1
+                report.fines += 1
+            if not returned:
+                report.open_borrowings += 1
+            borrowing_id += 1
+
+        with transaction.atomic():
+            _insert(Borrowing, BORROWING_FIELDS, loans)
+            _insert(Payment, PAYMENT_FIELDS, payments)
+        report.borrowings += size
+        report.payments += len(payments)
+        if progress:
+            progress(report)
+
+    _reset_sequences()
+    return report
+
+
+def _reset_sequences():
+    """Move the id sequences (PostgreSQL) past the explicit ids inserted above."""
+    statements = connection.ops.sequence_reset_sql(no_style(), [User, Book, Borrowing, Payment])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
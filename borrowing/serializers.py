@@ -1,7 +1,11 @@
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from .models import Borrowing
+from books.models import Book
 from books.serializers import BookSerializer
 from accounts.serializers import UserSerializer
+from src.sparse_fields import SparseFieldsMixin
 
 class BorrowingWriteSerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,18 +14,24 @@ class BorrowingWriteSerializer(serializers.ModelSerializer):
 
     def validate(self, attrs):
         book = attrs.get('book')
-        if book.inventory < 1:
+        if book.available_inventory < 1:
             raise serializers.ValidationError('Book not available.')
         return attrs
 
     def create(self, validated_data):
         book = validated_data['book']
-        book.inventory -= 1
-        book.save()
         validated_data['user'] = self.context['request'].user
-        return super().create(validated_data)
+        # The conditional decrement is the authoritative availability check;
+        # `validate` above only rejects the obvious cases early. It runs last so
+        # the lock on the hot book row is held only until commit.
+        with transaction.atomic():
+            borrowing = super().create(validated_data)
+            if not Book.objects.reserve(book):
+                raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Book not available.']})
+        book.inventory -= 1
+        return borrowing
 
-class BorrowingReadSerializer(serializers.ModelSerializer):
+class BorrowingReadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     book = BookSerializer(read_only=True)
     user = UserSerializer(read_only=True)
 
@@ -1,17 +1,42 @@
+from django.db import transaction
 from django.utils import timezone
 from django.conf import settings
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiResponse
 
+from accounts.authentication import ClaimsAuthReadMixin
+from books.models import Book
 from payment.models import Payment
+from src.fast_list import FastListMixin
+from src.export import EXPORT_FORMATS, IgnoreClientContentNegotiation, streaming_export
+from src.sparse_fields import SPARSE_FIELDS_PARAMETERS, SparseFieldsViewMixin
 from .models import Borrowing
+from .pagination import BorrowingPagination
 from .serializers import BorrowingWriteSerializer, BorrowingReadSerializer
 
-class BorrowingViewSet(viewsets.ModelViewSet):
+EXPORT_FIELDS = {
+    'id': 'id',
+    'user_id': 'user_id',
+    'user_email': 'user__email',
+    'book_id': 'book_id',
+    'book_title': 'book__title',
+    'borrow_date': 'borrow_date',
+    'expected_return_date': 'expected_return_date',
+    'actual_return_date': 'actual_return_date',
+}
+
+@extend_schema_view(
+    list=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
+    retrieve=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
+)
+class BorrowingViewSet(ClaimsAuthReadMixin, FastListMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Borrowing.objects.all()
     permission_classes = [IsAuthenticated]
+    pagination_class = BorrowingPagination
 
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve', 'return_book']:
@@ -20,13 +45,15 @@ class BorrowingViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         qs = super().get_queryset()
+        if self.action in ['list', 'retrieve', 'return_book']:
+            qs = self.with_related(qs)
         user = self.request.user
         is_staff = user.is_staff
         user_id = self.request.query_params.get('user_id')
         is_active = self.request.query_params.get('is_active')
 
         if not is_staff:
-            qs = qs.filter(user=user)
+            qs = qs.filter(user_id=user.pk)
         else:
             if user_id:
                 qs = qs.filter(user_id=user_id)
@@ -43,26 +70,46 @@ class BorrowingViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], url_path='return')
     def return_book(self, request, pk=None):
         borrowing = self.get_object()
+        already_returned = Response({'detail': 'Book already returned.'}, status=status.HTTP_400_BAD_REQUEST)
         if borrowing.actual_return_date:
-            return Response({'detail': 'Book already returned.'}, status=status.HTTP_400_BAD_REQUEST)
+            return already_returned
 
-        borrowing.actual_return_date = timezone.now().date()
-        borrowing.save()
+        today = timezone.now().date()
         book = borrowing.book
+        with transaction.atomic():
+            # Only one of several concurrent returns may flip the borrowing.
+            returned = Borrowing.objects.filter(
+                pk=borrowing.pk, actual_return_date__isnull=True
+            ).update(actual_return_date=today)
+            if not returned:
+                return already_returned
+            borrowing.actual_return_date = today
+
+            overdue_days = (borrowing.actual_return_date - borrowing.expected_return_date).days
+            if overdue_days > 0:
+                multiplier = getattr(settings, 'FINE_MULTIPLIER', 1)
+                fine_amount = overdue_days * float(book.daily_fee) * multiplier
+                Payment.objects.create(
+                    borrowing=borrowing,
+                    session_id='',
+                    session_url='',
+                    money_to_pay=fine_amount,
+                    type=Payment.TypeChoices.FINE,
+                    status=Payment.StatusChoices.PENDING,
+                )
+            Book.objects.release(book)
         book.inventory += 1
-        book.save()
 
-        overdue_days = (borrowing.actual_return_date - borrowing.expected_return_date).days
-        if overdue_days > 0:
-            multiplier = getattr(settings, 'FINE_MULTIPLIER', 1)
-            fine_amount = overdue_days * float(book.daily_fee) * multiplier
-            Payment.objects.create(
-                borrowing=borrowing,
-                session_id='',
-                session_url='',
-                money_to_pay=fine_amount,
-                type=Payment.TypeChoices.FINE,
-                status=Payment.StatusChoices.PENDING,
-            )
+        return Response(self.get_serializer(borrowing).data)
 
-        return Response(self.get_serializer(borrowing).data)
\ No newline at end of file
+    @extend_schema(
+        responses={(200, media_type): OpenApiResponse(OpenApiTypes.STR) for media_type in EXPORT_FORMATS.values()},
+    )
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path=r'export/(?P<export_format>ndjson|csv)',
+        content_negotiation_class=IgnoreClientContentNegotiation,
+    )
+    def export(self, request, export_format=None):
+        return streaming_export(self.get_queryset(), EXPORT_FIELDS, export_format, 'borrowings')
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('borrowing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueReminder',
+            fields=[
+                ('borrowing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='overdue_reminder', serialize=False, to='borrowing.borrowing')),
+                ('level', models.PositiveSmallIntegerField(help_text='Number of OVERDUE_REMINDER_DAYS steps already notified')),
+                ('last_notified_on', models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OverdueScan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scanned_through', models.DateField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0001_initial'),
+        ('notifications', '0002_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='overduereminder',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, help_text='When `level` was claimed; cleared once its reminder is delivered', null=True),
+        ),
+        migrations.AlterField(
+            model_name='overduereminder',
+            name='last_notified_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='overduereminder',
+            name='level',
+            field=models.PositiveSmallIntegerField(help_text='Number of OVERDUE_REMINDER_DAYS steps claimed for notification'),
+        ),
+        migrations.AddIndex(
+            model_name='overduereminder',
+            index=models.Index(condition=models.Q(('claimed_at__isnull', False)), fields=['claimed_at'], name='overdue_reminder_claimed_idx'),
+        ),
+    ]
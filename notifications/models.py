@@ -0,0 +1,80 @@
+from django.db import models
+from borrowing.models import Borrowing
+
+
+class OverdueReminder(models.Model):
+    borrowing = models.OneToOneField(
+        Borrowing,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='overdue_reminder'
+    )
+    level = models.PositiveSmallIntegerField(
+        help_text="Number of OVERDUE_REMINDER_DAYS steps claimed for notification"
+    )
+    claimed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When `level` was claimed; cleared once its reminder is delivered"
+    )
+    last_notified_on = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The overdue check re-sends claims that were never delivered.
+            models.Index(
+                fields=['claimed_at'],
+                condition=models.Q(claimed_at__isnull=False),
+                name='overdue_reminder_claimed_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Borrowing {self.borrowing_id}: level {self.level} on {self.last_notified_on}"
+
+
+class OverdueScan(models.Model):
+    """Single row: the day the overdue scan last ran through."""
+    scanned_through = models.DateField(null=True)
+
+    def __str__(self):
+        return f"Overdue scan through {self.scanned_through}"
+
+
+class OutboxEventManager(models.Manager):
+    def enqueue(self, kind, idempotency_key, **payload):
+        """
+        Record an event in the caller's transaction. An event whose key is
+        already in the outbox is dropped.
+        """
+        self.enqueue_many(kind, [(idempotency_key, payload)])
+
+    def enqueue_many(self, kind, events):
+        """`enqueue` for several (idempotency_key, payload) pairs in one INSERT."""
+        self.bulk_create(
+            [self.model(kind=kind, idempotency_key=key, payload=payload) for key, payload in events],
+            ignore_conflicts=True,
+        )
+
+
+class OutboxEvent(models.Model):
+    class KindChoices(models.TextChoices):
+        BORROWING_CREATED = 'borrowing_created', 'Borrowing created'
+        PAYMENT_PAID = 'payment_paid', 'Payment paid'
+
+    kind = models.CharField(max_length=32, choices=KindChoices.choices)
+    payload = models.JSONField()
+    idempotency_key = models.CharField(max_length=255, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    objects = OutboxEventManager()
+
+    class Meta:
+        indexes = [
+            # The dispatcher only ever reads the unpublished tail.
+            models.Index(fields=['id'], condition=models.Q(published_at__isnull=True), name='outbox_unpublished_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.idempotency_key}"
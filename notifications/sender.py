@@ -0,0 +1,205 @@
+import logging
+import os
+import queue
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import requests
+from django.conf import settings
+
+from .telegram import TelegramError, TelegramRateLimited, post_message, split_message, wait_for_chat_slot
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions a second on average, in bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class TelegramSender:
+    """
+    One per worker process: a pooled HTTP session plus a background thread
+    draining a queue of outgoing messages.
+
+    Messages queued within TELEGRAM_BATCH_LINGER seconds of each other are
+    coalesced per chat into as few sends as the length limit allows. Every
+    send takes a token from the process's bucket and the chat's shared slot.
+    A 429 is retried after the `retry_after` Telegram asks for, other
+    failures with jittered exponential backoff, up to TELEGRAM_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, rate=None, burst=None, linger=None, max_attempts=None, backoff=0.5):
+        rate = rate or settings.TELEGRAM_MESSAGES_PER_SECOND
+        self.session = requests.Session()
+        self.bucket = TokenBucket(rate, burst or rate)
+        self.linger = settings.TELEGRAM_BATCH_LINGER if linger is None else linger
+        self.max_attempts = max_attempts or settings.TELEGRAM_MAX_ATTEMPTS
+        self.backoff = backoff
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._counters = {'queued': 0, 'sent': 0, 'failed': 0, 'retries': 0, 'requests': 0}
+        self._thread = threading.Thread(target=self._run, name='telegram-sender', daemon=True)
+        self._thread.start()
+
+    def submit(self, text, chat_id):
+        """Queue `text`; the returned future resolves once it has been delivered."""
+        future = Future()
+        self._count('queued')
+        self._queue.put((chat_id, text, future))
+        return future
+
+    def send(self, text, chat_id):
+        """Send `text` now, on the calling thread. Errors are left to the caller."""
+        self._post(text, chat_id)
+        self._count('sent')
+
+    def close(self, timeout=None):
+        """Deliver what is queued, then stop the background thread."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def metrics(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self._counters)
+        counters['queue_depth'] = self._queue.qsize()
+        counters['send_latency_p50'] = statistics.median(latencies) if latencies else None
+        counters['send_latency_p99'] = latencies[int(len(latencies) * 0.99)] if latencies else None
+        return counters
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.linger
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self._send_batch(batch)
+            except Exception as e:
+                # A bug or an unexpected error (the cache behind the chat
+                # slots, say) fails this batch, not the thread.
+                logger.exception('Telegram sender failed a batch of %d messages', len(batch))
+                futures = [future for _, _, future in batch if not future.done()]
+                self._count('failed', len(futures))
+                for future in futures:
+                    future.set_exception(e)
+
+    def _send_batch(self, batch):
+        by_chat = {}
+        for chat_id, text, future in batch:
+            by_chat.setdefault(chat_id, []).append((text, future))
+
+        for chat_id, items in by_chat.items():
+            futures = [future for _, future in items]
+            try:
+                for text in split_message([text for text, _ in items], separator='\n\n'):
+                    self._deliver(text, chat_id)
+            except (TelegramError, requests.RequestException) as e:
+                logger.warning('Dropped %d Telegram messages for chat %s: %s', len(items), chat_id, e)
+                self._count('failed', len(items))
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            self._count('sent', len(items))
+            for future in futures:
+                future.set_result(None)
+        logger.info('Telegram sender: %s', self.metrics())
+
+    def _deliver(self, text, chat_id):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return self._post(text, chat_id)
+            except TelegramRateLimited as e:
+                if attempt == self.max_attempts:
+                    raise
+                delay = e.retry_after
+            except (TelegramError, requests.RequestException):
+                if attempt == self.max_attempts:
+                    raise
+                delay = self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            self._count('retries')
+            time.sleep(delay)
+
+    def _post(self, text, chat_id):
+        self.bucket.acquire()
+        wait_for_chat_slot(chat_id)
+        start = time.perf_counter()
+        try:
+            post_message(self.session, text, chat_id)
+        finally:
+            with self._lock:
+                self._counters['requests'] += 1
+                self._latencies.append(time.perf_counter() - start)
+
+
+_sender = None
+_sender_pid = None
+_sender_lock = threading.Lock()
+
+
+def get_sender():
+    """
+    The current process's sender, created on first use, and again after a
+    fork or if its thread has died.
+    """
+    global _sender, _sender_pid
+    with _sender_lock:
+        if _sender is None or _sender_pid != os.getpid() or not _sender._thread.is_alive():
+            _sender = TelegramSender()
+            _sender_pid = os.getpid()
+        return _sender
+
+
+def shutdown_sender(timeout=None):
+    global _sender
+    with _sender_lock:
+        if _sender is not None and _sender_pid == os.getpid():
+            _sender.close(timeout)
+        _sender = None
+
+
+def send_message(text: str, chat_id=None) -> None:
+    get_sender().send(text, chat_id or settings.TELEGRAM_ADMIN_CHAT_ID)
+
+
+def queue_message(text: str, chat_id=None) -> Future:
+    return get_sender().submit(text, chat_id or settings.TELEGRAM_ADMIN_CHAT_ID)
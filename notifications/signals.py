@@ -2,15 +2,34 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from borrowing.models import Borrowing
 from payment.models import Payment
-from .tasks import notify_new_borrowing, notify_payment_success
+from payment.signals import payments_paid
+from .models import OutboxEvent
 
+# Handlers only write an outbox row in the saving transaction; the
+# `dispatch_outbox` task publishes it once that transaction has committed.
 
 @receiver(post_save, sender=Borrowing)
 def borrowing_created(sender, instance, created, **kwargs) -> None:
     if created:
-        notify_new_borrowing.delay(instance.id)
+        OutboxEvent.objects.enqueue(
+            OutboxEvent.KindChoices.BORROWING_CREATED,
+            f'borrowing-created:{instance.id}',
+            borrowing_id=instance.id,
+        )
 
 @receiver(post_save, sender=Payment)
 def payment_updated(sender, instance, **kwargs) -> None:
+    # Later saves of a paid payment hit the same key and are dropped.
     if instance.status == instance.StatusChoices.PAID:
-        notify_payment_success.delay(instance.id)
+        OutboxEvent.objects.enqueue(
+            OutboxEvent.KindChoices.PAYMENT_PAID,
+            f'payment-paid:{instance.id}',
+            payment_id=instance.id,
+        )
+
+@receiver(payments_paid)
+def payments_marked_paid(sender, payment_ids, **kwargs) -> None:
+    OutboxEvent.objects.enqueue_many(
+        OutboxEvent.KindChoices.PAYMENT_PAID,
+        [(f'payment-paid:{payment_id}', {'payment_id': payment_id}) for payment_id in payment_ids],
+    )
@@ -1,37 +1,208 @@
+from collections import defaultdict
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import timedelta
+from itertools import islice
+
+import requests
 from celery import shared_task
+from celery.signals import worker_process_shutdown
+from kombu.exceptions import OperationalError
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
-from .telegram import send_message
+from .sender import queue_message, send_message, shutdown_sender
+from .telegram import TelegramError, TelegramRateLimited, split_message
 from borrowing.models import Borrowing
 from payment.models import Payment
+from src.db_routing import replica_reads
+from .models import OutboxEvent, OverdueReminder, OverdueScan
 
-@shared_task
-def notify_new_borrowing(borrowing_id: int) -> None:
+@worker_process_shutdown.connect
+def _flush_telegram_queue(**kwargs) -> None:
+    shutdown_sender(timeout=settings.TELEGRAM_TIMEOUT)
+
+def _deliver(task, text: str) -> None:
+    """
+    Wait until the sender has delivered `text`. A failure retries the task,
+    and the tasks ack late, so a notification the outbox handed over isn't
+    dropped by a failed send or a lost worker.
+    """
+    try:
+        queue_message(text).result(timeout=settings.TELEGRAM_DELIVERY_TIMEOUT)
+    except (TelegramError, requests.RequestException, FutureTimeoutError) as e:
+        raise task.retry(exc=e, countdown=2 ** task.request.retries)
+
+@shared_task(bind=True, acks_late=True, max_retries=5)
+def notify_new_borrowing(self, borrowing_id: int) -> None:
     b = Borrowing.objects.select_related('user', 'book').get(id=borrowing_id)
     text = (f"New borrowing created:\n"
             f"User: {b.user.email}\n"
             f"Book: {b.book.title}\n"
             f"Due: {b.expected_return_date}")
-    send_message(text)
+    _deliver(self, text)
 
-@shared_task
-def notify_payment_success(payment_id: int) -> None:
+@shared_task(bind=True, acks_late=True, max_retries=5)
+def notify_payment_success(self, payment_id: int) -> None:
     p = Payment.objects.select_related('borrowing__user', 'borrowing__book').get(id=payment_id)
     text = (f"Payment successful:\n"
             f"User: {p.borrowing.user.email}\n"
             f"Book: {p.borrowing.book.title}\n"
             f"Amount: ${p.money_to_pay}")
-    send_message(text)
+    _deliver(self, text)
+
+def _crossed_steps(scanned_through, today):
+    """Open loans that reached a reminder step after `scanned_through`."""
+    windows = Q()
+    for days in settings.OVERDUE_REMINDER_DAYS:
+        window = Q(expected_return_date__lte=today - timedelta(days=days))
+        if scanned_through is not None:
+            window &= Q(expected_return_date__gt=scanned_through - timedelta(days=days))
+        windows |= window
+    return Borrowing.objects.filter(windows, actual_return_date__isnull=True)
+
+def _queue_overdue_chunks(ids):
+    while chunk := list(islice(ids, settings.OVERDUE_CHUNK_SIZE)):
+        notify_overdue_chunk.delay(chunk)
 
 @shared_task
 def check_overdue_borrowings() -> None:
+    # Each reminder step is a sliding window over `expected_return_date`;
+    # only loans that entered a window since the last run are read, as ids,
+    # through a server-side cursor. Later runs on the same day find nothing
+    # new, so the task can be scheduled as often as needed.
+    today = timezone.now().date()
+    # Claims whose digest never went out are sent again, whatever the day;
+    # the chunk releases those of loans returned in the meantime.
+    stale = timezone.now() - timedelta(seconds=settings.OVERDUE_CLAIM_TIMEOUT)
+    _queue_overdue_chunks(
+        OverdueReminder.objects.filter(claimed_at__lt=stale).values_list('pk', flat=True).iterator(
+            chunk_size=settings.OVERDUE_CHUNK_SIZE
+        )
+    )
+    with transaction.atomic():
+        scan, _ = OverdueScan.objects.select_for_update().get_or_create(pk=1)
+        if scan.scanned_through == today:
+            return
+        # Ids only; each chunk re-reads its loans from the primary under lock,
+        # so a lagging replica can't cause a wrong reminder.
+        with replica_reads():
+            _queue_overdue_chunks(_crossed_steps(scan.scanned_through, today).values_list('id', flat=True).iterator(
+                chunk_size=settings.OVERDUE_CHUNK_SIZE
+            ))
+        scan.scanned_through = today
+        scan.save(update_fields=['scanned_through'])
+
+def _claim_reminders(borrowing_ids, today):
+    """
+    Raise each still-overdue borrowing to the reminder level it has reached
+    and return (id, level) for those that went up, or whose earlier claim
+    was never delivered within OVERDUE_CLAIM_TIMEOUT. Claiming before
+    sending means two chunks holding the same ids never both notify them.
+    Undelivered claims of loans that are no longer overdue are released.
+    """
+    steps = settings.OVERDUE_REMINDER_DAYS
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.OVERDUE_CLAIM_TIMEOUT)
+    with transaction.atomic():
+        rows = (Borrowing.objects.select_for_update(of=('self',))
+                .filter(id__in=borrowing_ids, actual_return_date__isnull=True, expected_return_date__lt=today)
+                .values_list('id', 'expected_return_date', 'overdue_reminder__level',
+                             'overdue_reminder__claimed_at'))
+        reminders = []
+        for borrowing_id, due, level, claimed_at in rows:
+            reached = max(sum(1 for days in steps if (today - due).days >= days), level or 0)
+            if reached > (level or 0) or (claimed_at is not None and claimed_at < stale):
+                reminders.append(OverdueReminder(borrowing_id=borrowing_id, level=reached, claimed_at=now))
+        OverdueReminder.objects.bulk_create(
+            reminders,
+            update_conflicts=True,
+            unique_fields=['borrowing'],
+            update_fields=['level', 'claimed_at'],
+        )
+        still_overdue = [borrowing_id for borrowing_id, *_ in rows]
+        (OverdueReminder.objects.filter(borrowing_id__in=borrowing_ids, claimed_at__lt=stale)
+         .exclude(borrowing_id__in=still_overdue).update(claimed_at=None))
+    return [(r.borrowing_id, r.level) for r in reminders]
+
+def _mark_delivered(claims, today):
+    """Clear the claims a delivered digest covered, unless they were claimed again at a higher level."""
+    by_level = defaultdict(list)
+    for borrowing_id, level in claims:
+        by_level[level].append(borrowing_id)
+    for level, borrowing_ids in by_level.items():
+        OverdueReminder.objects.filter(borrowing_id__in=borrowing_ids, level=level).update(
+            claimed_at=None, last_notified_on=today
+        )
+
+@shared_task
+def notify_overdue_chunk(borrowing_ids: list[int]) -> None:
+    """Claim the borrowings of a chunk that escalated and queue one digest for them."""
     today = timezone.now().date()
-    overdue = Borrowing.objects.filter(
-        actual_return_date__isnull=True,
-        expected_return_date__lt=today
-    ).select_related('user', 'book')
-    for b in overdue:
-        text = (f"Overdue borrowing detected:\n"
-                f"User: {b.user.email}\n"
-                f"Book: {b.book.title}\n"
-                f"Due since: {b.expected_return_date}")
-        send_message(text)
\ No newline at end of file
+    claims = _claim_reminders(borrowing_ids, today)
+    if not claims:
+        return
+    rows = (Borrowing.objects.filter(id__in=[borrowing_id for borrowing_id, _ in claims])
+            .order_by('expected_return_date', 'id')
+            .values_list('user__email', 'book__title', 'expected_return_date'))
+    lines = [f"- {email}: {title} (due {due}, {(today - due).days} days overdue)" for email, title, due in rows]
+    send_overdue_digest.delay(split_message(lines, header=f"Overdue borrowings ({len(lines)}):"), claims)
+
+@shared_task(bind=True, max_retries=5)
+def send_overdue_digest(self, messages: list[str], claims: list, sent_parts: int = 0) -> None:
+    """
+    Send a rendered digest, then mark its claims delivered. Retries carry
+    the same text and resume after the parts already sent. If every retry
+    fails, the claims stay open and the overdue check sends them again.
+    """
+    for part, text in enumerate(messages[sent_parts:], start=sent_parts):
+        try:
+            send_message(text)
+        except TelegramRateLimited as e:
+            raise self.retry(exc=e, countdown=e.retry_after, args=(messages, claims, part))
+        except (TelegramError, requests.RequestException) as e:
+            raise self.retry(exc=e, countdown=2 ** self.request.retries, args=(messages, claims, part))
+    _mark_delivered(claims, timezone.now().date())
+
+_OUTBOX_HANDLERS = {
+    OutboxEvent.KindChoices.BORROWING_CREATED: notify_new_borrowing,
+    OutboxEvent.KindChoices.PAYMENT_PAID: notify_payment_success,
+}
+
+@shared_task
+def dispatch_outbox() -> int:
+    """
+    Publish committed outbox events in id order, OUTBOX_BATCH_SIZE at a time.
+    Rows are claimed with SKIP LOCKED so overlapping runs split the backlog.
+    If the broker fails, the events already sent are still marked and the
+    rest wait for the next run.
+    """
+    published = 0
+    while True:
+        error = None
+        with transaction.atomic():
+            batch = list(
+                OutboxEvent.objects.select_for_update(skip_locked=True)
+                .filter(published_at__isnull=True)
+                .order_by('id')[:settings.OUTBOX_BATCH_SIZE]
+            )
+            sent = []
+            for event in batch:
+                try:
+                    _OUTBOX_HANDLERS[event.kind].apply_async(kwargs=event.payload)
+                except OperationalError as e:
+                    error = e
+                    break
+                sent.append(event.pk)
+            OutboxEvent.objects.filter(pk__in=sent).update(published_at=timezone.now())
+        published += len(sent)
+        if error is not None:
+            raise error
+        if len(batch) < settings.OUTBOX_BATCH_SIZE:
+            return published
+
+@shared_task
+def purge_outbox() -> None:
+    # Published rows are kept for a while so late duplicates still hit their key.
+    cutoff = timezone.now() - timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+    OutboxEvent.objects.filter(published_at__lt=cutoff).delete()
@@ -1,8 +1,61 @@
-import os
-from telegram import Bot
+import time
 
-bot = Bot(token=os.environ['TELEGRAM_BOT_TOKEN'])
-ADMIN_CHAT_ID = int(os.environ['TELEGRAM_ADMIN_CHAT_ID'])
+from django.conf import settings
+from django.core.cache import cache
 
-def send_message(text: str) -> None:
-    bot.send_message(chat_id=ADMIN_CHAT_ID, text=text)
+# Telegram rejects longer messages.
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TelegramError(Exception):
+    pass
+
+
+class TelegramRateLimited(TelegramError):
+    def __init__(self, retry_after):
+        super().__init__(f'Rate limited by Telegram, retry after {retry_after}s.')
+        self.retry_after = retry_after
+
+
+def wait_for_chat_slot(chat_id):
+    # Spaces messages to one chat TELEGRAM_MESSAGES_PER_MINUTE apart across
+    # every worker: each send claims the current time slot in the shared
+    # cache, and whoever loses waits for the next one.
+    interval = 60 / settings.TELEGRAM_MESSAGES_PER_MINUTE
+    while True:
+        now = time.time()
+        slot = int(now // interval)
+        if cache.add(f'telegram:slot:{chat_id}:{slot}', 1, timeout=int(interval) + 1):
+            return
+        time.sleep((slot + 1) * interval - now)
+
+
+def post_message(session, text, chat_id):
+    """Call the Bot API's sendMessage once over `session`."""
+    response = session.post(
+        f'{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage',
+        json={'chat_id': chat_id, 'text': text},
+        timeout=settings.TELEGRAM_TIMEOUT,
+    )
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    if response.status_code == 429:
+        raise TelegramRateLimited(body.get('parameters', {}).get('retry_after', 1))
+    if not body.get('ok'):
+        raise TelegramError(body.get('description') or f'HTTP {response.status_code}')
+
+
+def split_message(lines, header='', separator='\n'):
+    """Join `lines` into as few messages as fit Telegram's length limit."""
+    messages, current = [], header
+    for line in lines:
+        line = line[:MAX_MESSAGE_LENGTH - len(header) - len(separator)]
+        if len(current) + len(line) + len(separator) > MAX_MESSAGE_LENGTH:
+            messages.append(current)
+            current = header
+        current = f'{current}{separator}{line}' if current else line
+    if current and current != header:
+        messages.append(current)
+    return messages
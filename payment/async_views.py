@@ -0,0 +1,187 @@
+"""
+Async versions of the checkout and cancel endpoints, for running under ASGI
+(`src/asgi.py`). They answer like the DRF views in `views.py`, but wait on
+Stripe and the database without holding a worker thread, and the cancel
+view overlaps the Stripe calls that don't depend on each other.
+
+DRF views can't be awaited, so these are plain Django views that do the
+JWT authentication and serializer validation themselves.
+"""
+import asyncio
+import json
+import weakref
+
+import stripe
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from accounts.authentication import CachedJWTAuthentication
+from borrowing.models import Borrowing
+from .gateway import StripeUnavailable, get_gateway
+from .models import Payment
+from .serializers import CheckoutSerializer, CancelSerializer
+from .views import (
+    cancel_checkout, checkout_payment, checkout_response, checkout_session_params, idempotency_key, replayed_payment,
+)
+
+
+def _error(exc):
+    detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return JsonResponse(detail, status=exc.status_code, safe=False)
+
+
+def stripe_unavailable():
+    return JsonResponse({'detail': 'Payment provider is unavailable, try again later.'}, status=503)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAPIView(View):
+    http_method_names = ['post', 'options']
+    serializer_class = None
+    authenticated = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        if self.authenticated:
+            authenticator = CachedJWTAuthentication()
+            try:
+                user_auth = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException as e:
+                response = _error(e)
+                response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+                return response
+            if user_auth is None:
+                response = _error(exceptions.NotAuthenticated())
+                response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+                return response
+            request.user, request.auth = user_auth
+
+        if request.method == 'POST':
+            try:
+                data = json.loads(request.body or b'{}')
+            except ValueError as e:
+                return _error(exceptions.ParseError(f'JSON parse error - {e}'))
+            serializer = self.serializer_class(data=data)
+            if not serializer.is_valid():
+                return JsonResponse(serializer.errors, status=400)
+            kwargs['data'] = serializer.validated_data
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as e:
+            return _error(e)
+
+
+_in_flight = weakref.WeakKeyDictionary()
+
+
+async def _single_flight(key, make):
+    """
+    Await `make()`, unless a call for `key` is already running on this event
+    loop: then wait for that one and share its result.
+    """
+    calls = _in_flight.setdefault(asyncio.get_running_loop(), {})
+    task = calls.get(key)
+    if task is None:
+        task = calls[key] = asyncio.ensure_future(make())
+        task.add_done_callback(lambda _: calls.pop(key, None))
+    return await asyncio.shield(task)
+
+
+class AsyncCreateCheckoutSessionView(AsyncAPIView):
+    """
+    Reuses sessions like `CreateCheckoutSessionView`. Duplicate requests are
+    collapsed within the process instead of through the sync view's cache
+    claim, whose polling would block the event loop.
+    """
+    serializer_class = CheckoutSerializer
+
+    async def post(self, request, data):
+        key = idempotency_key(request)
+        try:
+            borrowing = await Borrowing.objects.select_related('book').aget(
+                id=data['borrowing_id'], user=request.user
+            )
+        except Borrowing.DoesNotExist:
+            return JsonResponse({'detail': 'Borrowing not found.'}, status=404)
+
+        amount, params = await sync_to_async(checkout_session_params)(request, borrowing, key)
+
+        async def existing():
+            return (
+                replayed_payment(key and await Payment.objects.filter(idempotency_key=key).afirst(), borrowing)
+                or await Payment.objects.live_checkouts(borrowing, amount).afirst()
+            )
+
+        async def create():
+            # Looked up again: an identical request may have just finished.
+            if payment := await existing():
+                return payment
+            session = await get_gateway().create_checkout_session_async(
+                idempotency_key=key and f'checkout:{key}', **params
+            )
+            payment = checkout_payment(borrowing, amount, params, session, key)
+            try:
+                await payment.asave()
+            except IntegrityError:
+                # Another process saved the same Idempotency-Key (and Stripe
+                # replayed the same session to both of us).
+                return await Payment.objects.aget(idempotency_key=key)
+            return payment
+
+        payment = await existing()
+        if payment is None:
+            try:
+                payment = await _single_flight((borrowing.id, amount), create)
+            except StripeUnavailable:
+                return stripe_unavailable()
+            except stripe.error.StripeError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse(checkout_response(payment))
+
+
+class AsyncStripeCancelView(AsyncAPIView):
+    """
+    Expires the session and, if it was already paid, refunds it. The expiry
+    and the session lookup go out together; the refund names the payment
+    intent, which saves looking up its charge first.
+    """
+    serializer_class = CancelSerializer
+    authenticated = False
+
+    async def post(self, request, data):
+        payment = await Payment.objects.filter(id=data['payment_id']).afirst()
+        if payment is None:
+            return JsonResponse({'detail': 'Payment not found.'}, status=404)
+
+        gateway = get_gateway()
+        expired, session = await asyncio.gather(
+            gateway.expire_checkout_session_async(payment.session_id),
+            gateway.retrieve_checkout_session_async(payment.session_id),
+            return_exceptions=True,
+        )
+        for result in (expired, session):
+            if isinstance(result, StripeUnavailable):
+                return stripe_unavailable()
+            if isinstance(result, Exception) and not isinstance(result, stripe.error.StripeError):
+                raise result
+        if isinstance(session, stripe.error.StripeError):
+            return JsonResponse({'error': str(session)}, status=400)
+
+        refunded = isinstance(expired, stripe.error.StripeError) and bool(session.payment_intent)
+        if refunded:
+            try:
+                await gateway.create_refund_async(payment_intent=session.payment_intent)
+            except StripeUnavailable:
+                return stripe_unavailable()
+            except stripe.error.StripeError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            detail = 'Payment refunded and cancelled.'
+        else:
+            # Either this call expired it or it had expired unpaid: nothing to refund.
+            detail = 'Checkout session cancelled.'
+
+        await sync_to_async(cancel_checkout)(payment, refunded)
+        return JsonResponse({'detail': detail})
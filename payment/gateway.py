@@ -0,0 +1,325 @@
+"""
+All calls to Stripe go through `get_gateway()`.
+
+Each worker process has one `StripeGateway`: a `StripeClient` over a pooled
+keep-alive HTTP session. Every call has a deadline (STRIPE_DEADLINE) that
+caps its attempts' timeouts, transient failures are retried with jittered
+backoff while the deadline allows, and a circuit breaker stops calling
+Stripe for a while after repeated failures, so a Stripe outage fails
+requests fast instead of holding workers.
+
+The `*_async` methods do the same over Stripe's async (httpx) client, one
+per event loop, for the async views.
+"""
+import asyncio
+import logging
+import os
+import random
+import statistics
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+
+import httpx
+import requests
+import stripe
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class StripeUnavailable(stripe.error.StripeError):
+    """Stripe is failing or too slow; the call was given up (or not made)."""
+
+
+class _DeadlineHTTPClient(stripe.RequestsClient):
+    # stripe-python reads `_timeout` for every request; cutting it to what is
+    # left of the calling thread's deadline keeps one call within its budget.
+
+    @property
+    def _timeout(self):
+        connect, read = self._timeouts
+        deadline = getattr(_local, 'deadline', None)
+        if deadline is None:
+            return connect, read
+        remaining = max(deadline - time.monotonic(), 0.001)
+        return min(connect, remaining), min(read, remaining)
+
+    @_timeout.setter
+    def _timeout(self, value):
+        self._timeouts = value
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` failures in a row. While open, `allow()` refuses
+    calls; after `reset` seconds one trial call is let through, and its
+    outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failures, reset):
+        self.failures = failures
+        self.reset = reset
+        self.failed = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.reset else 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failed = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failed += 1
+            if self.trial or self.failed >= self.failures:
+                if self.opened_at is None or self.trial:
+                    logger.warning('Stripe circuit opened after %d failures', self.failed)
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+    def abandon(self):
+        """Let another call be the trial; this one ended without an outcome."""
+        with self._lock:
+            self.trial = False
+
+
+def _is_transient(error):
+    if isinstance(error, (stripe.error.APIConnectionError, stripe.error.RateLimitError)):
+        return True
+    return (error.http_status or 0) >= 500
+
+
+class StripeGateway:
+    def __init__(self, api_key=None, api_url=None, connect_timeout=None, read_timeout=None, deadline=None,
+                 max_attempts=None, pool_size=None, breaker_failures=None, breaker_reset=None, backoff=0.2):
+        self.api_key = api_key or settings.STRIPE_SECRET_KEY
+        if not self.api_key:
+            raise ImproperlyConfigured("STRIPE_SECRET_KEY must be set in environment.")
+        self.api_url = api_url or settings.STRIPE_API_URL
+        self.timeouts = (
+            connect_timeout or settings.STRIPE_CONNECT_TIMEOUT,
+            read_timeout or settings.STRIPE_READ_TIMEOUT,
+        )
+        pool_size = pool_size or settings.STRIPE_POOL_SIZE
+
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        self.client = self._stripe_client(_DeadlineHTTPClient(timeout=self.timeouts, session=session))
+        # httpx connections belong to the event loop that opened them.
+        self._async_clients = weakref.WeakKeyDictionary()
+        self.deadline = deadline or settings.STRIPE_DEADLINE
+        self.max_attempts = max_attempts or settings.STRIPE_MAX_ATTEMPTS
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(
+            breaker_failures or settings.STRIPE_BREAKER_FAILURES,
+            settings.STRIPE_BREAKER_RESET if breaker_reset is None else breaker_reset,
+        )
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._counters = {'calls': 0, 'requests': 0, 'retries': 0, 'failed': 0, 'rejected': 0}
+
+    def _stripe_client(self, http_client):
+        return stripe.StripeClient(
+            self.api_key,
+            http_client=http_client,
+            base_addresses={'api': self.api_url} if self.api_url else {},
+            # Retries are ours, so they respect the deadline and the breaker.
+            max_network_retries=0,
+        )
+
+    @property
+    def async_client(self):
+        """The StripeClient for the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            connect, read = self.timeouts
+            client = self._stripe_client(stripe.HTTPXClient(timeout=httpx.Timeout(read, connect=connect)))
+            self._async_clients[loop] = client
+        return client
+
+    def create_checkout_session(self, idempotency_key=None, **params):
+        return self._call('checkout.sessions.create', self.client.checkout.sessions.create, params,
+                          idempotent=True, idempotency_key=idempotency_key)
+
+    def retrieve_checkout_session(self, session_id):
+        return self._call('checkout.sessions.retrieve', self.client.checkout.sessions.retrieve, session_id)
+
+    def list_checkout_sessions(self, **params):
+        return self._call('checkout.sessions.list', self.client.checkout.sessions.list, params)
+
+    def expire_checkout_session(self, session_id):
+        return self._call('checkout.sessions.expire', self.client.checkout.sessions.expire, session_id,
+                          idempotent=True)
+
+    def retrieve_payment_intent(self, intent_id):
+        return self._call('payment_intents.retrieve', self.client.payment_intents.retrieve, intent_id)
+
+    def create_refund(self, **params):
+        return self._call('refunds.create', self.client.refunds.create, params, idempotent=True)
+
+    async def create_checkout_session_async(self, idempotency_key=None, **params):
+        return await self._call_async('checkout.sessions.create', self.async_client.checkout.sessions.create_async,
+                                      params, idempotent=True, idempotency_key=idempotency_key)
+
+    async def retrieve_checkout_session_async(self, session_id):
+        return await self._call_async('checkout.sessions.retrieve',
+                                      self.async_client.checkout.sessions.retrieve_async, session_id)
+
+    async def expire_checkout_session_async(self, session_id):
+        return await self._call_async('checkout.sessions.expire', self.async_client.checkout.sessions.expire_async,
+                                      session_id, idempotent=True)
+
+    async def retrieve_payment_intent_async(self, intent_id):
+        return await self._call_async('payment_intents.retrieve', self.async_client.payment_intents.retrieve_async,
+                                      intent_id)
+
+    async def create_refund_async(self, **params):
+        return await self._call_async('refunds.create', self.async_client.refunds.create_async, params,
+                                      idempotent=True)
+
+    def metrics(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self._counters)
+        counters['circuit'] = self.breaker.state
+        counters['latency_p50'] = statistics.median(latencies) if latencies else None
+        counters['latency_p99'] = latencies[int(len(latencies) * 0.99)] if latencies else None
+        return counters
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _call(self, operation, method, *args, idempotent=False, idempotency_key=None):
+        """
+        Call `method(*args)` with retries. POSTs are sent with one
+        idempotency key for all attempts (`idempotency_key`, or a new one),
+        so a retry can't act twice.
+        """
+        options = {'idempotency_key': idempotency_key or str(uuid.uuid4())} if idempotent else {}
+        deadline = time.monotonic() + self.deadline
+        self._count('calls')
+        for attempt in range(1, self.max_attempts + 1):
+            self._check_breaker()
+            _local.deadline = deadline
+            start = time.perf_counter()
+            try:
+                result = method(*args, options=options)
+            except stripe.error.StripeError as e:
+                delay = self._failed(operation, attempt, e, deadline)
+            except BaseException:
+                self.breaker.abandon()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                _local.deadline = None
+                self._record(operation, attempt, start)
+            self._count('retries')
+            time.sleep(delay)
+
+    async def _call_async(self, operation, method, *args, idempotent=False, idempotency_key=None):
+        """`_call` for the async client; the deadline is enforced by cancelling the attempt."""
+        options = {'idempotency_key': idempotency_key or str(uuid.uuid4())} if idempotent else {}
+        deadline = time.monotonic() + self.deadline
+        self._count('calls')
+        for attempt in range(1, self.max_attempts + 1):
+            self._check_breaker()
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(
+                    method(*args, options=options), max(deadline - time.monotonic(), 0.001)
+                )
+            except asyncio.TimeoutError:
+                error = stripe.error.APIConnectionError('Request to Stripe timed out.')
+                delay = self._failed(operation, attempt, error, deadline)
+            except stripe.error.StripeError as e:
+                delay = self._failed(operation, attempt, e, deadline)
+            except BaseException:
+                # Cancelled, e.g. by a client disconnect: nothing is known
+                # about Stripe, but a trial call must not hold the circuit.
+                self.breaker.abandon()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                self._record(operation, attempt, start)
+            self._count('retries')
+            await asyncio.sleep(delay)
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise StripeUnavailable('Stripe is unavailable; not calling it for now.')
+
+    def _failed(self, operation, attempt, error, deadline):
+        """Re-raise `error` unless it's worth retrying; returns the delay before the retry."""
+        if not _is_transient(error):
+            # Stripe answered; the request itself was wrong.
+            self.breaker.record_success()
+            raise error
+        self.breaker.record_failure()
+        delay = self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+        if attempt == self.max_attempts or time.monotonic() + delay >= deadline:
+            self._count('failed')
+            logger.warning('Stripe %s failed after %d attempts: %s', operation, attempt, error)
+            raise StripeUnavailable(f'Stripe {operation} failed: {error.user_message or error}') from error
+        return delay
+
+    def _record(self, operation, attempt, start):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._counters['requests'] += 1
+            self._latencies.append(elapsed)
+        logger.debug('Stripe %s attempt %d took %.3fs', operation, attempt, elapsed)
+
+
+_gateway = None
+_gateway_pid = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """The current process's gateway, created on first use (and again after a fork)."""
+    global _gateway, _gateway_pid
+    with _gateway_lock:
+        if _gateway is None or _gateway_pid != os.getpid():
+            _gateway = StripeGateway()
+            _gateway_pid = os.getpid()
+        return _gateway
+
+
+def reset_gateway():
+    """Drop the process's gateway so the next call builds one from current settings."""
+    global _gateway
+    with _gateway_lock:
+        _gateway = None
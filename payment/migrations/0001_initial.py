@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('borrowing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PAID', 'Paid'), ('CANCELLED', 'Cancelled')], default='PENDING', max_length=10)),
+                ('type', models.CharField(choices=[('PAYMENT', 'Payment'), ('FINE', 'Fine')], max_length=10)),
+                ('session_url', models.URLField(help_text='URL for Stripe payment session')),
+                ('session_id', models.CharField(help_text='ID session Stripe', max_length=255)),
+                ('money_to_pay', models.DecimalField(decimal_places=2, help_text='Sum to pay in $USD', max_digits=10)),
+                ('borrowing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='borrowing.borrowing')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['session_id'], name='payment_session_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0001_initial'),
+        ('payment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.CharField(help_text='Stripe event id (evt_...)', max_length=255, primary_key=True, serialize=False)),
+                ('type', models.CharField(max_length=100)),
+                ('payload', models.JSONField()),
+                ('created', models.DateTimeField(help_text='When Stripe created the event')),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='payment_intent_id',
+            field=models.CharField(blank=True, default='', help_text='Stripe PaymentIntent of the completed session', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('payment_intent_id', ''), _negated=True), fields=['payment_intent_id'], name='payment_intent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stripeevent',
+            index=models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['created', 'id'], name='stripe_event_unprocessed_idx'),
+        ),
+    ]
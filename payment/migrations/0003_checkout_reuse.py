@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0001_initial'),
+        ('payment', '0002_stripe_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='idempotency_key',
+            field=models.CharField(blank=True, default='', help_text='Idempotency-Key of the request that created the session, prefixed with the user id', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='session_expires_at',
+            field=models.DateTimeField(blank=True, help_text='When the Stripe session stops accepting payment', null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key', ''), _negated=True), fields=('idempotency_key',), name='payment_idempotency_key_unique'),
+        ),
+    ]
@@ -1,8 +1,30 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from borrowing.models import Borrowing
 
 
+class PaymentManager(models.Manager):
+    def live_checkouts(self, borrowing, amount):
+        """
+        PENDING payments of `amount` for `borrowing` whose Checkout Session
+        stays open for at least STRIPE_SESSION_REUSE_MARGIN more seconds.
+        """
+        cutoff = timezone.now() + timedelta(seconds=settings.STRIPE_SESSION_REUSE_MARGIN)
+        return self.filter(
+            borrowing=borrowing,
+            type=Payment.TypeChoices.PAYMENT,
+            status=Payment.StatusChoices.PENDING,
+            money_to_pay=amount,
+            session_expires_at__gt=cutoff,
+        ).order_by('-session_expires_at')
+
+
 class Payment(models.Model):
+    SESSION_EXPIRED_FIELDS = ['status', 'session_id', 'session_url', 'session_expires_at']
+
     class StatusChoices(models.TextChoices):
         PENDING = 'PENDING', 'Pending'
         PAID = 'PAID', 'Paid'
@@ -29,6 +51,77 @@ class Payment(models.Model):
     session_url = models.URLField(help_text="URL for Stripe payment session")
     session_id = models.CharField(max_length=255, help_text="ID session Stripe")
     money_to_pay = models.DecimalField(max_digits=10, decimal_places=2, help_text="Sum to pay in $USD")
+    payment_intent_id = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        help_text="Stripe PaymentIntent of the completed session"
+    )
+    session_expires_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the Stripe session stops accepting payment"
+    )
+    idempotency_key = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        help_text="Idempotency-Key of the request that created the session, prefixed with the user id"
+    )
+
+    objects = PaymentManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['idempotency_key'],
+                condition=~models.Q(idempotency_key=''),
+                name='payment_idempotency_key_unique',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['session_id'], name='payment_session_id_idx'),
+            models.Index(
+                fields=['payment_intent_id'],
+                condition=~models.Q(payment_intent_id=''),
+                name='payment_intent_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Payment {self.id} for borrowing {self.borrowing.id} (status: {self.status})"
+
+    def session_expired(self):
+        """
+        Its Checkout Session expired unpaid. A payment is cancelled with it;
+        a fine is still owed, so it only lets go of the session and waits
+        for the next fines checkout. Changes SESSION_EXPIRED_FIELDS.
+        """
+        if self.type == self.TypeChoices.FINE:
+            self.session_id = ''
+            self.session_url = ''
+            self.session_expires_at = None
+        else:
+            self.status = self.StatusChoices.CANCELLED
+
+
+class StripeEvent(models.Model):
+    """A verified Stripe webhook event, stored as received and applied later."""
+    id = models.CharField(max_length=255, primary_key=True, help_text="Stripe event id (evt_...)")
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    created = models.DateTimeField(help_text="When Stripe created the event")
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['created', 'id'],
+                condition=models.Q(processed_at__isnull=True),
+                name='stripe_event_unprocessed_idx',
+            ),
+        ]
 
     def __str__(self):
-        return f"Payment {self.id} for borrowing {self.borrowing.id} (status: {self.status})"
\ No newline at end of file
+        return f"{self.type} {self.id}"
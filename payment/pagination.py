@@ -0,0 +1,5 @@
+from src.pagination import KeysetPagination
+
+
+class PaymentPagination(KeysetPagination):
+    ordering = ('-id',)
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Payment
 from borrowing.serializers import BorrowingReadSerializer
+from src.sparse_fields import SparseFieldsMixin
 
 class CheckoutSerializer(serializers.Serializer):
     borrowing_id = serializers.IntegerField()
@@ -11,7 +12,7 @@ class CancelSerializer(serializers.Serializer):
 class SessionIdSerializer(serializers.Serializer):
     session_id = serializers.CharField()
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     borrowing = BorrowingReadSerializer(read_only=True)
 
     class Meta:
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent with `payment_ids` after payments were marked PAID in bulk, inside the
+# updating transaction. Bulk updates skip `post_save`.
+payments_paid = Signal()
@@ -0,0 +1,201 @@
+import logging
+import time
+
+import stripe
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .gateway import StripeUnavailable, get_gateway
+from .models import Payment, StripeEvent
+from .signals import payments_paid
+
+SESSION_PAID_EVENTS = ('checkout.session.completed', 'checkout.session.async_payment_succeeded')
+SESSION_EXPIRED_EVENTS = ('checkout.session.expired',)
+REFUND_EVENTS = ('charge.refunded',)
+HANDLED_EVENT_TYPES = SESSION_PAID_EVENTS + SESSION_EXPIRED_EVENTS + REFUND_EVENTS
+RECONCILE_WATERMARK_KEY = 'payment:reconcile-watermark'
+# Seconds, on top of STRIPE_DEADLINE, between Stripe creating a session and
+# our row for it being committed, clock skew between us and Stripe included.
+RECONCILE_MARGIN = 60
+
+logger = logging.getLogger(__name__)
+
+
+def _apply(event, by_session, by_intent):
+    """
+    Apply one event to the loaded payments; returns those it changed. One
+    session (and so one payment intent) can pay for several payments, e.g.
+    all of a user's fines.
+    """
+    obj = event.payload['data']['object']
+    if event.type in REFUND_EVENTS:
+        if not obj.get('refunded'):
+            return []
+        payments = [
+            p for p in by_intent.get(obj.get('payment_intent'), ()) if p.status != Payment.StatusChoices.CANCELLED
+        ]
+        for payment in payments:
+            payment.status = Payment.StatusChoices.CANCELLED
+        return payments
+
+    payments = [p for p in by_session.get(obj.get('id'), ()) if p.status == Payment.StatusChoices.PENDING]
+    for payment in payments:
+        if event.type in SESSION_EXPIRED_EVENTS:
+            payment.session_expired()
+            continue
+        if obj.get('payment_intent'):
+            payment.payment_intent_id = obj['payment_intent']
+            by_intent.setdefault(payment.payment_intent_id, []).append(payment)
+        if obj.get('payment_status') == 'paid':
+            payment.status = Payment.StatusChoices.PAID
+    return payments
+
+
+def _apply_batch(events):
+    sessions = {e.payload['data']['object'].get('id') for e in events if e.type not in REFUND_EVENTS}
+    intents = {e.payload['data']['object'].get('payment_intent') for e in events if e.type in REFUND_EVENTS}
+    payments = list(
+        Payment.objects.select_for_update()
+        .filter(Q(session_id__in=sessions - {None, ''}) | Q(payment_intent_id__in=intents - {None, ''}))
+    )
+    was_paid = {p.pk for p in payments if p.status == Payment.StatusChoices.PAID}
+    by_session, by_intent = {}, {}
+    for payment in payments:
+        by_session.setdefault(payment.session_id, []).append(payment)
+        if payment.payment_intent_id:
+            by_intent.setdefault(payment.payment_intent_id, []).append(payment)
+
+    changed = {}
+    for event in events:
+        for payment in _apply(event, by_session, by_intent):
+            changed[payment.pk] = payment
+    Payment.objects.bulk_update(changed.values(), [*Payment.SESSION_EXPIRED_FIELDS, 'payment_intent_id'])
+    paid = [pk for pk, p in changed.items() if p.status == Payment.StatusChoices.PAID and pk not in was_paid]
+    if paid:
+        payments_paid.send(sender=Payment, payment_ids=paid)
+
+
+@shared_task
+def apply_stripe_events() -> int:
+    """
+    Apply stored webhook events to payments in Stripe's creation order,
+    STRIPE_EVENT_BATCH_SIZE at a time: one read of the affected payments and
+    one bulk update per batch. Overlapping runs skip each other's events.
+    """
+    applied = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                StripeEvent.objects.select_for_update(skip_locked=True)
+                .filter(processed_at__isnull=True)
+                .order_by('created', 'id')[:settings.STRIPE_EVENT_BATCH_SIZE]
+            )
+            if events:
+                _apply_batch(events)
+                StripeEvent.objects.filter(pk__in=[e.pk for e in events]).update(processed_at=timezone.now())
+        applied += len(events)
+        if len(events) < settings.STRIPE_EVENT_BATCH_SIZE:
+            return applied
+
+
+def _unsettled(session):
+    """Whether the session can still change: open, or completed with the payment still processing."""
+    return session.status == 'open' or (session.status == 'complete' and session.payment_status == 'unpaid')
+
+
+def _reconcile_page(sessions, stale_before):
+    """
+    Apply one page of listed sessions to their PENDING payments, expiring
+    open sessions that are no longer wanted on the way. Returns the changed
+    payments' count and the creation time of the oldest session of ours
+    that is still unsettled (or None).
+    """
+    statuses = {}
+    for session_id, payment_status in (Payment.objects.filter(session_id__in=[s.id for s in sessions])
+                                       .values_list('session_id', 'status')):
+        statuses.setdefault(session_id, set()).add(payment_status)
+
+    pending = {}
+    for session in sessions:
+        local = statuses.get(session.id)
+        if not local:
+            continue  # Not ours, or replaced by a newer session.
+        stale = Payment.StatusChoices.PENDING not in local or session.created < stale_before
+        if session.status == 'open' and stale:
+            # Its payments were settled another way, or it has been open for
+            # longer than any session we create: don't let it take money.
+            try:
+                session = get_gateway().expire_checkout_session(session.id)
+            except StripeUnavailable:
+                raise
+            except stripe.error.StripeError as e:
+                logger.warning('Could not expire stale Stripe session %s: %s', session.id, e)
+        if Payment.StatusChoices.PENDING in local:
+            pending[session.id] = session
+
+    with transaction.atomic():
+        payments = list(Payment.objects.select_for_update().filter(
+            session_id__in=pending, status=Payment.StatusChoices.PENDING,
+        ))
+        changed = []
+        for payment in payments:
+            session = pending[payment.session_id]
+            if session.status == 'expired':
+                payment.session_expired()
+            elif session.status == 'complete':
+                if session.payment_status == 'paid':
+                    payment.status = Payment.StatusChoices.PAID
+                elif session.payment_intent == payment.payment_intent_id:
+                    continue
+                payment.payment_intent_id = session.payment_intent or ''
+            else:
+                continue
+            changed.append(payment)
+        Payment.objects.bulk_update(changed, [*Payment.SESSION_EXPIRED_FIELDS, 'payment_intent_id'])
+        paid = [p.pk for p in changed if p.status == Payment.StatusChoices.PAID]
+        if paid:
+            payments_paid.send(sender=Payment, payment_ids=paid)
+
+    unsettled = [s.created for s in pending.values() if _unsettled(s)]
+    return len(changed), min(unsettled, default=None)
+
+
+@shared_task
+def reconcile_stripe_sessions() -> int:
+    """
+    Settle PENDING payments whose webhook never arrived, from Stripe's list
+    of Checkout Sessions, a page of STRIPE_RECONCILE_PAGE_SIZE at a time:
+    one Stripe request, one read and one bulk update per page.
+
+    Only sessions created since the watermark are listed, and it moves up
+    to the oldest session of ours that could still change. A run's cost
+    follows the sessions created since then, not the number of PENDING
+    payments. Without a watermark a run looks back
+    STRIPE_RECONCILE_LOOKBACK seconds.
+
+    Our row for a session is committed only once Stripe has answered, up to
+    STRIPE_DEADLINE after the session was created, so a recent session
+    with no row may still become ours. The watermark never passes
+    STRIPE_DEADLINE + RECONCILE_MARGIN seconds before the run started.
+    """
+    started = int(time.time())
+    since = cache.get(RECONCILE_WATERMARK_KEY) or started - settings.STRIPE_RECONCILE_LOOKBACK
+    stale_before = started - settings.STRIPE_SESSION_TTL
+    params = {'created': {'gte': since}, 'limit': settings.STRIPE_RECONCILE_PAGE_SIZE}
+    changed = 0
+    watermark = max(since, int(started - settings.STRIPE_DEADLINE) - RECONCILE_MARGIN)
+    while True:
+        page = get_gateway().list_checkout_sessions(**params)
+        if not page.data:
+            break
+        count, oldest = _reconcile_page(page.data, stale_before)
+        changed += count
+        watermark = min(watermark, oldest or watermark)
+        if not page.has_more:
+            break
+        params['starting_after'] = page.data[-1].id
+    cache.set(RECONCILE_WATERMARK_KEY, watermark, None)
+    return changed
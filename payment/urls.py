@@ -1,9 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .async_views import AsyncCreateCheckoutSessionView, AsyncStripeCancelView
 from .views import (
     CreateCheckoutSessionView,
+    FinesCheckoutView,
     StripeSuccessView,
     StripeCancelView,
+    StripeWebhookView,
     PaymentViewSet,
 )
 
@@ -13,6 +16,11 @@ router.register(r'payments', PaymentViewSet, basename='payment')
 urlpatterns = [
     path('', include(router.urls)),
     path('create-checkout-session/', CreateCheckoutSessionView.as_view(), name='create-checkout-session'),
+    path('fines/checkout/', FinesCheckoutView.as_view(), name='fines-checkout'),
     path('success/', StripeSuccessView.as_view(), name='stripe-success'),
     path('cancel/', StripeCancelView.as_view(), name='stripe-cancel'),
+    path('async/create-checkout-session/', AsyncCreateCheckoutSessionView.as_view(),
+         name='async-create-checkout-session'),
+    path('async/cancel/', AsyncStripeCancelView.as_view(), name='async-stripe-cancel'),
+    path('webhook/', StripeWebhookView.as_view(), name='stripe-webhook'),
 ]
\ No newline at end of file
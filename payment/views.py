@@ -1,65 +1,372 @@
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
 import stripe
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
-from rest_framework import status, permissions, viewsets
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+from rest_framework import exceptions, status, permissions, viewsets
+from rest_framework.decorators import action
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.reverse import reverse
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter, OpenApiResponse
 from .serializers import CheckoutSerializer, CancelSerializer, PaymentSerializer, SessionIdSerializer
-from .models import Payment
+from .gateway import StripeUnavailable, get_gateway
+from .models import Payment, StripeEvent
+from .tasks import HANDLED_EVENT_TYPES, apply_stripe_events
+from .pagination import PaymentPagination
+from accounts.authentication import ClaimsAuthReadMixin
 from borrowing.models import Borrowing
+from src.fast_list import FastListMixin
+from src.export import EXPORT_FORMATS, IgnoreClientContentNegotiation, streaming_export
+from src.sparse_fields import SPARSE_FIELDS_PARAMETERS, SparseFieldsViewMixin
+
+logger = logging.getLogger(__name__)
+
+# Stripe forgets idempotency keys after 24 hours.
+STRIPE_IDEMPOTENCY_KEY_TTL = 24 * 3600
+# Seconds a checkout claim outlives the Stripe call it covers.
+CHECKOUT_CLAIM_MARGIN = 5
 
-stripe_key = settings.STRIPE_SECRET_KEY
-if not stripe_key:
+if not settings.STRIPE_SECRET_KEY:
     raise ImproperlyConfigured("STRIPE_SECRET_KEY must be set in environment.")
-stripe.api_key = stripe_key
+if not settings.STRIPE_WEBHOOK_SECRET:
+    # The webhook is the only way payments become PAID.
+    raise ImproperlyConfigured("STRIPE_WEBHOOK_SECRET must be set in environment.")
+
+
+def stripe_unavailable():
+    return Response(
+        {'detail': 'Payment provider is unavailable, try again later.'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
+class FinesCheckoutConflict(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'An earlier checkout for these fines was paid and is being processed.'
+    default_code = 'fines_checkout_conflict'
+
+
+class IdempotencyKeyReused(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This Idempotency-Key was already used to check out another borrowing.'
+    default_code = 'idempotency_key_reused'
+
+
+def idempotency_key(request):
+    """The request's Idempotency-Key header scoped to the user, or '' without one."""
+    key = request.headers.get('Idempotency-Key', '').strip()
+    if not key:
+        return ''
+    if len(key) > 200:
+        raise exceptions.ValidationError({'Idempotency-Key': ['Ensure this header has no more than 200 characters.']})
+    return f'{request.user.pk}:{key}'
+
+
+def session_expiry(key=''):
+    """
+    When a new Checkout Session should expire. Requests under one
+    Idempotency-Key all get the first one's value, because Stripe refuses
+    a reused key sent with different parameters.
+    """
+    expires_at = int(time.time()) + settings.STRIPE_SESSION_TTL
+    if not key:
+        return expires_at
+    cache_key = f'payment:checkout-expires:{key}'
+    cache.add(cache_key, expires_at, STRIPE_IDEMPOTENCY_KEY_TTL)
+    return cache.get(cache_key, expires_at)
+
+
+def checkout_session_common(request, key=''):
+    """Checkout Session parameters shared by every checkout the user starts."""
+    return {
+        'success_url': request.build_absolute_uri(reverse('stripe-success', request=request))
+        + "?session_id={CHECKOUT_SESSION_ID}",
+        'cancel_url': request.build_absolute_uri(reverse('stripe-cancel', request=request)),
+        'customer_email': request.user.email,
+        'expires_at': session_expiry(key),
+    }
+
+
+def checkout_session_params(request, borrowing, key=''):
+    """The amount due for `borrowing`, and the Checkout Session to collect it."""
+    days = (borrowing.expected_return_date - borrowing.borrow_date).days
+    amount_cents = int(days * float(borrowing.book.daily_fee) * 100)
+
+    return Decimal(amount_cents) / 100, {
+        'payment_method_types': ['card'],
+        'mode': 'payment',
+        'line_items': [{
+            'price_data': {
+                'currency': 'usd',
+                'product_data': {'name': borrowing.book.title},
+                'unit_amount': amount_cents,
+            },
+            'quantity': 1,
+        }],
+        **checkout_session_common(request, key),
+    }
+
+
+def checkout_payment(borrowing, amount, params, session, key):
+    """The unsaved PENDING payment for a Checkout Session just created from `params`."""
+    return Payment(
+        borrowing=borrowing,
+        session_id=session.id,
+        session_url=session.url,
+        money_to_pay=amount,
+        type=Payment.TypeChoices.PAYMENT,
+        status=Payment.StatusChoices.PENDING,
+        session_expires_at=datetime.fromtimestamp(params['expires_at'], tz=dt_timezone.utc),
+        idempotency_key=key,
+    )
+
+
+def replayed_payment(payment_for_key, borrowing):
+    """
+    The payment created earlier under the request's Idempotency-Key, if
+    any, after checking it was for the same borrowing.
+    """
+    if not payment_for_key:
+        return None
+    if payment_for_key.borrowing_id != borrowing.id:
+        raise IdempotencyKeyReused()
+    return payment_for_key
+
+
+def checkout_response(payment):
+    return {'checkout_url': payment.session_url, 'payment_id': payment.id}
+
+
+def claimed_checkout(claim, existing, create, timeout=None):
+    """
+    `existing()`, or else `create()`, run by one request at a time per
+    `claim` key. The claim is a cache entry taken before the Stripe calls
+    and dropped once their result is saved; a duplicate request polls until
+    the first one's result shows up in `existing()`. A claim left by a lost
+    request expires after `timeout` seconds, by default STRIPE_DEADLINE
+    plus a margin.
+    """
+    token = uuid.uuid4().hex
+    while not cache.add(claim, token, timeout or settings.STRIPE_DEADLINE + CHECKOUT_CLAIM_MARGIN):
+        if result := existing():
+            return result
+        time.sleep(0.05)
+    try:
+        # Looked up again: the request holding the claim may have just finished.
+        return existing() or create()
+    finally:
+        if cache.get(claim) == token:
+            cache.delete(claim)
+
 
 class CreateCheckoutSessionView(GenericAPIView):
+    """
+    Starts a Stripe Checkout for one of the user's borrowings. A request
+    repeated with the same Idempotency-Key, or made while an earlier session
+    for the same borrowing and amount is still open or being created, gets
+    that session back instead of a new one.
+    """
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = CheckoutSerializer
 
+    @extend_schema(parameters=[
+        OpenApiParameter('Idempotency-Key', str, OpenApiParameter.HEADER,
+                         description='Repeating a request with the same key returns the same checkout.'),
+    ])
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         borrowing_id = serializer.validated_data['borrowing_id']
+        key = idempotency_key(request)
         try:
             borrowing = Borrowing.objects.select_related('book').get(id=borrowing_id, user=request.user)
         except Borrowing.DoesNotExist:
             return Response({'detail': 'Borrowing not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-        days = (borrowing.expected_return_date - borrowing.borrow_date).days
-        amount_cents = int(days * float(borrowing.book.daily_fee) * 100)
+        amount, params = checkout_session_params(request, borrowing, key)
+
+        def existing():
+            return (
+                replayed_payment(key and Payment.objects.filter(idempotency_key=key).first(), borrowing)
+                or Payment.objects.live_checkouts(borrowing, amount).first()
+            )
+
+        def create():
+            session = get_gateway().create_checkout_session(idempotency_key=key and f'checkout:{key}', **params)
+            payment = checkout_payment(borrowing, amount, params, session, key)
+            try:
+                with transaction.atomic():
+                    payment.save()
+            except IntegrityError:
+                # Another request saved the same Idempotency-Key (and Stripe
+                # replayed the same session to both of us).
+                return Payment.objects.get(idempotency_key=key)
+            return payment
+
+        # No transaction or row lock is held across the Stripe call.
+        try:
+            payment = existing() or claimed_checkout(
+                f'payment:checkout-claim:{borrowing.pk}:{amount}', existing, create,
+            )
+        except StripeUnavailable:
+            return stripe_unavailable()
+        except stripe.error.StripeError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(checkout_response(payment))
+
 
-        success_url = request.build_absolute_uri(reverse('stripe-success', request=request)) + f"?session_id={{CHECKOUT_SESSION_ID}}"
-        cancel_url = request.build_absolute_uri(reverse('stripe-cancel', request=request))
+def fines_response(session_url, fines):
+    return {
+        'checkout_url': session_url,
+        'payment_ids': [fine.id for fine in fines],
+        'total': str(sum(fine.money_to_pay for fine in fines)),
+    }
 
-        session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            mode='payment',
-            line_items=[{
+
+class FinesCheckoutView(APIView):
+    """
+    One Checkout Session for all of the user's outstanding fines, a line
+    item each. Asking again while that session is open returns it; once
+    another fine has been added, a new session replaces it. The old
+    sessions are expired first, so nothing can pay them once the fines
+    point elsewhere; if one was paid already, the fines keep it until its
+    webhook settles them. A fine settled or cancelled while the new session
+    was being made leaves it unassigned and expired, and the request is
+    answered with 409 to be tried again.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(
+        request=None,
+        responses={
+            200: OpenApiResponse(description='The checkout URL, the fines it pays and their total.'),
+            404: OpenApiResponse(description='No outstanding fines.'),
+            409: OpenApiResponse(description='An earlier checkout for these fines was paid and is being '
+                                             'processed, or the fines changed during checkout.'),
+        },
+    )
+    def post(self, request, *args, **kwargs):
+        fines = self.outstanding(request.user)
+        if not fines:
+            return Response({'detail': 'No outstanding fines.'}, status=status.HTTP_404_NOT_FOUND)
+        if self.live_session(fines):
+            return Response(fines_response(fines[0].session_url, fines))
+
+        # No transaction or row lock is held across the Stripe calls: up to
+        # two per earlier session, and one for the new session.
+        old_sessions = {fine.session_id for fine in fines} - {''}
+        timeout = (2 * len(old_sessions) + 1) * settings.STRIPE_DEADLINE + CHECKOUT_CLAIM_MARGIN
+        try:
+            fines = claimed_checkout(
+                f'payment:fines-claim:{request.user.pk}',
+                lambda: self.live_session(self.outstanding(request.user)),
+                lambda: self.replace_session(request),
+                timeout,
+            )
+        except StripeUnavailable:
+            return stripe_unavailable()
+        except stripe.error.StripeError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(fines_response(fines[0].session_url, fines))
+
+    @staticmethod
+    def outstanding(user):
+        return list(
+            Payment.objects.select_related('borrowing__book')
+            .filter(borrowing__user=user, type=Payment.TypeChoices.FINE, status=Payment.StatusChoices.PENDING)
+            .order_by('id')
+        )
+
+    @staticmethod
+    def live_session(fines):
+        """`fines` if they share one session that stays open long enough to pay, else None."""
+        cutoff = timezone.now() + timedelta(seconds=settings.STRIPE_SESSION_REUSE_MARGIN)
+        sessions = {fine.session_id for fine in fines}
+        if len(sessions) == 1 and fines[0].session_id and fines[0].session_expires_at > cutoff:
+            return fines
+        return None
+
+    def replace_session(self, request):
+        gateway = get_gateway()
+        # Read again under the claim: the previous holder may have changed them.
+        fines = self.outstanding(request.user)
+        if not fines:
+            raise exceptions.NotFound('No outstanding fines.')
+        fine_ids = [fine.pk for fine in fines]
+        for session_id in sorted({fine.session_id for fine in fines} - {''}):
+            if not self.close_session(gateway, session_id):
+                raise FinesCheckoutConflict()
+            # Closed for good; forget it even if no new session follows.
+            Payment.objects.filter(pk__in=fine_ids, session_id=session_id).update(
+                session_id='', session_url='', session_expires_at=None,
+            )
+
+        params = {
+            'payment_method_types': ['card'],
+            'mode': 'payment',
+            'line_items': [{
                 'price_data': {
                     'currency': 'usd',
-                    'product_data': {'name': borrowing.book.title},
-                    'unit_amount': amount_cents,
+                    'product_data': {'name': f'Late return fine: {fine.borrowing.book.title}'},
+                    'unit_amount': int(fine.money_to_pay * 100),
                 },
                 'quantity': 1,
-            }],
-            success_url=success_url,
-            cancel_url=cancel_url,
-            customer_email=request.user.email,
-        )
+            } for fine in fines],
+            **checkout_session_common(request),
+        }
+        session = gateway.create_checkout_session(**params)
+        expires_at = datetime.fromtimestamp(params['expires_at'], tz=dt_timezone.utc)
+        with transaction.atomic():
+            # Only fines still owed and without a session take it.
+            assigned = Payment.objects.filter(
+                pk__in=fine_ids, status=Payment.StatusChoices.PENDING, session_id='',
+            ).update(session_id=session.id, session_url=session.url, session_expires_at=expires_at)
+            if assigned != len(fine_ids):
+                transaction.set_rollback(True)
+        if assigned != len(fine_ids):
+            try:
+                gateway.expire_checkout_session(session.id)
+            except stripe.error.StripeError:
+                # Nobody was given its URL; Stripe expires it on its own.
+                logger.warning('Could not expire unused fines session %s', session.id, exc_info=True)
+            raise FinesCheckoutConflict('The fines changed during checkout, try again.')
+        for fine in fines:
+            fine.session_id, fine.session_url, fine.session_expires_at = session.id, session.url, expires_at
+        return fines
+
+    @staticmethod
+    def close_session(gateway, session_id):
+        """
+        Expire an earlier fines session. Returns False if it can't be
+        replaced because it was paid (or is otherwise still live).
+        """
+        try:
+            gateway.expire_checkout_session(session_id)
+            return True
+        except StripeUnavailable:
+            raise
+        except stripe.error.StripeError:
+            # Not open any more: either it expired or it was completed.
+            return gateway.retrieve_checkout_session(session_id).status == 'expired'
 
-        payment = Payment.objects.create(
-            borrowing=borrowing,
-            session_id=session.id,
-            session_url=session.url,
-            money_to_pay=amount_cents / 100,
-            type=Payment.TypeChoices.PAYMENT,
-            status=Payment.StatusChoices.PENDING,
-        )
-        return Response({'checkout_url': session.url, 'payment_id': payment.id})
 
 class StripeSuccessView(GenericAPIView):
+    """
+    Where Stripe sends the customer back. The payment's status is whatever the
+    webhook has applied so far; Stripe itself is not asked.
+    """
     permission_classes = [permissions.AllowAny]
     serializer_class = SessionIdSerializer
 
@@ -68,22 +375,85 @@ class StripeSuccessView(GenericAPIView):
         serializer.is_valid(raise_exception=True)
         session_id = serializer.validated_data['session_id']
 
-        try:
-            session = stripe.checkout.Session.retrieve(session_id)
-        except stripe.error.StripeError as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        payment_status = Payment.objects.filter(session_id=session_id).values_list('status', flat=True).first()
+        if payment_status is None:
+            return Response({'detail': 'Payment record not found.'}, status=status.HTTP_404_NOT_FOUND)
+        if payment_status == Payment.StatusChoices.PAID:
+            return Response({'detail': 'Payment successful.'})
+        if payment_status == Payment.StatusChoices.PENDING:
+            return Response({'detail': 'Payment is being processed.'}, status=status.HTTP_202_ACCEPTED)
+        return Response({'detail': 'Payment not completed.'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _apply_events_soon():
+    try:
+        apply_stripe_events.delay()
+    except OperationalError:
+        # The periodic run picks the events up once the broker is back.
+        logger.warning('Could not queue apply_stripe_events', exc_info=True)
+
 
-        if session.payment_status != 'paid':
-            return Response({'detail': 'Payment not completed.'}, status=status.HTTP_400_BAD_REQUEST)
+class StripeWebhookView(APIView):
+    """
+    Receives Stripe's signed events. Handled ones are stored as they arrive,
+    once per event id, and applied to payments in batches by
+    `apply_stripe_events`; the response doesn't wait for that.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
 
+    @extend_schema(
+        request={'application/json': OpenApiTypes.OBJECT},
+        responses={
+            200: OpenApiResponse(description='Event received.'),
+            400: OpenApiResponse(description='Invalid payload or signature.'),
+        },
+    )
+    def post(self, request, *args, **kwargs):
+        payload = request.body
         try:
-            payment = Payment.objects.get(session_id=session_id)
-        except Payment.DoesNotExist:
-            return Response({'detail': 'Payment record not found.'}, status=status.HTTP_404_NOT_FOUND)
+            event = stripe.Webhook.construct_event(
+                payload, request.headers.get('Stripe-Signature', ''), settings.STRIPE_WEBHOOK_SECRET
+            )
+        except (ValueError, stripe.error.SignatureVerificationError):
+            return Response({'detail': 'Invalid payload or signature.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        payment.status = Payment.StatusChoices.PAID
+        if event['type'] in HANDLED_EVENT_TYPES:
+            with transaction.atomic():
+                StripeEvent.objects.bulk_create([
+                    StripeEvent(
+                        id=event['id'],
+                        type=event['type'],
+                        payload=json.loads(payload),
+                        created=datetime.fromtimestamp(event['created'], tz=dt_timezone.utc),
+                    )
+                ], ignore_conflicts=True)
+                transaction.on_commit(_apply_events_soon)
+        return Response({'received': True})
+
+def cancel_checkout(payment, refunded):
+    """
+    Cancel `payment` once its Checkout Session is closed, along with what
+    else the session covered (a user's other fines). A refund returns the
+    whole charge, so those are all cancelled too; if nothing was paid, they
+    are treated as if the session had expired.
+    """
+    with transaction.atomic():
+        shared = list(
+            Payment.objects.select_for_update()
+            .filter(session_id=payment.session_id)
+            .exclude(pk=payment.pk)
+            .exclude(status=Payment.StatusChoices.CANCELLED)
+        ) if payment.session_id else []
+        for other in shared:
+            if refunded:
+                other.status = Payment.StatusChoices.CANCELLED
+            elif other.status == Payment.StatusChoices.PENDING:
+                other.session_expired()
+        Payment.objects.bulk_update(shared, Payment.SESSION_EXPIRED_FIELDS)
+        payment.status = Payment.StatusChoices.CANCELLED
         payment.save(update_fields=['status'])
-        return Response({'detail': 'Payment successful.'})
+
 
 class StripeCancelView(GenericAPIView):
     permission_classes = [permissions.AllowAny]
@@ -97,36 +467,69 @@ class StripeCancelView(GenericAPIView):
             payment = Payment.objects.get(id=payment_id)
         except Payment.DoesNotExist:
             return Response({'detail': 'Payment not found.'}, status=status.HTTP_404_NOT_FOUND)
+        gateway = get_gateway()
         try:
-            stripe.checkout.Session.expire(payment.session_id)
+            gateway.expire_checkout_session(payment.session_id)
+        except StripeUnavailable:
+            return stripe_unavailable()
         except stripe.error.StripeError:
+            # Already completed or expired.
             pass
         try:
-            session = stripe.checkout.Session.retrieve(payment.session_id)
+            session = gateway.retrieve_checkout_session(payment.session_id)
             pi_id = session.payment_intent
             if not pi_id:
-                payment.status = Payment.StatusChoices.CANCELLED
-                payment.save(update_fields=['status'])
+                cancel_checkout(payment, refunded=False)
                 return Response({'detail': 'Checkout session cancelled.'})
-            intent = stripe.PaymentIntent.retrieve(pi_id, expand=['charges'])
-            charges = intent.charges.data
-            charge_id = charges[0].id if charges else None
+            charge_id = gateway.retrieve_payment_intent(pi_id).latest_charge
             if not charge_id:
                 return Response({'detail': 'No charges to refund.'}, status=status.HTTP_400_BAD_REQUEST)
-            stripe.Refund.create(charge=charge_id)
-            payment.status = Payment.StatusChoices.CANCELLED
-            payment.save(update_fields=['status'])
+            gateway.create_refund(charge=charge_id)
+            cancel_checkout(payment, refunded=True)
             return Response({'detail': 'Payment refunded and cancelled.'})
+        except StripeUnavailable:
+            return stripe_unavailable()
         except stripe.error.StripeError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class PaymentViewSet(viewsets.ReadOnlyModelViewSet):
+EXPORT_FIELDS = {
+    'id': 'id',
+    'borrowing_id': 'borrowing_id',
+    'user_email': 'borrowing__user__email',
+    'book_title': 'borrowing__book__title',
+    'type': 'type',
+    'status': 'status',
+    'money_to_pay': 'money_to_pay',
+    'session_id': 'session_id',
+}
+
+@extend_schema_view(
+    list=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
+    retrieve=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
+)
+class PaymentViewSet(ClaimsAuthReadMixin, FastListMixin, SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PaymentPagination
 
     def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action != 'export':
+            qs = self.with_related(qs)
         user = self.request.user
         if user.is_staff:
-            return self.queryset
-        return self.queryset.filter(borrowing__user=user)
\ No newline at end of file
+            return qs
+        return qs.filter(borrowing__user_id=user.pk)
+
+    @extend_schema(
+        responses={(200, media_type): OpenApiResponse(OpenApiTypes.STR) for media_type in EXPORT_FORMATS.values()},
+    )
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path=r'export/(?P<export_format>ndjson|csv)',
+        content_negotiation_class=IgnoreClientContentNegotiation,
+    )
+    def export(self, request, export_format=None):
+        return streaming_export(self.get_queryset(), EXPORT_FIELDS, export_format, 'payments')
\ No newline at end of file
@@ -11,8 +11,31 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 app.conf.beat_schedule = {
-    'check-overdue-daily-08': {
+    # Only the first run of a day finds work; the others pick up after a failed run.
+    'check-overdue-hourly': {
         'task': 'notifications.tasks.check_overdue_borrowings',
-        'schedule': crontab(hour=8, minute=0),
+        'schedule': crontab(minute=0),
+    },
+    'dispatch-outbox': {
+        'task': 'notifications.tasks.dispatch_outbox',
+        'schedule': 5.0,
+    },
+    'purge-outbox-daily': {
+        'task': 'notifications.tasks.purge_outbox',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    # Webhooks kick this off themselves; the schedule catches any that didn't.
+    'apply-stripe-events': {
+        'task': 'payment.tasks.apply_stripe_events',
+        'schedule': 30.0,
+    },
+    # For payments whose webhook went missing.
+    'reconcile-stripe-sessions': {
+        'task': 'payment.tasks.reconcile_stripe_sessions',
+        'schedule': crontab(minute='*/15'),
+    },
+    'consolidate-inventory-shards': {
+        'task': 'books.tasks.consolidate_inventory_shards',
+        'schedule': crontab(minute='*/10'),
     },
 }
@@ -0,0 +1,137 @@
+"""
+Reads from replicas (DATABASE_REPLICAS), writes to the primary.
+
+`ReplicaRoutingMiddleware` lets a safe (GET/HEAD/OPTIONS) request read
+from one replica, picked per request. A user's successful unsafe request
+pins that user to the primary for DATABASE_REPLICA_PIN_SECONDS, so they
+read their own writes (a borrowing, a return, a checkout) even when the
+replicas lag behind. Reads inside a transaction on the primary stay on it.
+
+Code outside requests, such as Celery tasks, reads from the primary unless
+it opts in with `replica_reads()`.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# (replica alias, transactions open on the primary when the request began,
+# or None for `replica_reads()`, which ignores them)
+_replica = ContextVar('replica', default=None)
+
+
+def _pick_replica():
+    return random.choice(settings.DATABASE_REPLICAS) if settings.DATABASE_REPLICAS else None
+
+
+@contextmanager
+def replica_reads():
+    """
+    Send the block's reads to a replica, even inside a transaction: for
+    scans that tolerate replication lag. Don't lock rows in the block.
+    """
+    token = _replica.set((_pick_replica(), None))
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def _open_transactions():
+    return len(connections[DEFAULT_DB_ALIAS].atomic_blocks)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias, transactions = _replica.get() or (None, None)
+        if alias is None or alias not in settings.DATABASE_REPLICAS:
+            return None
+        if transactions is not None and _open_transactions() > transactions:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+
+def _pin_key(user_id):
+    return f'db:primary:{user_id}'
+
+
+def pin_to_primary(user_id):
+    cache.set(_pin_key(user_id), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def _token_user_id(request):
+    """The user id in the request's bearer token, if it holds a valid one."""
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = header and auth.get_raw_token(header)
+    if not raw_token:
+        return None
+    try:
+        return auth.get_validated_token(raw_token).get(api_settings.USER_ID_CLAIM)
+    except InvalidToken:
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _replica.set(self._replica_for(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica.reset(token)
+        self._pin_writer(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = _replica.set(await sync_to_async(self._replica_for)(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _replica.reset(token)
+        await sync_to_async(self._pin_writer)(request, response)
+        return response
+
+    def _replica_for(self, request):
+        """The routing state for this request: which replica it reads from, if any."""
+        if request.method not in SAFE_METHODS:
+            return None
+        alias = _pick_replica()
+        user_id = alias and _token_user_id(request)
+        if user_id is not None and cache.get(_pin_key(user_id)):
+            return None
+        return alias, _open_transactions()
+
+    def _pin_writer(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400 or not settings.DATABASE_REPLICAS:
+            return
+        # DRF has authenticated the request by now.
+        user = getattr(request, 'user', None)
+        user_id = user.pk if user is not None and user.is_authenticated else _token_user_id(request)
+        if user_id is not None:
+            pin_to_primary(user_id)
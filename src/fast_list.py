@@ -0,0 +1,157 @@
+"""
+List responses built straight from `values_list()` rows.
+
+`compile_rows()` turns a bound read serializer (after `?fields=`/`?expand=`
+narrowing) into the column lookups it reads and one precompiled mapper per
+field, so a page is rendered without model instances or DRF's per-field
+`get_attribute`/`to_representation` dispatch. The output is the same as the
+serializer's. Serializers using anything the mapper does not know about
+return None and are rendered the usual way.
+"""
+from operator import itemgetter
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.response import Response
+
+# Fields whose representation is the column value itself.
+_IDENTITY_FIELDS = (
+    serializers.IntegerField,
+    serializers.CharField,
+    serializers.PrimaryKeyRelatedField,
+)
+# Fields whose `to_representation` only needs the column value.
+_SCALAR_FIELDS = (
+    serializers.BooleanField,
+    serializers.ChoiceField,
+    serializers.DateField,
+    serializers.DateTimeField,
+    serializers.DecimalField,
+    serializers.DurationField,
+    serializers.FloatField,
+    serializers.TimeField,
+    serializers.UUIDField,
+)
+
+
+class Rows:
+    def __init__(self, lookups, annotations, build):
+        self.lookups = lookups
+        self.annotations = annotations
+        self.build = build
+
+    def apply(self, queryset):
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        return queryset.values_list(*self.lookups, named=True)
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _column(model, attrs):
+    """The model field `attrs` leads to, if every step of the path is a column."""
+    for i, attr in enumerate(attrs):
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            raise _Unsupported
+        if not field.concrete or field.many_to_many:
+            raise _Unsupported
+        if i < len(attrs) - 1:
+            if not field.is_relation:
+                raise _Unsupported
+            model = field.related_model
+    return field
+
+
+def _skip_none(index, convert):
+    def get(row):
+        value = row[index]
+        return None if value is None else convert(value)
+    return get
+
+
+def _nested(index, build):
+    def get(row):
+        return None if row[index] is None else build(row)
+    return get
+
+
+def _compile(serializer, model, prefix, columns, annotations):
+    overrides = getattr(serializer, 'row_annotations', {})
+    if type(serializer).to_representation is not serializers.ModelSerializer.to_representation and not overrides:
+        raise _Unsupported
+
+    def index_of(lookup):
+        return columns.setdefault(lookup, len(columns))
+
+    getters = []
+    for field in serializer._readable_fields:
+        if field.field_name in overrides:
+            alias = f'row_{len(annotations)}'
+            annotations[alias] = overrides[field.field_name](prefix)
+            getters.append((field.field_name, itemgetter(index_of(alias))))
+            continue
+
+        if field.source == '*' or not field.source_attrs:
+            raise _Unsupported
+        model_field = _column(model, field.source_attrs)
+        lookup = prefix + '__'.join(field.source_attrs)
+
+        if isinstance(field, serializers.ModelSerializer):
+            if not model_field.is_relation:
+                raise _Unsupported
+            nested = _compile(field, model_field.related_model, lookup + '__', columns, annotations)
+            getters.append((field.field_name, _nested(index_of(lookup), nested)))
+        elif isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+            getters.append((field.field_name, itemgetter(index_of(lookup))))
+        elif isinstance(field, _IDENTITY_FIELDS) and not model_field.is_relation:
+            getters.append((field.field_name, itemgetter(index_of(lookup))))
+        elif isinstance(field, _SCALAR_FIELDS) and not model_field.is_relation:
+            getters.append((field.field_name, _skip_none(index_of(lookup), field.to_representation)))
+        else:
+            raise _Unsupported
+
+    def build(row):
+        return {name: get(row) for name, get in getters}
+    return build
+
+
+def compile_rows(serializer, extra_lookups=()):
+    """
+    Compile `serializer` (a bound ModelSerializer) into a `Rows` whose
+    `build(row)` renders one `values_list()` row, or None if it can't be.
+    `extra_lookups` are read as well, e.g. for the paginator's cursor.
+    """
+    columns, annotations = {}, {}
+    try:
+        build = _compile(serializer, serializer.Meta.model, '', columns, annotations)
+    except _Unsupported:
+        return None
+    for lookup in extra_lookups:
+        columns.setdefault(lookup, len(columns))
+    return Rows(list(columns), annotations, build)
+
+
+class FastListMixin:
+    """Serve `list` from `values_list()` rows whenever the serializer allows."""
+    fast_list = True
+
+    def list(self, request, *args, **kwargs):
+        rows = None
+        if self.fast_list:
+            ordering = getattr(self.paginator, 'ordering', ())
+            if isinstance(ordering, str):
+                ordering = (ordering,)
+            rows = compile_rows(self.get_serializer(many=True).child, [f.lstrip('-') for f in ordering])
+        if rows is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = rows.apply(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response([rows.build(row) for row in page])
+        return Response([rows.build(row) for row in queryset])
@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
+import copy
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -49,10 +51,12 @@ INSTALLED_APPS = [
     "books",
     "borrowing",
     "payment",
+    "notifications",
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "src.db_routing.ReplicaRoutingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -84,13 +88,91 @@ WSGI_APPLICATION = "src.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+# PostgreSQL when POSTGRES_DB is set (docker-compose), SQLite otherwise.
+
+if os.getenv("POSTGRES_DB"):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("POSTGRES_DB"),
+            "USER": os.getenv("POSTGRES_USER"),
+            "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
+            "HOST": os.getenv("POSTGRES_HOST", "db"),
+            "PORT": os.getenv("POSTGRES_PORT", "5432"),
+            # Make sure a reused connection still works before handing it out.
+            "CONN_HEALTH_CHECKS": True,
+        }
+    }
+    if os.getenv("POSTGRES_POOL", "true").lower() in ("1", "true", "yes"):
+        # A psycopg pool per process, sized for what the process runs
+        # (PROCESS_ROLE); POSTGRES_POOL_MIN_SIZE/MAX_SIZE override it.
+        POSTGRES_POOL_SIZES = {"web": (2, 8), "worker": (1, 4), "beat": (0, 1)}
+        PROCESS_ROLE = os.getenv("PROCESS_ROLE", "web")
+        if PROCESS_ROLE not in POSTGRES_POOL_SIZES:
+            raise ImproperlyConfigured(
+                f"PROCESS_ROLE must be one of {', '.join(POSTGRES_POOL_SIZES)}, not {PROCESS_ROLE!r}."
+            )
+        min_size, max_size = POSTGRES_POOL_SIZES[PROCESS_ROLE]
+        DATABASES["default"]["OPTIONS"] = {
+            "pool": {
+                "min_size": int(os.getenv("POSTGRES_POOL_MIN_SIZE", min_size)),
+                "max_size": int(os.getenv("POSTGRES_POOL_MAX_SIZE", max_size)),
+                # Seconds to wait for a free connection before giving up.
+                "timeout": float(os.getenv("POSTGRES_POOL_TIMEOUT", 10)),
+                # Seconds an unused connection above min_size stays open.
+                "max_idle": float(os.getenv("POSTGRES_POOL_MAX_IDLE", 600)),
+            },
+        }
+    else:
+        # One connection per thread, kept across requests.
+        DATABASES["default"]["CONN_MAX_AGE"] = int(os.getenv("POSTGRES_CONN_MAX_AGE", 60))
+    # Read replicas, one alias each (replica1, replica2, ...) with the
+    # primary's settings but their own host.
+    for number, host in enumerate(filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",")), 1):
+        DATABASES[f"replica{number}"] = {
+            **copy.deepcopy(DATABASES["default"]),
+            "HOST": host.strip(),
+            # Tests see the primary's test database through it.
+            "TEST": {"MIRROR": "default"},
+        }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        }
+    }
+
+# Aliases safe requests and `replica_reads()` blocks may read from (see
+# `src/db_routing.py`); after a write, the user reads from the primary for
+# DATABASE_REPLICA_PIN_SECONDS.
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith("replica")]
+DATABASE_ROUTERS = ["src.db_routing.ReplicaRouter"]
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv("DATABASE_REPLICA_PIN_SECONDS", 10))
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+
+# Cache
+# Redis when REDIS_URL is set (docker-compose), in-process locmem otherwise.
+
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+            "KEY_PREFIX": "cinema",
+        }
     }
-}
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Seconds a cached catalog page lives, and how long a request waits for
+# another request that is already rebuilding the same page.
+BOOK_CACHE_TIMEOUT = int(os.getenv("BOOK_CACHE_TIMEOUT", 300))
+BOOK_CACHE_LOCK_WAIT = float(os.getenv("BOOK_CACHE_LOCK_WAIT", 5))
 
 
 # Password validation
@@ -116,12 +198,85 @@ AUTH_USER_MODEL = "accounts.User"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "accounts.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
 
+# Users resolved for JWT authentication (`accounts.cache`): seconds in the
+# shared cache, seconds in each process's LRU, and that LRU's size.
+USER_CACHE_TIMEOUT = int(os.getenv("USER_CACHE_TIMEOUT", 60))
+USER_CACHE_LOCAL_TTL = float(os.getenv("USER_CACHE_LOCAL_TTL", 5))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+
+# Access tokens carry the user's email and is_staff (refreshing re-reads them,
+# so a change shows within ACCESS_TOKEN_LIFETIME). With JWT_CLAIMS_AUTH on,
+# read-only borrowing and payment requests take the user from those claims
+# instead of loading it.
+SIMPLE_JWT = {
+    "TOKEN_OBTAIN_SERIALIZER": "accounts.serializers.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "accounts.serializers.ClaimsTokenRefreshSerializer",
+}
+JWT_CLAIMS_AUTH = os.getenv("JWT_CLAIMS_AUTH", "false").lower() in ("1", "true", "yes")
+
+SPECTACULAR_SETTINGS = {
+    # Sparse responses (?fields=/?expand=) and request bodies have different
+    # required fields, so they need separate components.
+    "COMPONENT_SPLIT_REQUEST": True,
+}
+
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+# Overrides Stripe's API address, e.g. for a local fake.
+STRIPE_API_URL = os.getenv("STRIPE_API_URL")
+# Stripe calls (`payment.gateway`): each attempt's connect/read timeouts, the
+# deadline for a whole call including retries, and attempts per call.
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", 2))
+STRIPE_READ_TIMEOUT = float(os.getenv("STRIPE_READ_TIMEOUT", 5))
+STRIPE_DEADLINE = float(os.getenv("STRIPE_DEADLINE", 8))
+STRIPE_MAX_ATTEMPTS = int(os.getenv("STRIPE_MAX_ATTEMPTS", 3))
+# Checkout Sessions expire this many seconds after creation (Stripe allows
+# 30 minutes to 24 hours); a pending one is handed out again to repeated
+# checkout requests while more than STRIPE_SESSION_REUSE_MARGIN seconds remain.
+STRIPE_SESSION_TTL = int(os.getenv("STRIPE_SESSION_TTL", 3600))
+STRIPE_SESSION_REUSE_MARGIN = int(os.getenv("STRIPE_SESSION_REUSE_MARGIN", 300))
+# Keep-alive connections to Stripe per worker process.
+STRIPE_POOL_SIZE = int(os.getenv("STRIPE_POOL_SIZE", 10))
+# After this many failed requests in a row Stripe isn't called for STRIPE_BREAKER_RESET seconds.
+STRIPE_BREAKER_FAILURES = int(os.getenv("STRIPE_BREAKER_FAILURES", 5))
+STRIPE_BREAKER_RESET = float(os.getenv("STRIPE_BREAKER_RESET", 30))
+# Webhook events applied per batch by `payment.tasks.apply_stripe_events`.
+STRIPE_EVENT_BATCH_SIZE = int(os.getenv("STRIPE_EVENT_BATCH_SIZE", 500))
+# `payment.tasks.reconcile_stripe_sessions`: sessions listed per Stripe
+# request (at most 100), and how far back its first run looks.
+STRIPE_RECONCILE_PAGE_SIZE = int(os.getenv("STRIPE_RECONCILE_PAGE_SIZE", 100))
+STRIPE_RECONCILE_LOOKBACK = int(os.getenv("STRIPE_RECONCILE_LOOKBACK", 7 * 24 * 3600))
+
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_ADMIN_CHAT_ID = os.getenv("TELEGRAM_ADMIN_CHAT_ID")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", 10))
+# Telegram allows about 20 messages a minute into one group chat.
+TELEGRAM_MESSAGES_PER_MINUTE = int(os.getenv("TELEGRAM_MESSAGES_PER_MINUTE", 20))
+# ...and about 30 a second overall per bot; each worker process gets a bucket this size.
+TELEGRAM_MESSAGES_PER_SECOND = float(os.getenv("TELEGRAM_MESSAGES_PER_SECOND", 30))
+# Queued notifications arriving this many seconds apart are sent as one message.
+TELEGRAM_BATCH_LINGER = float(os.getenv("TELEGRAM_BATCH_LINGER", 1.0))
+TELEGRAM_MAX_ATTEMPTS = int(os.getenv("TELEGRAM_MAX_ATTEMPTS", 5))
+# How long a notification task waits for the sender to deliver its message
+# before it gives up and retries.
+TELEGRAM_DELIVERY_TIMEOUT = float(os.getenv("TELEGRAM_DELIVERY_TIMEOUT", 120))
+# Overdue borrowings per notification subtask; each subtask sends one digest.
+OVERDUE_CHUNK_SIZE = int(os.getenv("OVERDUE_CHUNK_SIZE", 200))
+# Days past `expected_return_date` at which a reminder goes out.
+OVERDUE_REMINDER_DAYS = (1, 3, 7, 14, 30)
+# Seconds after which a claimed reminder that was never delivered (failed
+# sends, a lost worker) is claimed and sent again by the overdue check.
+OVERDUE_CLAIM_TIMEOUT = int(os.getenv("OVERDUE_CLAIM_TIMEOUT", 3600))
+# Notification outbox: events published per dispatcher batch, and how long
+# published events are kept for deduplication.
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 500))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", 7))
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
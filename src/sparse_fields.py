@@ -0,0 +1,146 @@
+"""
+`?fields=` and `?expand=` support for read endpoints.
+
+Both take comma-separated, dot-nested paths, e.g.
+`?fields=id,status,borrowing.book.title&expand=borrowing,borrowing.book`.
+
+- `fields` limits each level to the listed fields; naming a nested field
+  without sub-fields keeps all of its fields.
+- `expand` lists the relations rendered as nested objects. Relations not
+  listed are rendered as their primary key. Without `expand` every relation is
+  expanded, as before.
+
+Relations that are neither requested nor expanded are dropped from the
+queryset's select_related/prefetch_related as well.
+"""
+from drf_spectacular.extensions import OpenApiSerializerExtension
+from drf_spectacular.plumbing import build_basic_type
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        'fields', str,
+        description='Comma-separated fields to include; use dots for nested fields, e.g. `id,borrowing.book.title`.',
+    ),
+    OpenApiParameter(
+        'expand', str,
+        description='Comma-separated relations to render as objects, e.g. `borrowing,borrowing.book`. '
+                    'Relations not listed are returned as ids. Omit to expand everything.',
+    ),
+]
+
+
+def parse_paths(value):
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in filter(None, path.strip().split('.')):
+            node = node.setdefault(part, {})
+    return tree
+
+
+class SparseFieldsMixin:
+    # Prefetches a field needs, e.g. {'inventory': 'shards'}.
+    field_prefetches = {}
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        self._sparse_fields = fields
+        self._expand = expand
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self._sparse_fields:
+            fields = {name: field for name, field in fields.items() if name in self._sparse_fields}
+
+        for name, field in list(fields.items()):
+            if not isinstance(field, SparseFieldsMixin):
+                continue
+            if self._expand is not None and name not in self._expand:
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+                continue
+            field._sparse_fields = (self._sparse_fields or {}).get(name)
+            field._expand = None if self._expand is None else self._expand[name]
+        return fields
+
+    @classmethod
+    def get_related_paths(cls, fields=None, expand=None, prefix=''):
+        """The (select_related, prefetch_related) lookups a response needs."""
+        select, prefetch = [], []
+        for name, lookup in cls.field_prefetches.items():
+            if not fields or name in fields:
+                prefetch.append(prefix + lookup)
+
+        for name, field in cls._declared_fields.items():
+            if not isinstance(field, SparseFieldsMixin):
+                continue
+            if fields and name not in fields:
+                continue
+            if expand is not None and name not in expand:
+                continue
+            path = prefix + (field.source or name).replace('.', '__')
+            select.append(path)
+            nested_select, nested_prefetch = type(field).get_related_paths(
+                (fields or {}).get(name),
+                None if expand is None else expand[name],
+                path + '__',
+            )
+            select += nested_select
+            prefetch += nested_prefetch
+        return select, prefetch
+
+
+class SparseFieldsViewMixin:
+    def get_sparse_fields(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return None, None
+        params = request.query_params
+        fields = parse_paths(params['fields']) if 'fields' in params else None
+        expand = parse_paths(params['expand']) if 'expand' in params else None
+        return fields, expand
+
+    def get_serializer(self, *args, **kwargs):
+        if issubclass(self.get_serializer_class(), SparseFieldsMixin):
+            fields, expand = self.get_sparse_fields()
+            kwargs.setdefault('fields', fields)
+            kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
+    def with_related(self, queryset):
+        """Join or prefetch exactly the relations the response will render."""
+        serializer_class = self.get_serializer_class()
+        if not issubclass(serializer_class, SparseFieldsMixin):
+            return queryset
+        select, prefetch = serializer_class.get_related_paths(*self.get_sparse_fields())
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+
+class SparseFieldsSerializerExtension(OpenApiSerializerExtension):
+    """
+    Response schemas for sparse serializers: no field is guaranteed to be
+    present, and each expandable relation is either the object or its id.
+    """
+    target_class = 'src.sparse_fields.SparseFieldsMixin'
+    match_subclasses = True
+
+    def map_serializer(self, auto_schema, direction):
+        schema = auto_schema._map_serializer(self.target, direction, bypass_extensions=True)
+        if direction != 'response':
+            return schema
+
+        schema.pop('required', None)
+        for name, field in self.target.fields.items():
+            if isinstance(field, SparseFieldsMixin) and name in schema.get('properties', {}):
+                schema['properties'][name] = {
+                    'oneOf': [schema['properties'][name], build_basic_type(OpenApiTypes.INT)],
+                    'readOnly': True,
+                }
+        return schema
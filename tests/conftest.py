@@ -0,0 +1,38 @@
+import pytest
+from django.core.cache import cache
+from accounts.cache import local_users
+from notifications.sender import shutdown_sender
+from payment.gateway import reset_gateway
+from tests.fakes import FakeStripe, FakeTelegram
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # The test database is rolled back between tests but the cache is not.
+    cache.clear()
+    local_users.clear()
+    yield
+    cache.clear()
+    local_users.clear()
+
+
+@pytest.fixture
+def telegram(settings):
+    fake = FakeTelegram()
+    settings.TELEGRAM_API_URL = fake.url
+    settings.TELEGRAM_BOT_TOKEN = 'token'
+    settings.TELEGRAM_ADMIN_CHAT_ID = '42'
+    settings.TELEGRAM_MESSAGES_PER_MINUTE = 60000
+    yield fake
+    shutdown_sender(timeout=5)
+    fake.close()
+
+
+@pytest.fixture
+def stripe_api(settings):
+    fake = FakeStripe()
+    settings.STRIPE_API_URL = fake.url
+    reset_gateway()
+    yield fake
+    reset_gateway()
+    fake.close()
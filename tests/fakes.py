@@ -0,0 +1,172 @@
+"""
+Local HTTP stand-ins for Telegram's Bot API and Stripe, used by the test
+fixtures and the benchmarks.
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class FakeTelegram:
+    """A local stand-in for the Bot API's sendMessage endpoint."""
+
+    def __init__(self):
+        self.messages = []
+        self.failures = {}  # request number -> (status, body) returned instead of ok
+        self.requests = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                fake.requests += 1
+                if fake.requests in fake.failures:
+                    status, reply = fake.failures[fake.requests]
+                else:
+                    fake.messages.append((self.path, body))
+                    status, reply = 200, {'ok': True, 'result': {}}
+                payload = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeStripe:
+    """
+    A local stand-in for the parts of Stripe's API the payment code uses.
+    Responses can be delayed (`delay`, or `delays` by request number) or
+    replaced (`failures`, by request number), and a repeated idempotency key
+    replays the first response, or fails if the parameters differ.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.intents = {}
+        self.refunds = []
+        self.requests = []  # (method, path, params)
+        self.idempotency_keys = []  # per request, None without one
+        self.failures = {}  # request number -> (status, body)
+        self.delay = 0
+        self.delays = {}
+        self.replies = {}
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.handle_request(dict(parse_qsl(urlsplit(self.path).query)))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+                self.handle_request(dict(parse_qsl(body)))
+
+            def handle_request(self, params):
+                fake.requests.append((self.command, self.path, params))
+                fake.idempotency_keys.append(self.headers.get('Idempotency-Key'))
+                number = len(fake.requests)
+                time.sleep(fake.delays.get(number, fake.delay))
+                key = fake.idempotency_keys[number - 1]
+                if number in fake.failures:
+                    status, reply = fake.failures[number]
+                elif key in fake.replies:
+                    status, reply, first_params = fake.replies[key]
+                    if params != first_params:
+                        status, reply = 400, {'error': {
+                            'type': 'idempotency_error',
+                            'message': 'Keys for idempotent requests can only be used with the same '
+                                       'parameters they were first used with.',
+                        }}
+                else:
+                    status, reply = fake.route(self.command, self.path.split('?')[0], params)
+                    if key:
+                        fake.replies[key] = status, reply, params
+                payload = json.dumps(reply).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except OSError:
+                    pass  # The client gave up waiting.
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler, bind_and_activate=False)
+        self.server.request_queue_size = 256  # Benchmarks open many connections at once.
+        self.server.server_bind()
+        self.server.server_activate()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def add_session(self, session_id, **fields):
+        self.sessions[session_id] = {
+            'id': session_id, 'object': 'checkout.session', 'url': f'https://checkout.test/{session_id}',
+            'status': 'open', 'payment_status': 'unpaid', 'payment_intent': None, 'created': int(time.time()),
+            **fields,
+        }
+        return self.sessions[session_id]
+
+    def route(self, method, path, params):
+        if method == 'POST' and path == '/v1/checkout/sessions':
+            return 200, self.add_session(f'cs_test_{len(self.sessions) + 1}')
+        if method == 'GET' and path == '/v1/checkout/sessions':
+            return 200, self.list_sessions(params)
+        if match := re.fullmatch(r'/v1/checkout/sessions/([^/]+)(/expire)?', path):
+            session = self.sessions.get(match[1])
+            if session is None:
+                return self.error(404, f'No such checkout.session: {match[1]}')
+            if match[2]:
+                if session['status'] != 'open':
+                    return self.error(400, 'Only open sessions can be expired.')
+                session['status'] = 'expired'
+            return 200, session
+        if match := re.fullmatch(r'/v1/payment_intents/([^/]+)', path):
+            intent = self.intents.get(match[1])
+            return (200, intent) if intent else self.error(404, f'No such payment_intent: {match[1]}')
+        if method == 'POST' and path == '/v1/refunds':
+            refund = {'id': f're_{len(self.refunds) + 1}', 'object': 'refund', **params}
+            self.refunds.append(refund)
+            return 200, refund
+        return self.error(404, f'Unrecognized request URL ({method}: {path})')
+
+    def list_sessions(self, params):
+        # Newest first, like Stripe.
+        sessions = [
+            session for session in reversed(list(self.sessions.values()))
+            if session['created'] >= int(params.get('created[gte]', 0))
+            and params.get('status', session['status']) == session['status']
+        ]
+        sessions.sort(key=lambda session: -session['created'])
+        if 'starting_after' in params:
+            ids = [session['id'] for session in sessions]
+            sessions = sessions[ids.index(params['starting_after']) + 1:]
+        limit = int(params.get('limit', 10))
+        return {
+            'object': 'list', 'url': '/v1/checkout/sessions',
+            'data': sessions[:limit], 'has_more': len(sessions) > limit,
+        }
+
+    @staticmethod
+    def error(status, message):
+        return status, {'error': {'type': 'invalid_request_error', 'message': message}}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
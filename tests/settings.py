@@ -0,0 +1,9 @@
+"""Settings for the test suite: the project's, plus a stand-in read replica."""
+from src.settings import *  # noqa: F401,F403
+from src.settings import DATABASES
+
+# A second SQLite database standing in for a read replica, for tests that
+# ask for it with `django_db(databases=['default', 'replica'])`. Nothing
+# replicates to it, so what reads return shows where they went. It is not
+# in DATABASE_REPLICAS; tests that route to it add it themselves.
+DATABASES = {**DATABASES, 'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}}
@@ -0,0 +1,117 @@
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import AsyncClient, Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+from books.models import Book
+from borrowing.models import Borrowing
+from payment.models import Payment
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email='user@example.com', password='pass')
+
+
+@pytest.fixture
+def auth(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+
+
+@pytest.fixture
+def borrowing(user):
+    book = Book.objects.create(title='Book', author='Author', cover='HARD', inventory=3, daily_fee=2)
+    return Borrowing.objects.create(
+        borrow_date='2025-07-01', expected_return_date='2025-07-05', book=book, user=user
+    )
+
+
+@pytest.fixture
+def payment(borrowing):
+    return Payment.objects.create(
+        borrowing=borrowing, session_id='cs_1', session_url='https://example.com', money_to_pay='8.00',
+        type=Payment.TypeChoices.PAYMENT, status=Payment.StatusChoices.PENDING,
+    )
+
+
+@pytest.mark.django_db
+def test_async_checkout_creates_payment(stripe_api, borrowing, auth):
+    resp = Client().post(reverse('async-create-checkout-session'), {'borrowing_id': borrowing.id},
+                         content_type='application/json', **auth)
+    assert resp.status_code == 200
+    payment = Payment.objects.get(pk=resp.json()['payment_id'])
+    assert (payment.session_id, str(payment.money_to_pay)) == ('cs_test_1', '8.00')
+    assert resp.json()['checkout_url'] == 'https://checkout.test/cs_test_1'
+    assert stripe_api.requests[0][2]['line_items[0][price_data][unit_amount]'] == '800'
+
+
+@pytest.mark.django_db
+def test_async_checkout_under_asgi(stripe_api, borrowing, auth):
+    resp = async_to_sync(AsyncClient().post)(
+        reverse('async-create-checkout-session'), {'borrowing_id': borrowing.id},
+        content_type='application/json', headers={'Authorization': auth['HTTP_AUTHORIZATION']},
+    )
+    assert resp.status_code == 200
+    assert Payment.objects.filter(session_id='cs_test_1').exists()
+
+
+@pytest.mark.django_db
+def test_async_checkout_errors_match_sync_view(stripe_api, borrowing, auth):
+    url = reverse('async-create-checkout-session')
+    resp = Client().post(url, {'borrowing_id': borrowing.id}, content_type='application/json')
+    assert resp.status_code == 401
+    assert resp.json() == {'detail': 'Authentication credentials were not provided.'}
+
+    resp = Client().post(url, {}, content_type='application/json', **auth)
+    assert resp.status_code == 400
+    assert resp.json() == {'borrowing_id': ['This field is required.']}
+
+    resp = Client().post(url, {'borrowing_id': 9999}, content_type='application/json', **auth)
+    assert resp.status_code == 404
+    assert resp.json() == {'detail': 'Borrowing not found.'}
+    assert stripe_api.requests == []
+
+
+@pytest.mark.django_db
+def test_async_cancel_expires_open_session(stripe_api, payment):
+    stripe_api.add_session('cs_1')
+    resp = Client().post(reverse('async-stripe-cancel'), {'payment_id': payment.id}, content_type='application/json')
+    assert resp.status_code == 200
+    assert resp.json() == {'detail': 'Checkout session cancelled.'}
+    assert stripe_api.sessions['cs_1']['status'] == 'expired'
+    assert stripe_api.refunds == []
+    payment.refresh_from_db()
+    assert payment.status == Payment.StatusChoices.CANCELLED
+
+
+@pytest.mark.django_db
+def test_async_cancel_overlaps_stripe_calls(stripe_api, payment):
+    stripe_api.add_session('cs_1', status='complete', payment_status='paid', payment_intent='pi_1')
+    stripe_api.delay = 0.3
+    start = time.monotonic()
+    resp = Client().post(reverse('async-stripe-cancel'), {'payment_id': payment.id}, content_type='application/json')
+    elapsed = time.monotonic() - start
+
+    assert resp.status_code == 200
+    assert resp.json() == {'detail': 'Payment refunded and cancelled.'}
+    assert [refund['payment_intent'] for refund in stripe_api.refunds] == ['pi_1']
+    # Expire and retrieve run side by side, then the refund: two round trips, not three.
+    assert len(stripe_api.requests) == 3
+    assert elapsed < 0.85
+    payment.refresh_from_db()
+    assert payment.status == Payment.StatusChoices.CANCELLED
+
+
+@pytest.mark.django_db
+def test_async_cancel_returns_503_when_stripe_is_down(stripe_api, payment, settings):
+    settings.STRIPE_MAX_ATTEMPTS = 1
+    stripe_api.failures = {n: (500, {'error': {'type': 'api_error', 'message': 'Boom'}}) for n in (1, 2)}
+    resp = Client().post(reverse('async-stripe-cancel'), {'payment_id': payment.id}, content_type='application/json')
+    assert resp.status_code == 503
+    payment.refresh_from_db()
+    assert payment.status == Payment.StatusChoices.PENDING
@@ -0,0 +1,107 @@
+import threading
+import time
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.request import Request
+from rest_framework.renderers import JSONRenderer
+from books.cache import cached_catalog_response, get_catalog_version
+from books.models import Book
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def book(db):
+    return Book.objects.create(title='Book', author='Author', cover='HARD', inventory=3, daily_fee=2)
+
+
+@pytest.mark.django_db
+def test_list_served_from_cache(api_client, book):
+    first = api_client.get(reverse('book-list'))
+    assert first.status_code == 200
+    with CaptureQueriesContext(connection) as ctx:
+        second = api_client.get(reverse('book-list'))
+    assert len(ctx.captured_queries) == 0
+    assert second.data == first.data
+    assert second['ETag'] == first['ETag']
+
+
+@pytest.mark.django_db
+def test_if_none_match_returns_304(api_client, book):
+    url = reverse('book-detail', args=[book.id])
+    etag = api_client.get(url)['ETag']
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 304
+    assert resp['ETag'] == etag
+    assert not resp.content
+
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH='"stale"')
+    assert resp.status_code == 200
+
+
+@pytest.mark.django_db
+def test_missing_book_is_not_cached(api_client):
+    assert api_client.get(reverse('book-detail', args=[999])).status_code == 404
+    Book.objects.create(id=999, title='Late', author='A', cover='SOFT', inventory=1, daily_fee=1)
+    assert api_client.get(reverse('book-detail', args=[999])).status_code == 200
+
+
+@pytest.mark.django_db
+def test_save_bumps_version_and_invalidates(api_client, book, django_capture_on_commit_callbacks):
+    url = reverse('book-detail', args=[book.id])
+    etag = api_client.get(url)['ETag']
+    version = get_catalog_version()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        book.title = 'Renamed'
+        book.save()
+
+    assert get_catalog_version() == version + 1
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 200
+    assert resp.data['title'] == 'Renamed'
+
+
+@pytest.mark.django_db
+def test_inventory_change_invalidates(api_client, book, django_capture_on_commit_callbacks):
+    url = reverse('book-detail', args=[book.id])
+    assert api_client.get(url).data['inventory'] == 3
+    with django_capture_on_commit_callbacks(execute=True):
+        Book.objects.reserve(book)
+    assert api_client.get(url).data['inventory'] == 2
+
+
+def test_concurrent_misses_rebuild_once():
+    factory = APIRequestFactory()
+    calls = []
+    threads = 8
+    barrier = threading.Barrier(threads)
+    results = [None] * threads
+
+    def build():
+        calls.append(1)
+        time.sleep(0.2)
+        return Response({'hello': 'world'})
+
+    def target(i):
+        request = Request(factory.get('/api/books/'))
+        request.accepted_renderer = JSONRenderer()
+        barrier.wait()
+        results[i] = cached_catalog_response(request, 'list', build)
+
+    pool = [threading.Thread(target=target, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(r.status_code == 200 and r.data == {'hello': 'world'} for r in results)
+    assert len({r['ETag'] for r in results}) == 1
@@ -0,0 +1,128 @@
+import io
+import json
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from books.models import Book, InventoryShard
+
+User = get_user_model()
+
+CSV = (
+    "title,author,cover,inventory,daily_fee\n"
+    "Dune,Frank Herbert,HARD,4,1.50\n"
+    "Broken,,SOFT,-1,abc\n"
+    "Emma,Jane Austen,SOFT,2,0.75\n"
+)
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def admin(db):
+    return User.objects.create_superuser(email='admin@example.com', password='pass')
+
+
+def upload(api_client, name, content, **data):
+    url = reverse('book-import-books')
+    return api_client.post(url, {'file': SimpleUploadedFile(name, content.encode()), **data}, format='multipart')
+
+
+@pytest.mark.django_db
+def test_import_csv_reports_bad_rows_and_keeps_good_ones(api_client, admin):
+    api_client.force_authenticate(user=admin)
+    resp = upload(api_client, 'books.csv', CSV, chunk_size=2)
+    assert resp.status_code == 200
+    assert resp.data['created'] == 2
+    assert resp.data['error_count'] == 1
+    error = resp.data['errors'][0]
+    assert error['row'] == 3
+    assert set(error['errors']) == {'author', 'inventory', 'daily_fee'}
+    assert sorted(Book.objects.values_list('title', flat=True)) == ['Dune', 'Emma']
+
+
+@pytest.mark.django_db
+def test_import_jsonl_upserts_by_id(api_client, admin):
+    book = Book.objects.create(title='Old', author='A', cover='HARD', inventory=1, daily_fee=1)
+    lines = [
+        json.dumps({'id': book.id, 'title': 'New', 'author': 'A', 'cover': 'HARD', 'inventory': 7, 'daily_fee': '2.00'}),
+        json.dumps({'title': 'Fresh', 'author': 'B', 'cover': 'SOFT', 'inventory': 1, 'daily_fee': '1.00'}),
+        json.dumps({'id': 99999, 'title': 'Ghost', 'author': 'C', 'cover': 'SOFT', 'inventory': 1, 'daily_fee': '1.00'}),
+        'not json',
+    ]
+    api_client.force_authenticate(user=admin)
+    resp = upload(api_client, 'books.jsonl', '\n'.join(lines) + '\n')
+    assert resp.status_code == 200
+    assert (resp.data['created'], resp.data['updated'], resp.data['error_count']) == (1, 1, 2)
+    assert sorted(e['row'] for e in resp.data['errors']) == [3, 4]
+    book.refresh_from_db()
+    assert (book.title, book.inventory) == ('New', 7)
+
+
+@pytest.mark.django_db
+def test_import_respreads_sharded_inventory(api_client, admin):
+    book = Book.objects.create(title='Hot', author='A', cover='HARD', inventory=4, daily_fee=1, inventory_shards=2)
+    Book.objects.rebalance(book.pk)
+    api_client.force_authenticate(user=admin)
+    row = {'id': book.id, 'title': 'Hot', 'author': 'A', 'cover': 'HARD', 'inventory': 10, 'daily_fee': '1.00'}
+    resp = upload(api_client, 'books.ndjson', json.dumps(row))
+    assert resp.data['updated'] == 1
+    assert Book.objects.get(pk=book.pk).available_inventory == 10
+    assert list(InventoryShard.objects.filter(book=book).values_list('inventory', flat=True)) == [5, 5]
+
+
+@pytest.mark.django_db
+def test_import_streams_large_uploads_from_disk(api_client, admin, settings):
+    settings.FILE_UPLOAD_MAX_MEMORY_SIZE = 100
+    api_client.force_authenticate(user=admin)
+    content = "title,author,cover,inventory,daily_fee\n" + "".join(
+        f"Book {i},Author,HARD,1,1.00\n" for i in range(500)
+    )
+    resp = upload(api_client, 'books.csv', content, chunk_size=64)
+    assert resp.data['created'] == 500
+    assert Book.objects.count() == 500
+
+
+@pytest.mark.django_db
+def test_import_requires_admin(api_client):
+    user = User.objects.create_user(email='user@example.com', password='pass')
+    api_client.force_authenticate(user=user)
+    assert upload(api_client, 'books.csv', CSV).status_code == 403
+
+
+@pytest.mark.django_db
+def test_import_unknown_format(api_client, admin):
+    api_client.force_authenticate(user=admin)
+    resp = upload(api_client, 'books.txt', CSV)
+    assert resp.status_code == 400
+    assert 'file_format' in resp.data
+
+
+@pytest.mark.django_db
+def test_import_books_command(tmp_path):
+    path = tmp_path / 'books.csv'
+    path.write_text(CSV)
+    out, err = io.StringIO(), io.StringIO()
+    call_command('import_books', str(path), '--chunk-size', '1', stdout=out, stderr=err)
+    assert 'Created 2, updated 0, 1 rows rejected.' in out.getvalue()
+    assert err.getvalue().startswith('row 3:')
+    assert Book.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_import_stopped_by_bad_encoding_reports_what_was_written(api_client, admin):
+    api_client.force_authenticate(user=admin)
+    rows = ''.join(f'Book {n},Author,HARD,1,1.00\n' for n in range(1000))
+    content = 'title,author,cover,inventory,daily_fee\n'.encode() + rows.encode() + b'Bad \xff,Author,HARD,1,1.00\n'
+    url = reverse('book-import-books')
+    resp = api_client.post(
+        url, {'file': SimpleUploadedFile('books.csv', content), 'chunk_size': 100}, format='multipart'
+    )
+    assert resp.status_code == 400
+    assert 'UTF-8' in resp.data['detail']
+    assert 0 < resp.data['created'] == Book.objects.count() < 1000
@@ -0,0 +1,184 @@
+import asyncio
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.test import AsyncClient
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from books.models import Book
+from borrowing.models import Borrowing
+from payment.models import Payment
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email='user@example.com', password='pass')
+
+
+@pytest.fixture
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+@pytest.fixture
+def book(db):
+    return Book.objects.create(title='Book', author='Author', cover='HARD', inventory=5, daily_fee=2)
+
+
+def make_borrowing(user, book, days=4):
+    return Borrowing.objects.create(
+        borrow_date='2025-07-01', expected_return_date=f'2025-07-{1 + days:02d}', book=book, user=user
+    )
+
+
+@pytest.fixture
+def borrowing(user, book):
+    return make_borrowing(user, book)
+
+
+def checkout(api_client, borrowing, key=None):
+    headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+    return api_client.post(reverse('create-checkout-session'), {'borrowing_id': borrowing.id}, format='json',
+                           **headers)
+
+
+def stripe_creates(stripe_api):
+    return [r for r in stripe_api.requests if r[:2] == ('POST', '/v1/checkout/sessions')]
+
+
+@pytest.mark.django_db
+def test_repeated_checkout_reuses_open_session(stripe_api, api_client, borrowing):
+    first = checkout(api_client, borrowing)
+    second = checkout(api_client, borrowing)
+    assert first.status_code == second.status_code == 200
+    assert first.data == second.data
+    assert len(stripe_creates(stripe_api)) == 1
+    payment = Payment.objects.get()
+    assert payment.session_expires_at > timezone.now() + timedelta(minutes=55)
+    assert int(stripe_creates(stripe_api)[0][2]['expires_at']) == int(payment.session_expires_at.timestamp())
+
+
+@pytest.mark.django_db
+def test_session_close_to_expiry_or_for_another_amount_is_not_reused(stripe_api, api_client, borrowing):
+    checkout(api_client, borrowing)
+    Payment.objects.update(session_expires_at=timezone.now() + timedelta(minutes=2))
+    checkout(api_client, borrowing)
+    assert Payment.objects.count() == 2
+
+    Borrowing.objects.filter(pk=borrowing.pk).update(expected_return_date='2025-07-09')
+    resp = checkout(api_client, borrowing)
+    assert Payment.objects.get(pk=resp.data['payment_id']).money_to_pay == 16
+    assert len(stripe_creates(stripe_api)) == 3
+
+
+@pytest.mark.django_db
+def test_settled_payments_are_not_reused(stripe_api, api_client, borrowing):
+    checkout(api_client, borrowing)
+    Payment.objects.update(status=Payment.StatusChoices.CANCELLED)
+    checkout(api_client, borrowing)
+    assert len(stripe_creates(stripe_api)) == 2
+
+
+@pytest.mark.django_db
+def test_idempotency_key_replays_the_same_checkout(stripe_api, api_client, user, borrowing):
+    first = checkout(api_client, borrowing, key='abc')
+    # Even once the payment is no longer pending.
+    Payment.objects.update(status=Payment.StatusChoices.PAID)
+    second = checkout(api_client, borrowing, key='abc')
+    assert second.status_code == 200
+    assert second.data == first.data
+    assert len(stripe_creates(stripe_api)) == 1
+    assert Payment.objects.get().idempotency_key == f'{user.pk}:abc'
+    assert stripe_api.idempotency_keys == [f'checkout:{user.pk}:abc']
+
+
+@pytest.mark.django_db
+def test_retry_after_a_lost_reply_sends_stripe_the_same_request(stripe_api, api_client, borrowing, monkeypatch):
+    first = checkout(api_client, borrowing, key='abc')
+    # Stripe created the session, but the client never got the answer and
+    # no payment was saved; it retries a little later with the same key.
+    Payment.objects.all().delete()
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 30)
+    second = checkout(api_client, borrowing, key='abc')
+    assert second.status_code == 200
+    assert second.data['checkout_url'] == first.data['checkout_url']
+    first_params, second_params = (params for _, _, params in stripe_creates(stripe_api))
+    assert first_params == second_params
+    assert list(stripe_api.sessions) == ['cs_test_1']
+
+
+@pytest.mark.django_db
+def test_idempotency_key_is_scoped_to_the_borrowing_and_user(stripe_api, api_client, user, book, borrowing):
+    checkout(api_client, borrowing, key='abc')
+    resp = checkout(api_client, make_borrowing(user, book, days=2), key='abc')
+    assert resp.status_code == 409
+    assert len(stripe_creates(stripe_api)) == 1
+
+    other = User.objects.create_user(email='other@example.com', password='pass')
+    client = APIClient()
+    client.force_authenticate(user=other)
+    assert checkout(client, make_borrowing(other, book), key='abc').status_code == 200
+    assert len(stripe_creates(stripe_api)) == 2
+
+
+@pytest.mark.django_db
+def test_async_duplicates_collapse_into_one_stripe_call(stripe_api, user, borrowing):
+    stripe_api.delay = 0.2
+    headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+    url = reverse('async-create-checkout-session')
+
+    async def post_twice():
+        client = AsyncClient()
+        return await asyncio.gather(*(
+            client.post(url, {'borrowing_id': borrowing.id}, content_type='application/json', headers=headers)
+            for _ in range(2)
+        ))
+
+    first, second = async_to_sync(post_twice)()
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert len(stripe_creates(stripe_api)) == 1
+    assert Payment.objects.count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_duplicates_make_one_stripe_call(stripe_api, user, borrowing):
+    stripe_api.delay = 0.3
+    barrier = threading.Barrier(4)
+    responses = []
+
+    def post():
+        client = APIClient()
+        client.force_authenticate(user=user)
+        try:
+            barrier.wait()
+            while True:
+                try:
+                    responses.append(checkout(client, borrowing))
+                    break
+                except OperationalError:
+                    continue  # SQLite refused a concurrent writer; a client would retry.
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=post) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=20)
+    assert [resp.status_code for resp in responses] == [200] * 4
+    assert len({resp.data['payment_id'] for resp in responses}) == 1
+    assert len(stripe_creates(stripe_api)) == 1
+    assert Payment.objects.count() == 1
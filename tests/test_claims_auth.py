@@ -0,0 +1,116 @@
+from datetime import date
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from accounts.cache import local_users
+from books.models import Book
+from borrowing.models import Borrowing
+
+User = get_user_model()
+
+
+@pytest.fixture(autouse=True)
+def claims_auth(settings):
+    settings.JWT_CLAIMS_AUTH = True
+
+
+@pytest.fixture
+def staff(db):
+    return User.objects.create_user(email='staff@example.com', password='pass', is_staff=True)
+
+
+@pytest.fixture
+def borrowings(staff):
+    reader = User.objects.create_user(email='reader@example.com', password='pass')
+    book = Book.objects.create(title='Book', author='Author', cover='HARD', inventory=5, daily_fee=1)
+    return [
+        Borrowing.objects.create(borrow_date=date(2025, 7, 1), expected_return_date=date(2025, 7, 8),
+                                 book=book, user=user)
+        for user in (staff, reader)
+    ]
+
+
+def login(email):
+    resp = APIClient().post(reverse('token-obtain'), {'email': email, 'password': 'pass'}, format='json')
+    assert resp.status_code == 200
+    return resp.data
+
+
+def client_for(access):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+    return client
+
+
+def user_queries(queries):
+    return [q for q in queries.captured_queries if 'FROM "accounts_user"' in q['sql']]
+
+
+@pytest.mark.django_db
+def test_tokens_carry_user_claims(staff):
+    access = AccessToken(login('staff@example.com')['access'])
+    assert (access['email'], access['is_staff']) == ('staff@example.com', True)
+
+
+@pytest.mark.django_db
+def test_reads_do_not_load_the_user(borrowings):
+    client = client_for(login('staff@example.com')['access'])
+    with CaptureQueriesContext(connection) as queries:
+        assert len(client.get(reverse('borrowing-list')).data['results']) == 2
+        assert client.get(reverse('payment-list')).status_code == 200
+    assert user_queries(queries) == []
+
+    reader = client_for(login('reader@example.com')['access'])
+    with CaptureQueriesContext(connection) as queries:
+        results = reader.get(reverse('borrowing-list')).data['results']
+    assert [b['id'] for b in results] == [borrowings[1].id]
+    assert user_queries(queries) == []
+
+
+@pytest.mark.django_db
+def test_writes_and_the_default_mode_load_the_user(settings, borrowings):
+    client = client_for(login('reader@example.com')['access'])
+    with CaptureQueriesContext(connection) as queries:
+        client.post(reverse('borrowing-return-book', args=[borrowings[1].id]))
+    assert user_queries(queries)
+
+    settings.JWT_CLAIMS_AUTH = False
+    local_users.clear()
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+        client.get(reverse('payment-list'))
+    assert user_queries(queries)
+
+
+@pytest.mark.django_db
+def test_tokens_without_claims_still_work(borrowings, staff):
+    client = client_for(AccessToken.for_user(staff))
+    assert len(client.get(reverse('borrowing-list')).data['results']) == 2
+
+
+@pytest.mark.django_db
+def test_demotion_applies_from_the_next_refresh(borrowings, staff):
+    tokens = login('staff@example.com')
+    staff.is_staff = False
+    staff.save()
+
+    resp = APIClient().post(reverse('token-refresh'), {'refresh': tokens['refresh']}, format='json')
+    access = AccessToken(resp.data['access'])
+    assert access['is_staff'] is False
+    results = client_for(access).get(reverse('borrowing-list')).data['results']
+    assert [b['id'] for b in results] == [borrowings[0].id]
+
+
+@pytest.mark.django_db
+def test_refresh_rejects_deactivated_users(staff):
+    refresh = RefreshToken.for_user(staff)
+    staff.is_active = False
+    staff.save()
+    resp = APIClient().post(reverse('token-refresh'), {'refresh': str(refresh)}, format='json')
+    assert resp.status_code == 401
@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+POSTGRES = {'POSTGRES_DB': 'cinema', 'POSTGRES_USER': 'cinema', 'POSTGRES_PASSWORD': 'secret'}
+
+
+def load_settings(alias='default', **env):
+    """Import `src.settings` with `env` and print `DATABASES[alias]` as JSON."""
+    environ = {k: v for k, v in os.environ.items() if not k.startswith(('POSTGRES_', 'PROCESS_ROLE'))}
+    environ['POSTGRES_DB'] = ''  # Not taken from a local .env either.
+    code = f'import json, src.settings as s; print(json.dumps(s.DATABASES.get("{alias}"), default=str))'
+    return subprocess.run([sys.executable, '-c', code], env={**environ, **env}, capture_output=True, text=True)
+
+
+def database_settings(alias='default', **env):
+    """`DATABASES[alias]` as `src.settings` builds it from `env`."""
+    out = load_settings(alias, **env)
+    out.check_returncode()
+    return json.loads(out.stdout)
+
+
+def test_sqlite_without_postgres_settings():
+    assert database_settings()['ENGINE'] == 'django.db.backends.sqlite3'
+
+
+@pytest.mark.parametrize('role, sizes', [('web', (2, 8)), ('worker', (1, 4)), ('beat', (0, 1))])
+def test_postgres_pool_is_sized_per_process_role(role, sizes):
+    db = database_settings(**POSTGRES, PROCESS_ROLE=role)
+    assert (db['ENGINE'], db['NAME'], db['HOST']) == ('django.db.backends.postgresql', 'cinema', 'db')
+    assert db['CONN_HEALTH_CHECKS'] is True
+    assert 'CONN_MAX_AGE' not in db  # Django refuses persistent connections with a pool.
+    pool = db['OPTIONS']['pool']
+    assert (pool['min_size'], pool['max_size']) == sizes
+
+
+def test_unknown_process_role_is_refused():
+    out = load_settings(**POSTGRES, PROCESS_ROLE='wokrer')
+    assert out.returncode != 0
+    assert "ImproperlyConfigured: PROCESS_ROLE must be one of web, worker, beat, not 'wokrer'." in out.stderr
+
+
+def test_pool_size_overrides_and_persistent_connections_without_a_pool():
+    pool = database_settings(**POSTGRES, POSTGRES_POOL_MAX_SIZE='20')['OPTIONS']['pool']
+    assert (pool['min_size'], pool['max_size']) == (2, 20)
+
+    db = database_settings(**POSTGRES, POSTGRES_POOL='false', POSTGRES_CONN_MAX_AGE='300')
+    assert 'OPTIONS' not in db
+    assert (db['CONN_MAX_AGE'], db['CONN_HEALTH_CHECKS']) == (300, True)
+
+
+def test_replica_per_host_with_the_primary_settings():
+    env = {**POSTGRES, 'POSTGRES_REPLICA_HOSTS': 'replica-a, replica-b'}
+    first, second = database_settings('replica1', **env), database_settings('replica2', **env)
+    assert (first['HOST'], second['HOST']) == ('replica-a', 'replica-b')
+    assert first['NAME'] == 'cinema' and first['OPTIONS']['pool']['max_size'] == 8
+    assert first['TEST'] == {'MIRROR': 'default'}
+    assert database_settings('replica1', **POSTGRES) is None
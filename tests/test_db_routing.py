@@ -0,0 +1,110 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from books.models import Book
+from notifications.tasks import check_overdue_borrowings
+from src.db_routing import ReplicaRoutingMiddleware, replica_reads
+
+User = get_user_model()
+
+both_databases = pytest.mark.django_db(databases=['default', 'replica'])
+
+
+@pytest.fixture(autouse=True)
+def replica(settings):
+    settings.DATABASE_REPLICAS = ['replica']
+
+
+@pytest.fixture
+def user(db):
+    user = User.objects.create_user(email='user@example.com', password='pass')
+    # The replica knows the user but none of their borrowings.
+    User.objects.using('replica').bulk_create([User(id=user.id, email=user.email)])
+    return user
+
+
+def client_for(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    return client
+
+
+@both_databases
+def test_safe_requests_read_from_the_replica():
+    Book.objects.using('replica').bulk_create([
+        Book(title='Only on the replica', author='Author', cover='HARD', inventory=1, daily_fee=1),
+    ])
+    resp = APIClient().get(reverse('book-list'))
+    assert [b['title'] for b in resp.data['results']] == ['Only on the replica']
+
+
+@both_databases
+def test_writer_reads_own_writes_until_the_pin_expires(user):
+    book = Book.objects.create(title='Book', author='Author', cover='HARD', inventory=3, daily_fee=1)
+    client = client_for(user)
+    resp = client.post(reverse('borrowing-list'), {
+        'book': book.id, 'borrow_date': '2025-07-01', 'expected_return_date': '2025-07-08',
+    }, format='json')
+    assert resp.status_code == 201
+
+    assert [b['id'] for b in client.get(reverse('borrowing-list')).data['results']] == [resp.data['id']]
+    other = User.objects.create_user(email='other@example.com', password='pass')
+    User.objects.using('replica').bulk_create([User(id=other.id, email=other.email)])
+    with CaptureQueriesContext(connections['replica']) as queries:
+        client_for(other).get(reverse('borrowing-list'))
+    assert queries.captured_queries
+
+    cache.clear()  # The pin has expired.
+    assert client.get(reverse('borrowing-list')).data['results'] == []
+
+
+@both_databases
+def test_failed_writes_do_not_pin(user):
+    client = client_for(user)
+    assert client.post(reverse('borrowing-list'), {}, format='json').status_code == 400
+    with CaptureQueriesContext(connections['replica']) as queries:
+        client.get(reverse('borrowing-list'))
+    assert queries.captured_queries
+
+
+@both_databases
+def test_request_reads_in_a_transaction_and_unsafe_requests_use_the_primary():
+    seen = []
+
+    def view(request):
+        seen.append(router.db_for_read(Book))
+        with transaction.atomic():
+            seen.append(router.db_for_read(Book))
+        return HttpResponse()
+
+    ReplicaRoutingMiddleware(view)(RequestFactory().get('/'))
+    ReplicaRoutingMiddleware(view)(RequestFactory().post('/'))
+    assert seen == ['replica', 'default', 'default', 'default']
+    assert router.db_for_read(Book) == 'default'
+    assert router.db_for_write(Book) == 'default'
+
+
+@both_databases
+def test_tasks_opt_in_to_replica_reads():
+    with transaction.atomic(), replica_reads():
+        assert router.db_for_read(Book) == 'replica'
+
+    with CaptureQueriesContext(connections['replica']) as replica_queries, \
+            CaptureQueriesContext(connections['default']) as primary_queries:
+        check_overdue_borrowings()
+    assert ['borrowing_borrowing' in q['sql'] for q in replica_queries.captured_queries] == [True]
+    assert all('borrowing_borrowing' not in q['sql'] for q in primary_queries.captured_queries)
+
+
+@pytest.mark.django_db
+def test_everything_uses_the_primary_without_replicas(settings):
+    settings.DATABASE_REPLICAS = []
+    with replica_reads():
+        assert router.db_for_read(Book) == 'default'
@@ -0,0 +1,162 @@
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import pytest
+from datetime import date
+from django.urls import reverse
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from books.models import Book
+from borrowing.models import Borrowing
+from payment.models import Payment
+
+User = get_user_model()
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def book(db):
+    return Book.objects.create(title='Book', author='Author', cover='HARD', inventory=3, daily_fee=2)
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email='user@example.com', password='pass')
+
+
+@pytest.fixture
+def other(db):
+    return User.objects.create_user(email='other@example.com', password='pass')
+
+
+@pytest.fixture
+def borrowings(book, user, other):
+    mine = Borrowing.objects.create(
+        borrow_date=date(2025, 7, 1), expected_return_date=date(2025, 7, 5), book=book, user=user
+    )
+    theirs = Borrowing.objects.create(
+        borrow_date=date(2025, 7, 2), expected_return_date=date(2025, 7, 6),
+        actual_return_date=date(2025, 7, 3), book=book, user=other
+    )
+    Payment.objects.create(
+        borrowing=mine, session_id='cs_1', session_url='https://example.com', money_to_pay='8.00',
+        type=Payment.TypeChoices.PAYMENT, status=Payment.StatusChoices.PAID,
+    )
+    Payment.objects.create(
+        borrowing=theirs, session_id='cs_2', session_url='https://example.com', money_to_pay='2.00',
+        type=Payment.TypeChoices.PAYMENT, status=Payment.StatusChoices.PENDING,
+    )
+    return mine, theirs
+
+
+def export(api_client, url_name, export_format, **params):
+    resp = api_client.get(reverse(url_name, kwargs={'export_format': export_format}), params)
+    assert resp.status_code == 200
+    assert resp.streaming
+    return b''.join(resp.streaming_content).decode()
+
+
+@pytest.mark.django_db
+def test_borrowing_ndjson_export_is_scoped_to_user(api_client, borrowings, user):
+    api_client.force_authenticate(user=user)
+    rows = [json.loads(line) for line in export(api_client, 'borrowing-export', 'ndjson').splitlines()]
+    assert rows == [{
+        'id': borrowings[0].id,
+        'user_id': user.id,
+        'user_email': 'user@example.com',
+        'book_id': borrowings[0].book_id,
+        'book_title': 'Book',
+        'borrow_date': '2025-07-01',
+        'expected_return_date': '2025-07-05',
+        'actual_return_date': None,
+    }]
+
+
+@pytest.mark.django_db
+def test_borrowing_csv_export_for_staff_honours_filters(api_client, borrowings):
+    staff = User.objects.create_superuser(email='staff@example.com', password='pass')
+    api_client.force_authenticate(user=staff)
+    rows = list(csv.DictReader(io.StringIO(export(api_client, 'borrowing-export', 'csv'))))
+    assert [int(r['id']) for r in rows] == [b.id for b in borrowings]
+
+    rows = list(csv.DictReader(io.StringIO(export(api_client, 'borrowing-export', 'csv', is_active='false'))))
+    assert [r['actual_return_date'] for r in rows] == ['2025-07-03']
+
+
+@pytest.mark.django_db
+def test_payment_export(api_client, borrowings, user):
+    api_client.force_authenticate(user=user)
+    rows = list(csv.DictReader(io.StringIO(export(api_client, 'payment-export', 'csv'))))
+    assert len(rows) == 1
+    assert rows[0]['session_id'] == 'cs_1'
+    assert rows[0]['money_to_pay'] == '8.00'
+    assert rows[0]['status'] == 'PAID'
+
+
+@pytest.mark.django_db
+def test_export_requires_authentication(api_client):
+    resp = api_client.get(reverse('payment-export', kwargs={'export_format': 'csv'}), HTTP_ACCEPT='text/csv')
+    assert resp.status_code == 401
+
+
+# Runs in a fresh interpreter, whose peak RSS is only what setting up a test
+# database and this one export needed; in the test process it would be the
+# highest peak of any earlier test.
+EXPORT_MILLION_ROWS = textwrap.dedent("""
+    import resource, sys
+    import django
+    django.setup()
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from books.models import Book
+    from accounts.models import User
+    from borrowing.models import Borrowing
+
+    rows = 1_000_000
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    book = Book.objects.create(title='Book', author='Author', cover='HARD', inventory=3, daily_fee=2)
+    user = User.objects.create_user(email='user@example.com', password='pass')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {Borrowing._meta.db_table} '
+            '(borrow_date, expected_return_date, actual_return_date, book_id, user_id) '
+            'WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s) '
+            "SELECT '2025-07-01', '2025-07-05', NULL, %s, %s FROM seq",
+            [rows, book.id, user.id],
+        )
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    def peak_rss():
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+    baseline = peak_rss()
+    resp = client.get(reverse('borrowing-export', kwargs={'export_format': 'ndjson'}))
+    lines = 0
+    for chunk in resp.streaming_content:
+        lines += chunk.count(b'\\n')
+    print(lines, peak_rss() - baseline)
+""")
+
+
+def test_export_million_rows_with_bounded_memory():
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'tests.settings'}
+    out = subprocess.run([sys.executable, '-c', EXPORT_MILLION_ROWS], env=env, capture_output=True, text=True)
+    assert out.returncode == 0, out.stderr
+    lines, growth = map(int, out.stdout.split())
+
+    assert lines == 1_000_000
+    # A materialised export of this size needs several hundred MB.
+    assert growth < 64 * 1024 * 1024, f'peak RSS grew by {growth / 2**20:.0f} MiB'
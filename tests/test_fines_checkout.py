@@ -0,0 +1,276 @@
+import threading
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from books.models import Book
+from borrowing.models import Borrowing
+from notifications.models import OutboxEvent
+from payment.gateway import StripeGateway
+from payment.models import Payment
+from payment.tasks import apply_stripe_events, reconcile_stripe_sessions
+from tests.test_stripe_webhooks import completed, make_event, post_event, webhook_secret  # noqa: F401
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email='user@example.com', password='pass')
+
+
+@pytest.fixture
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+def add_fine(user, title, amount):
+    book = Book.objects.create(title=title, author='Author', cover='HARD', inventory=5, daily_fee=1)
+    borrowing = Borrowing.objects.create(
+        borrow_date='2025-07-01', expected_return_date='2025-07-05', actual_return_date='2025-07-08',
+        book=book, user=user,
+    )
+    return Payment.objects.create(
+        borrowing=borrowing, session_id='', session_url='', money_to_pay=amount,
+        type=Payment.TypeChoices.FINE, status=Payment.StatusChoices.PENDING,
+    )
+
+
+@pytest.fixture
+def fines(user):
+    return [add_fine(user, 'Dune', '6.00'), add_fine(user, 'Emma', '4.50')]
+
+
+def checkout_fines(api_client):
+    return api_client.post(reverse('fines-checkout'))
+
+
+def stripe_creates(stripe_api):
+    return [r for r in stripe_api.requests if r[:2] == ('POST', '/v1/checkout/sessions')]
+
+
+@pytest.mark.django_db
+def test_one_session_with_a_line_item_per_fine(stripe_api, api_client, fines):
+    resp = checkout_fines(api_client)
+    assert resp.status_code == 200
+    assert resp.data['payment_ids'] == [fine.id for fine in fines]
+    assert resp.data['total'] == '10.50'
+
+    [(_, _, params)] = stripe_creates(stripe_api)
+    assert params['line_items[0][price_data][product_data][name]'] == 'Late return fine: Dune'
+    assert params['line_items[0][price_data][unit_amount]'] == '600'
+    assert params['line_items[1][price_data][unit_amount]'] == '450'
+    assert 'line_items[2][quantity]' not in params
+    assert {p.session_url for p in Payment.objects.all()} == {resp.data['checkout_url']}
+
+
+@pytest.mark.django_db
+def test_open_session_is_reused(stripe_api, api_client, fines):
+    first = checkout_fines(api_client)
+    second = checkout_fines(api_client)
+    assert first.data == second.data
+    assert len(stripe_creates(stripe_api)) == 1
+
+
+@pytest.mark.django_db
+def test_new_fine_replaces_the_open_session(stripe_api, api_client, user, fines):
+    first = checkout_fines(api_client)
+    old_session = Payment.objects.get(pk=fines[0].pk).session_id
+    add_fine(user, 'Ulysses', '2.00')
+
+    second = checkout_fines(api_client)
+    assert second.data['checkout_url'] != first.data['checkout_url']
+    assert second.data['total'] == '12.50'
+    assert stripe_api.sessions[old_session]['status'] == 'expired'
+    assert Payment.objects.values('session_id').distinct().count() == 1
+
+
+@pytest.mark.django_db
+def test_paid_session_is_not_replaced_by_a_new_fine(stripe_api, api_client, user, fines):
+    checkout_fines(api_client)
+    old_session = Payment.objects.get(pk=fines[0].pk).session_id
+    # The user paid, but the webhook hasn't arrived when the next fine does.
+    stripe_api.sessions[old_session].update(status='complete', payment_status='paid')
+    new_fine = add_fine(user, 'Ulysses', '2.00')
+
+    resp = checkout_fines(api_client)
+    assert resp.status_code == 409
+    assert len(stripe_creates(stripe_api)) == 1
+    assert list(Payment.objects.filter(pk__in=[f.pk for f in fines]).values_list('session_id', flat=True)) == [
+        old_session, old_session,
+    ]
+
+    # The webhook still finds the fines it paid; the new fine then gets its own session.
+    post_event(APIClient(), completed('evt_1', old_session))
+    apply_stripe_events()
+    assert set(Payment.objects.filter(pk__in=[f.pk for f in fines]).values_list('status', flat=True)) == {
+        Payment.StatusChoices.PAID,
+    }
+    resp = checkout_fines(api_client)
+    assert resp.status_code == 200
+    assert resp.data['payment_ids'] == [new_fine.pk]
+
+
+@pytest.mark.django_db
+def test_replacement_waits_for_stripe(stripe_api, api_client, user, fines):
+    checkout_fines(api_client)
+    old_session = Payment.objects.get(pk=fines[0].pk).session_id
+    add_fine(user, 'Ulysses', '2.00')
+    stripe_api.failures[2] = (500, {'error': {'type': 'api_error', 'message': 'Down.'}})
+    stripe_api.failures.update({n: stripe_api.failures[2] for n in range(3, 10)})
+
+    assert checkout_fines(api_client).status_code == 503
+    assert stripe_api.sessions[old_session]['status'] == 'open'
+    assert Payment.objects.get(pk=fines[0].pk).session_id == old_session
+
+
+@pytest.mark.django_db
+def test_fine_settled_during_checkout_is_not_given_the_new_session(stripe_api, api_client, fines, monkeypatch):
+    create = StripeGateway.create_checkout_session
+
+    def create_while_a_fine_is_cancelled(self, *args, **kwargs):
+        session = create(self, *args, **kwargs)
+        Payment.objects.filter(pk=fines[0].pk).update(status=Payment.StatusChoices.CANCELLED)
+        return session
+
+    monkeypatch.setattr(StripeGateway, 'create_checkout_session', create_while_a_fine_is_cancelled)
+    resp = checkout_fines(api_client)
+    assert resp.status_code == 409
+    assert [session['status'] for session in stripe_api.sessions.values()] == ['expired']
+    assert set(Payment.objects.values_list('session_id', flat=True)) == {''}
+
+    monkeypatch.setattr(StripeGateway, 'create_checkout_session', create)
+    resp = checkout_fines(api_client)
+    assert resp.status_code == 200
+    assert resp.data['payment_ids'] == [fines[1].pk]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_requests_share_one_session(stripe_api, user, fines):
+    stripe_api.delay = 0.3
+    barrier = threading.Barrier(4)
+    responses = []
+
+    def post():
+        client = APIClient()
+        client.force_authenticate(user=user)
+        try:
+            barrier.wait()
+            while True:
+                try:
+                    responses.append(checkout_fines(client))
+                    break
+                except OperationalError:
+                    continue  # SQLite refused a concurrent writer; a client would retry.
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=post) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=20)
+    assert [resp.status_code for resp in responses] == [200] * 4
+    assert len({resp.data['checkout_url'] for resp in responses}) == 1
+    assert len(stripe_creates(stripe_api)) == 1
+
+
+@pytest.mark.django_db
+def test_session_close_to_expiry_is_not_reused(stripe_api, api_client, fines):
+    checkout_fines(api_client)
+    Payment.objects.update(session_expires_at=timezone.now() + timedelta(minutes=2))
+    checkout_fines(api_client)
+    assert len(stripe_creates(stripe_api)) == 2
+
+
+@pytest.mark.django_db
+def test_no_pending_fines(stripe_api, api_client, user):
+    fine = add_fine(user, 'Dune', '6.00')
+    Payment.objects.filter(pk=fine.pk).update(status=Payment.StatusChoices.PAID)
+    assert checkout_fines(api_client).status_code == 404
+    assert stripe_api.requests == []
+
+
+@pytest.mark.django_db
+def test_completed_session_pays_every_fine_at_once(stripe_api, api_client, user, fines):
+    checkout_fines(api_client)
+    session_id = Payment.objects.values_list('session_id', flat=True).first()
+    post_event(APIClient(), completed('evt_1', session_id))
+
+    with CaptureQueriesContext(connection) as queries:
+        apply_stripe_events()
+    updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "payment_payment"')]
+    assert len(updates) == 1
+    assert set(Payment.objects.values_list('status', flat=True)) == {Payment.StatusChoices.PAID}
+    assert OutboxEvent.objects.filter(kind=OutboxEvent.KindChoices.PAYMENT_PAID).count() == len(fines)
+
+
+@pytest.mark.django_db
+def test_expired_session_leaves_the_fines_owed(stripe_api, api_client, fines):
+    first = checkout_fines(api_client)
+    session_id = Payment.objects.values_list('session_id', flat=True).first()
+    stripe_api.sessions[session_id]['status'] = 'expired'
+    post_event(APIClient(), make_event('evt_1', 'checkout.session.expired', {
+        'id': session_id, 'object': 'checkout.session',
+    }))
+    apply_stripe_events()
+    assert set(Payment.objects.values_list('status', 'session_id', 'session_expires_at')) == {
+        (Payment.StatusChoices.PENDING, '', None),
+    }
+
+    second = checkout_fines(api_client)
+    assert second.status_code == 200
+    assert second.data['payment_ids'] == first.data['payment_ids']
+    assert second.data['checkout_url'] != first.data['checkout_url']
+
+
+@pytest.mark.django_db
+def test_reconciled_expiry_leaves_the_fines_owed(stripe_api, api_client, fines):
+    checkout_fines(api_client)
+    session_id = Payment.objects.values_list('session_id', flat=True).first()
+    stripe_api.sessions[session_id]['status'] = 'expired'
+    assert reconcile_stripe_sessions() == len(fines)
+    assert set(Payment.objects.values_list('status', 'session_id')) == {(Payment.StatusChoices.PENDING, '')}
+    assert checkout_fines(api_client).status_code == 200
+
+
+def cancel(fine, url_name='stripe-cancel'):
+    return Client().post(reverse(url_name), {'payment_id': fine.pk}, content_type='application/json')
+
+
+@pytest.mark.django_db
+def test_cancelling_one_fine_lets_the_others_go_of_the_session(stripe_api, api_client, fines):
+    first = checkout_fines(api_client)
+    session_id = Payment.objects.values_list('session_id', flat=True).first()
+
+    assert cancel(fines[0]).status_code == 200
+    assert stripe_api.sessions[session_id]['status'] == 'expired'
+    assert Payment.objects.get(pk=fines[0].pk).status == Payment.StatusChoices.CANCELLED
+    other = Payment.objects.get(pk=fines[1].pk)
+    assert (other.status, other.session_id, other.session_expires_at) == (Payment.StatusChoices.PENDING, '', None)
+
+    second = checkout_fines(api_client)
+    assert second.data['payment_ids'] == [fines[1].pk]
+    assert second.data['checkout_url'] != first.data['checkout_url']
+
+
+@pytest.mark.parametrize('url_name', ['stripe-cancel', 'async-stripe-cancel'])
+@pytest.mark.django_db
+def test_refunding_a_fines_checkout_cancels_every_fine_it_paid(stripe_api, api_client, fines, url_name):
+    checkout_fines(api_client)
+    session_id = Payment.objects.values_list('session_id', flat=True).first()
+    stripe_api.sessions[session_id].update(status='complete', payment_status='paid', payment_intent='pi_1')
+    stripe_api.intents['pi_1'] = {'id': 'pi_1', 'object': 'payment_intent', 'latest_charge': 'ch_1'}
+    Payment.objects.update(status=Payment.StatusChoices.PAID)
+
+    assert cancel(fines[0], url_name).status_code == 200
+    assert len(stripe_api.refunds) == 1
+    assert set(Payment.objects.values_list('status', flat=True)) == {Payment.StatusChoices.CANCELLED}
@@ -0,0 +1,81 @@
+import threading
+import pytest
+from django.db import connection, OperationalError
+from django.urls import reverse
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from books.models import Book
+from borrowing.models import Borrowing
+
+User = get_user_model()
+
+INVENTORY = 5
+WORKERS = 16
+
+
+def run_concurrently(worker, args):
+    barrier = threading.Barrier(len(args))
+    results = [None] * len(args)
+
+    def target(i):
+        try:
+            barrier.wait()
+            # SQLite may refuse a writer while another holds the lock; a
+            # client would simply retry.
+            while True:
+                try:
+                    results[i] = worker(args[i])
+                    break
+                except OperationalError:
+                    continue
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(len(args))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def borrow(user_and_book):
+    user, book = user_and_book
+    client = APIClient()
+    client.force_authenticate(user=user)
+    resp = client.post(reverse('borrowing-list'), {
+        'book': book.id,
+        'borrow_date': '2025-07-01',
+        'expected_return_date': '2025-07-10',
+    }, format='json')
+    return resp.status_code
+
+
+def give_back(borrowing):
+    client = APIClient()
+    client.force_authenticate(user=borrowing.user)
+    resp = client.post(reverse('borrowing-return-book', args=[borrowing.id]))
+    return resp.status_code
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_borrow_and_return_never_loses_inventory():
+    book = Book.objects.create(title='Hot', author='Author', cover='HARD', inventory=INVENTORY, daily_fee=1)
+    users = [User.objects.create_user(email=f'u{i}@example.com', password='pass') for i in range(WORKERS)]
+
+    statuses = run_concurrently(borrow, [(user, book) for user in users])
+
+    book.refresh_from_db()
+    created = Borrowing.objects.filter(book=book).count()
+    assert set(statuses) <= {201, 400}
+    assert statuses.count(201) <= created == INVENTORY
+    assert book.inventory == 0
+
+    borrowings = list(Borrowing.objects.select_related('user').filter(book=book))
+    # Every borrowing is returned twice at once; only one return may count.
+    statuses = run_concurrently(give_back, borrowings + borrowings)
+
+    book.refresh_from_db()
+    assert set(statuses) <= {200, 400}
+    assert not Borrowing.objects.filter(book=book, actual_return_date__isnull=True).exists()
+    assert book.inventory == INVENTORY
@@ -0,0 +1,123 @@
+import pytest
+from django.urls import reverse
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from books.models import Book, InventoryShard
+from books.tasks import consolidate_inventory_shards
+
+User = get_user_model()
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def admin(db):
+    return User.objects.create_superuser(email='admin@example.com', password='pass')
+
+
+@pytest.fixture
+def sharded_book(db):
+    book = Book.objects.create(
+        title='Blockbuster',
+        author='Author',
+        cover='HARD',
+        inventory=10,
+        daily_fee=1,
+        inventory_shards=4,
+    )
+    Book.objects.rebalance(book.pk)
+    book.refresh_from_db()
+    return book
+
+
+def shard_counts(book):
+    return list(InventoryShard.objects.filter(book=book).order_by('index').values_list('inventory', flat=True))
+
+
+@pytest.mark.django_db
+def test_rebalance_spreads_inventory_over_shards(sharded_book):
+    assert sharded_book.inventory == 0
+    assert shard_counts(sharded_book) == [3, 3, 2, 2]
+    assert sharded_book.available_inventory == 10
+
+
+@pytest.mark.django_db
+def test_reserve_falls_back_to_other_shards(sharded_book):
+    InventoryShard.objects.filter(book=sharded_book).update(inventory=0)
+    InventoryShard.objects.filter(book=sharded_book, index=3).update(inventory=2)
+
+    assert Book.objects.reserve(sharded_book)
+    assert Book.objects.reserve(sharded_book)
+    assert not Book.objects.reserve(sharded_book)
+    assert shard_counts(sharded_book) == [0, 0, 0, 0]
+
+
+@pytest.mark.django_db
+def test_reserve_and_release_keep_total(sharded_book):
+    for _ in range(10):
+        assert Book.objects.reserve(sharded_book)
+    assert not Book.objects.reserve(sharded_book)
+    for _ in range(4):
+        Book.objects.release(sharded_book)
+    assert Book.objects.get(pk=sharded_book.pk).available_inventory == 4
+
+
+@pytest.mark.django_db
+def test_consolidation_task_rebalances_and_folds_back(sharded_book):
+    for _ in range(3):
+        Book.objects.release(sharded_book)
+    InventoryShard.objects.filter(book=sharded_book, index=0).update(inventory=13)
+    InventoryShard.objects.filter(book=sharded_book).exclude(index=0).update(inventory=0)
+
+    consolidate_inventory_shards()
+    assert shard_counts(sharded_book) == [4, 3, 3, 3]
+
+    Book.objects.filter(pk=sharded_book.pk).update(inventory_shards=0)
+    consolidate_inventory_shards()
+    sharded_book.refresh_from_db()
+    assert sharded_book.inventory == 13
+    assert shard_counts(sharded_book) == []
+
+
+@pytest.mark.django_db
+def test_serializer_exposes_single_inventory(api_client, sharded_book):
+    resp = api_client.get(reverse('book-detail', args=[sharded_book.id]))
+    assert resp.status_code == 200
+    assert resp.data['inventory'] == 10
+    assert 'inventory_shards' not in resp.data
+
+
+@pytest.mark.django_db
+def test_admin_can_enable_sharding_and_set_total(api_client, admin):
+    api_client.force_authenticate(user=admin)
+    book = Book.objects.create(title='T', author='A', cover='SOFT', inventory=6, daily_fee=1)
+    url = reverse('book-detail', args=[book.id])
+
+    resp = api_client.patch(url, {'inventory_shards': 3}, format='json')
+    assert resp.status_code == 200
+    assert resp.data['inventory'] == 6
+    assert shard_counts(book) == [2, 2, 2]
+
+    resp = api_client.patch(url, {'inventory': 9}, format='json')
+    assert resp.data['inventory'] == 9
+    assert shard_counts(book) == [3, 3, 3]
+
+
+@pytest.mark.django_db
+def test_borrowing_a_sharded_book(api_client, sharded_book):
+    user = User.objects.create_user(email='reader@example.com', password='pass')
+    api_client.force_authenticate(user=user)
+    resp = api_client.post(reverse('borrowing-list'), {
+        'book': sharded_book.id,
+        'borrow_date': '2025-07-01',
+        'expected_return_date': '2025-07-10',
+    }, format='json')
+    assert resp.status_code == 201
+    assert sum(shard_counts(sharded_book)) == 9
+
+    resp = api_client.post(reverse('borrowing-return-book', args=[resp.data['id']]))
+    assert resp.status_code == 200
+    assert sum(shard_counts(sharded_book)) == 10
@@ -0,0 +1,140 @@
+import pytest
+from datetime import date, timedelta
+from django.urls import reverse
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from books.models import Book
+from borrowing.models import Borrowing
+from notifications import tasks
+from notifications.models import OutboxEvent
+from payment.models import Payment
+
+User = get_user_model()
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email='user@example.com', password='pass')
+
+
+@pytest.fixture
+def book(db):
+    return Book.objects.create(title='Book', author='Author', cover='HARD', inventory=1, daily_fee=2)
+
+
+@pytest.fixture
+def published(monkeypatch):
+    """Record what the dispatcher publishes instead of talking to a broker."""
+    calls = []
+    for task in (tasks.notify_new_borrowing, tasks.notify_payment_success):
+        monkeypatch.setattr(task, 'apply_async', lambda kwargs, name=task.name: calls.append((name, kwargs)))
+    return calls
+
+
+def borrow(api_client, book):
+    today = timezone.now().date()
+    return api_client.post(reverse('borrowing-list'), {
+        'book': book.id,
+        'borrow_date': today,
+        'expected_return_date': today + timedelta(days=3),
+    })
+
+
+@pytest.mark.django_db
+def test_borrowing_writes_outbox_event_without_publishing(api_client, user, book, published):
+    api_client.force_authenticate(user=user)
+    resp = borrow(api_client, book)
+    assert resp.status_code == 201
+    event = OutboxEvent.objects.get()
+    assert event.kind == OutboxEvent.KindChoices.BORROWING_CREATED
+    assert event.payload == {'borrowing_id': resp.data['id']}
+    assert event.published_at is None
+    assert published == []
+
+
+@pytest.mark.django_db
+def test_rolled_back_borrowing_leaves_no_event(api_client, user, book, published, monkeypatch):
+    # The borrowing row and its event are written, then the reservation loses a race.
+    monkeypatch.setattr(Book.objects, 'reserve', lambda book: False)
+    api_client.force_authenticate(user=user)
+    resp = borrow(api_client, book)
+    assert resp.status_code == 400
+    assert not Borrowing.objects.exists()
+    assert not OutboxEvent.objects.exists()
+
+
+@pytest.mark.django_db
+def test_paid_payment_is_enqueued_once(user, book):
+    borrowing = Borrowing.objects.create(
+        borrow_date=date(2025, 7, 1), expected_return_date=date(2025, 7, 5), book=book, user=user
+    )
+    payment = Payment.objects.create(
+        borrowing=borrowing, session_id='cs_1', session_url='https://example.com', money_to_pay='8.00',
+        type=Payment.TypeChoices.PAYMENT, status=Payment.StatusChoices.PENDING,
+    )
+    assert not OutboxEvent.objects.filter(kind=OutboxEvent.KindChoices.PAYMENT_PAID).exists()
+    payment.status = Payment.StatusChoices.PAID
+    payment.save()
+    payment.save()
+    assert list(OutboxEvent.objects.filter(kind=OutboxEvent.KindChoices.PAYMENT_PAID).values_list(
+        'idempotency_key', flat=True)) == [f'payment-paid:{payment.id}']
+
+
+@pytest.mark.django_db
+def test_dispatcher_drains_in_batches(user, book, published, settings):
+    settings.OUTBOX_BATCH_SIZE = 2
+    borrowings = [
+        Borrowing.objects.create(
+            borrow_date=date(2025, 7, 1), expected_return_date=date(2025, 7, 5), book=book, user=user
+        )
+        for _ in range(5)
+    ]
+    assert tasks.dispatch_outbox() == 5
+    assert published == [
+        ('notifications.tasks.notify_new_borrowing', {'borrowing_id': b.id}) for b in borrowings
+    ]
+    assert not OutboxEvent.objects.filter(published_at__isnull=True).exists()
+    assert tasks.dispatch_outbox() == 0
+    assert len(published) == 5
+
+
+@pytest.mark.django_db
+def test_dispatcher_keeps_unsent_events_when_broker_fails(user, book, monkeypatch):
+    for _ in range(3):
+        Borrowing.objects.create(
+            borrow_date=date(2025, 7, 1), expected_return_date=date(2025, 7, 5), book=book, user=user
+        )
+    calls = []
+
+    def flaky(kwargs):
+        if len(calls) == 2:
+            raise OperationalError('broker down')
+        calls.append(kwargs)
+
+    monkeypatch.setattr(tasks.notify_new_borrowing, 'apply_async', flaky)
+    with pytest.raises(OperationalError):
+        tasks.dispatch_outbox()
+    assert OutboxEvent.objects.filter(published_at__isnull=True).count() == 1
+
+    monkeypatch.setattr(tasks.notify_new_borrowing, 'apply_async', lambda kwargs: calls.append(kwargs))
+    assert tasks.dispatch_outbox() == 1
+    assert len(calls) == 3
+
+
+@pytest.mark.django_db
+def test_purge_keeps_recent_and_unpublished_events(settings):
+    now = timezone.now()
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(kind='borrowing_created', idempotency_key='old', payload={}, published_at=now - timedelta(days=30)),
+        OutboxEvent(kind='borrowing_created', idempotency_key='recent', payload={}, published_at=now),
+        OutboxEvent(kind='borrowing_created', idempotency_key='pending', payload={}),
+    ])
+    tasks.purge_outbox()
+    assert sorted(OutboxEvent.objects.values_list('idempotency_key', flat=True)) == ['pending', 'recent']
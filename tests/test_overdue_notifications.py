@@ -0,0 +1,219 @@
+import time
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from books.models import Book
+from borrowing.models import Borrowing
+from notifications.models import OverdueReminder, OverdueScan
+from notifications.tasks import check_overdue_borrowings, notify_overdue_chunk, send_overdue_digest
+from notifications.sender import send_message
+from notifications.telegram import MAX_MESSAGE_LENGTH, split_message
+from src.celery import app
+
+User = get_user_model()
+
+
+@pytest.fixture
+def eager_celery():
+    app.conf.task_always_eager = True
+    yield
+    app.conf.task_always_eager = False
+
+
+@pytest.fixture
+def overdue(db):
+    user = User.objects.create_user(email='late@example.com', password='pass')
+    book = Book.objects.create(title='Book', author='Author', cover='HARD', inventory=100, daily_fee=1)
+    today = timezone.now().date()
+    rows = [
+        Borrowing(borrow_date=today - timedelta(days=20), expected_return_date=today - timedelta(days=1 + i % 5),
+                  book=book, user=user)
+        for i in range(25)
+    ]
+    # Not overdue: returned, and due today.
+    rows.append(Borrowing(borrow_date=today - timedelta(days=20), expected_return_date=today - timedelta(days=3),
+                          actual_return_date=today, book=book, user=user))
+    rows.append(Borrowing(borrow_date=today - timedelta(days=2), expected_return_date=today, book=book, user=user))
+    return Borrowing.objects.bulk_create(rows)
+
+
+def digest_lines(messages):
+    return [line for _, body in messages for line in body['text'].splitlines()[1:]]
+
+
+@pytest.mark.django_db
+def test_overdue_scan_sends_one_digest_per_chunk(telegram, eager_celery, overdue, settings):
+    settings.OVERDUE_CHUNK_SIZE = 10
+    check_overdue_borrowings()
+
+    assert len(telegram.messages) == 3
+    path, body = telegram.messages[0]
+    assert path == '/bottoken/sendMessage'
+    assert body['chat_id'] == '42'
+    assert body['text'].startswith('Overdue borrowings (10):')
+    assert len(digest_lines(telegram.messages)) == 25
+
+
+@pytest.mark.django_db
+def test_chunk_is_retried_after_429(telegram, eager_celery, overdue, settings):
+    settings.OVERDUE_CHUNK_SIZE = 100
+    telegram.failures[1] = (429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': 1}})
+    check_overdue_borrowings()
+    assert telegram.requests == 2
+    assert len(telegram.messages) == 1
+    assert len(digest_lines(telegram.messages)) == 25
+
+
+@pytest.mark.django_db
+def test_retry_resumes_after_parts_already_sent(telegram, eager_celery, overdue, settings):
+    settings.OVERDUE_CHUNK_SIZE = 100
+    book = Book.objects.get()
+    book.title = 'x' * 300
+    book.save()
+
+    telegram.failures[2] = (502, {'ok': False, 'description': 'Bad Gateway'})
+    check_overdue_borrowings()
+    # 25 lines of ~350 chars need three messages; only the failed one is resent.
+    assert telegram.requests == 4
+    assert len(telegram.messages) == 3
+    assert len(digest_lines(telegram.messages)) == 25
+
+
+def run_on(monkeypatch, day):
+    monkeypatch.setattr(timezone, 'now', lambda: timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.min.time())))
+    check_overdue_borrowings()
+
+
+@pytest.mark.django_db
+def test_scan_is_incremental_and_escalates(telegram, eager_celery, monkeypatch, settings):
+    settings.OVERDUE_REMINDER_DAYS = (1, 3, 7)
+    user = User.objects.create_user(email='late@example.com', password='pass')
+    book = Book.objects.create(title='Book', author='Author', cover='HARD', inventory=100, daily_fee=1)
+    start = timezone.datetime(2025, 7, 1).date()
+    due_dates = [start, start + timedelta(days=1), start + timedelta(days=5)]
+    loans = Borrowing.objects.bulk_create(
+        Borrowing(borrow_date=start - timedelta(days=10), expected_return_date=due, book=book, user=user)
+        for due in due_dates
+    )
+
+    def notified_on(day):
+        before = len(telegram.messages)
+        run_on(monkeypatch, day)
+        return [line for _, body in telegram.messages[before:] for line in body['text'].splitlines()[1:]]
+
+    day = start + timedelta(days=1)
+    assert notified_on(day) == ['- late@example.com: Book (due 2025-07-01, 1 days overdue)']
+    # Later runs on the same day have nothing new to do.
+    assert notified_on(day) == []
+    assert OverdueScan.objects.get().scanned_through == day
+
+    assert len(notified_on(start + timedelta(days=2))) == 1  # second loan crosses its due date
+    assert notified_on(start + timedelta(days=3)) == ['- late@example.com: Book (due 2025-07-01, 3 days overdue)']
+    Borrowing.objects.filter(pk=loans[1].pk).update(actual_return_date=start + timedelta(days=3))
+    assert notified_on(start + timedelta(days=4)) == []
+
+    # A missed week: the first loan jumps straight to the last step, once.
+    assert sorted(notified_on(start + timedelta(days=14))) == [
+        '- late@example.com: Book (due 2025-07-01, 14 days overdue)',
+        '- late@example.com: Book (due 2025-07-06, 9 days overdue)',
+    ]
+    assert dict(OverdueReminder.objects.values_list('borrowing_id', 'level')) == {
+        loans[0].pk: 3, loans[1].pk: 1, loans[2].pk: 3,
+    }
+    assert notified_on(start + timedelta(days=40)) == []
+
+
+@pytest.mark.django_db
+def test_duplicate_chunks_notify_once(telegram, eager_celery, overdue):
+    ids = [b.pk for b in overdue]
+    notify_overdue_chunk.delay(ids)
+    notify_overdue_chunk.delay(ids)
+    assert len(telegram.messages) == 1
+
+
+def test_sends_are_spaced_by_the_rate_limit(telegram, settings):
+    settings.TELEGRAM_MESSAGES_PER_MINUTE = 600
+    start = time.monotonic()
+    for i in range(4):
+        send_message(f'message {i}')
+    # Four sends take four consecutive 0.1s slots; the first may start late in its slot.
+    assert time.monotonic() - start >= 0.2
+    assert len(telegram.messages) == 4
+
+
+def test_split_message_respects_telegram_limit():
+    lines = ['y' * 1000] * 9
+    messages = split_message(lines, header='Header:')
+    assert len(messages) == 3
+    assert all(len(m) <= MAX_MESSAGE_LENGTH and m.startswith('Header:\n') for m in messages)
+    assert sum(m.count('y' * 1000) for m in messages) == 9
+
+
+def later(monkeypatch, seconds):
+    now = timezone.now() + timedelta(seconds=seconds)
+    monkeypatch.setattr(timezone, 'now', lambda: now)
+
+
+@pytest.mark.django_db
+def test_undelivered_digest_is_sent_again_after_the_claim_timeout(telegram, eager_celery, overdue, settings, monkeypatch):
+    settings.OVERDUE_CHUNK_SIZE = 100
+    for attempt in range(1, 7):
+        telegram.failures[attempt] = (502, {'ok': False, 'description': 'Bad Gateway'})
+    check_overdue_borrowings()
+    assert telegram.messages == []
+    assert OverdueReminder.objects.filter(claimed_at__isnull=False).count() == 25
+
+    # Still within the timeout: the claims are left alone.
+    check_overdue_borrowings()
+    assert telegram.messages == []
+
+    later(monkeypatch, settings.OVERDUE_CLAIM_TIMEOUT + 1)
+    check_overdue_borrowings()
+    assert len(digest_lines(telegram.messages)) == 25
+    assert not OverdueReminder.objects.filter(claimed_at__isnull=False).exists()
+    assert set(OverdueReminder.objects.values_list('last_notified_on', flat=True)) == {timezone.now().date()}
+
+    check_overdue_borrowings()
+    assert len(telegram.messages) == 1
+
+
+@pytest.mark.django_db
+def test_digest_lost_with_its_worker_is_sent_again(telegram, eager_celery, overdue, settings, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(send_overdue_digest, 'delay', lambda *args: None)
+        notify_overdue_chunk.delay([b.pk for b in overdue])
+    assert telegram.messages == []
+
+    later(monkeypatch, settings.OVERDUE_CLAIM_TIMEOUT + 1)
+    check_overdue_borrowings()
+    assert len(digest_lines(telegram.messages)) == 25
+
+
+@pytest.mark.django_db
+def test_claims_of_returned_loans_are_released(telegram, eager_celery, overdue, settings, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(send_overdue_digest, 'delay', lambda *args: None)
+        notify_overdue_chunk.delay([b.pk for b in overdue])
+    returned = [b.pk for b in overdue[:10]]
+    Borrowing.objects.filter(pk__in=returned).update(actual_return_date=timezone.now().date())
+
+    later(monkeypatch, settings.OVERDUE_CLAIM_TIMEOUT + 1)
+    check_overdue_borrowings()
+    assert len(digest_lines(telegram.messages)) == 15
+    assert not OverdueReminder.objects.filter(claimed_at__isnull=False).exists()
+    assert OverdueReminder.objects.filter(pk__in=returned, last_notified_on__isnull=True).count() == 10
+
+    queued = []
+    monkeypatch.setattr(notify_overdue_chunk, 'delay', queued.append)
+    later(monkeypatch, settings.OVERDUE_CLAIM_TIMEOUT + 1)
+    check_overdue_borrowings()
+    assert queued == []
+
+
+@pytest.mark.django_db
+def test_retries_resend_the_rendered_text(telegram, eager_celery):
+    telegram.failures[1] = (502, {'ok': False, 'description': 'Bad Gateway'})
+    send_overdue_digest.delay(['Overdue borrowings (1):\n- a@example.com: Book'], [])
+    assert [body['text'] for _, body in telegram.messages] == ['Overdue borrowings (1):\n- a@example.com: Book']
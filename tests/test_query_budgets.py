@@ -0,0 +1,119 @@
+import pytest
+from datetime import date, datetime
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from books.models import Book
+from borrowing.models import Borrowing
+from payment.models import Payment
+
+User = get_user_model()
+
+# Maximum number of SQL queries per endpoint/action. Every list/retrieve
+# budget must hold for any result size; the tests below seed the tables at
+# two sizes and require the count to stay the same. Book rows are read with
+# one extra query that prefetches their inventory shards, except on the
+# borrowing/payment lists, which read plain rows in a single query.
+QUERY_BUDGETS = {
+    ('book-list', 'list'): 2,
+    ('book-detail', 'retrieve'): 2,
+    ('borrowing-list', 'list'): 1,
+    ('borrowing-detail', 'retrieve'): 2,
+    # Includes the SAVEPOINT/RELEASE pair the test transaction adds around atomic().
+    ('borrowing-return-book', 'return_book'): 7,
+    ('payment-list', 'list'): 1,
+    ('payment-detail', 'retrieve'): 2,
+}
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def staff_user(db):
+    return User.objects.create_superuser(email='staff@example.com', password='pass')
+
+
+def seed(count):
+    user = User.objects.create_user(email=f'reader{count}@example.com', password='pass')
+    borrowings = []
+    for i in range(count):
+        book = Book.objects.create(
+            title=f'Book {i}',
+            author='Author',
+            cover='',
+            inventory=3,
+            daily_fee=2.0
+        )
+        borrowing = Borrowing.objects.create(
+            borrow_date=date(2025, 7, 1),
+            expected_return_date=date(2025, 7, 5),
+            book=book,
+            user=user
+        )
+        Payment.objects.create(
+            borrowing=borrowing,
+            session_id=f'sess_{count}_{i}',
+            session_url='http://example.com',
+            money_to_pay=10.0,
+            type=Payment.TypeChoices.PAYMENT,
+            status=Payment.StatusChoices.PENDING,
+        )
+        borrowings.append(borrowing)
+    return user, borrowings
+
+
+def count_queries(request):
+    # Budgets are for the uncached path; the book catalog cache would hide it.
+    cache.clear()
+    with CaptureQueriesContext(connection) as ctx:
+        resp = request()
+    assert resp.status_code == 200, resp.data
+    return len(ctx.captured_queries)
+
+
+def list_request(api_client, url_name):
+    return lambda: api_client.get(reverse(url_name), {'page_size': 50})
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url_name', ['book-list', 'borrowing-list', 'payment-list'])
+def test_list_query_budget_independent_of_size(api_client, staff_user, url_name):
+    api_client.force_authenticate(user=staff_user)
+    seed(1)
+    small = count_queries(list_request(api_client, url_name))
+    seed(20)
+    large = count_queries(list_request(api_client, url_name))
+    assert small == large
+    assert large <= QUERY_BUDGETS[(url_name, 'list')]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url_name, model', [
+    ('book-detail', Book),
+    ('borrowing-detail', Borrowing),
+    ('payment-detail', Payment),
+])
+def test_retrieve_query_budget(api_client, staff_user, url_name, model):
+    api_client.force_authenticate(user=staff_user)
+    seed(3)
+    obj = model.objects.first()
+    queries = count_queries(lambda: api_client.get(reverse(url_name, args=[obj.id])))
+    assert queries <= QUERY_BUDGETS[(url_name, 'retrieve')]
+
+
+@pytest.mark.django_db
+def test_return_book_query_budget(api_client, monkeypatch):
+    fake_now = datetime(2025, 7, 10, tzinfo=timezone.get_current_timezone())
+    monkeypatch.setattr(timezone, 'now', lambda: fake_now)
+    user, borrowings = seed(3)
+    api_client.force_authenticate(user=user)
+    url = reverse('borrowing-return-book', args=[borrowings[0].id])
+    queries = count_queries(lambda: api_client.post(url))
+    assert queries <= QUERY_BUDGETS[('borrowing-return-book', 'return_book')]
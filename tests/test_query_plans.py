@@ -0,0 +1,90 @@
+import pytest
+from datetime import date, timedelta
+from django.db import connection
+from django.contrib.auth import get_user_model
+from books.models import Book
+from borrowing.models import Borrowing
+from notifications.tasks import _crossed_steps
+from payment.models import Payment
+
+User = get_user_model()
+
+
+@pytest.fixture
+def seeded(db):
+    users = User.objects.bulk_create(
+        User(email=f'user{i}@example.com', password='x') for i in range(50)
+    )
+    books = Book.objects.bulk_create(
+        Book(title=f'Book {i}', author='Author', cover='HARD', inventory=5, daily_fee=1)
+        for i in range(20)
+    )
+    start = date(2024, 1, 1)
+    borrowings = []
+    for i in range(5000):
+        borrow_date = start + timedelta(days=i % 300)
+        # Roughly 2% of loans are still open, as in production.
+        returned = i % 50 != 0
+        borrowings.append(Borrowing(
+            borrow_date=borrow_date,
+            expected_return_date=borrow_date + timedelta(days=7),
+            actual_return_date=borrow_date + timedelta(days=5) if returned else None,
+            book=books[i % len(books)],
+            user=users[i % len(users)],
+        ))
+    borrowings = Borrowing.objects.bulk_create(borrowings, batch_size=1000)
+    Payment.objects.bulk_create(
+        (
+            Payment(
+                borrowing=b,
+                session_id=f'cs_test_{b.id}',
+                session_url='https://example.com',
+                money_to_pay=7,
+                type=Payment.TypeChoices.PAYMENT,
+                status=Payment.StatusChoices.PAID,
+            )
+            for b in borrowings
+        ),
+        batch_size=1000,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return users
+
+
+def assert_uses_index(queryset, index_name):
+    plan = queryset.explain()
+    assert index_name in plan, plan
+
+
+@pytest.mark.django_db
+def test_active_filter_uses_partial_user_index(seeded):
+    qs = Borrowing.objects.filter(user=seeded[0], actual_return_date__isnull=True)
+    assert_uses_index(qs, 'borrowing_user_active_idx')
+
+
+@pytest.mark.django_db
+def test_overdue_scan_uses_partial_index(seeded):
+    qs = Borrowing.objects.filter(
+        actual_return_date__isnull=True,
+        expected_return_date__lt=date(2024, 6, 1),
+    )
+    assert_uses_index(qs, 'borrowing_overdue_idx')
+
+
+@pytest.mark.django_db
+def test_incremental_overdue_scan_uses_partial_index(seeded):
+    qs = _crossed_steps(date(2024, 5, 31), date(2024, 6, 1)).values_list('id', flat=True)
+    assert_uses_index(qs, 'borrowing_overdue_idx')
+
+
+@pytest.mark.django_db
+def test_user_listing_uses_composite_index(seeded):
+    qs = Borrowing.objects.filter(user=seeded[0]).order_by('-borrow_date', '-id')[:20]
+    assert_uses_index(qs, 'borrowing_user_date_id_idx')
+
+
+@pytest.mark.django_db
+def test_session_lookup_uses_index(seeded):
+    qs = Payment.objects.filter(session_id='cs_test_42')
+    assert_uses_index(qs, 'payment_session_id_idx')
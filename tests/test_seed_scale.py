@@ -0,0 +1,96 @@
+import io
+from collections import Counter
+from datetime import date
+
+import pytest
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from books.models import Book
+from borrowing.models import Borrowing
+from borrowing.seeding import seed_scale
+from payment.models import Payment
+
+User = get_user_model()
+
+END = date(2026, 10, 1)
+
+
+def snapshot():
+    return (
+        list(User.objects.order_by('id').values_list('id', 'email', 'is_staff')),
+        list(Book.objects.order_by('id').values_list('id', 'cover', 'inventory', 'daily_fee')),
+        list(Borrowing.objects.order_by('id').values_list()),
+        list(Payment.objects.order_by('id').values_list()),
+    )
+
+
+def clear():
+    for model in (Payment, Borrowing, Book, User):
+        model.objects.all().delete()
+
+
+@pytest.mark.django_db
+def test_same_seed_gives_the_same_rows():
+    seed_scale(20, 10, 300, seed=7, end_date=END, batch_size=64)
+    first = snapshot()
+    clear()
+    seed_scale(20, 10, 300, seed=7, end_date=END, batch_size=100)
+    assert snapshot() == first
+    clear()
+    seed_scale(20, 10, 300, seed=8, end_date=END)
+    assert snapshot() != first
+
+
+@pytest.mark.django_db
+def test_histories_are_consistent():
+    report = seed_scale(50, 40, 2000, end_date=END, days=120, overdue_ratio=0.3, batch_size=500)
+    assert (User.objects.count(), Book.objects.count(), Borrowing.objects.count()) == (50, 40, 2000)
+    assert report.payments == Payment.objects.count() == 2000 + report.fines
+
+    borrowings = {b.id: b for b in Borrowing.objects.select_related('book')}
+    for b in borrowings.values():
+        assert END.replace(year=2026, month=6) <= b.borrow_date <= END
+        assert b.expected_return_date > b.borrow_date
+        assert b.actual_return_date is None or b.borrow_date < b.actual_return_date <= END
+    assert sum(b.actual_return_date is None for b in borrowings.values()) == report.open_borrowings
+    assert any(b.actual_return_date is None and b.expected_return_date < END for b in borrowings.values())
+
+    late = {
+        b.id: (b.actual_return_date - b.expected_return_date).days
+        for b in borrowings.values()
+        if b.actual_return_date and b.actual_return_date > b.expected_return_date
+    }
+    fines = Payment.objects.filter(type=Payment.TypeChoices.FINE)
+    assert sorted(fines.values_list('borrowing_id', flat=True)) == sorted(late)
+    for fine in fines:
+        book = borrowings[fine.borrowing_id].book
+        assert fine.money_to_pay == late[fine.borrowing_id] * book.daily_fee * settings.FINE_MULTIPLIER
+    assert Payment.objects.filter(type=Payment.TypeChoices.PAYMENT).count() == 2000
+
+    popularity = Counter(borrowings[pk].book_id for pk in borrowings).most_common()
+    assert popularity[0][1] > 5 * popularity[-1][1]
+
+
+@pytest.mark.django_db
+def test_seeding_appends_and_ids_continue():
+    user = User.objects.create_user(email='user@example.com', password='pass')
+    seed_scale(5, 5, 50, end_date=END)
+    seed_scale(5, 5, 50, end_date=END)
+    assert User.objects.count() == 11 and Borrowing.objects.count() == 100
+    assert User.objects.filter(email=f'user{user.id + 1}@seed.example.com').exists()
+    assert User.objects.get(email=f'user{user.id + 1}@seed.example.com').check_password('password')
+    book = Book.objects.create(title='New', author='Author', cover='HARD', inventory=1, daily_fee=1)
+    assert book.id == 11
+
+
+@pytest.mark.django_db
+def test_command_reports_counts_and_rejects_bad_options():
+    out = io.StringIO()
+    call_command('seed_scale', '--users', '3', '--books', '2', '--borrowings', '10', '--end-date', '2026-10-01', stdout=out)
+    assert 'Created 3 users' in out.getvalue() and '10 borrowings' in out.getvalue()
+
+    with pytest.raises(CommandError):
+        call_command('seed_scale', '--users', '0', '--borrowings', '10')
+    with pytest.raises(CommandError):
+        call_command('seed_scale', '--overdue-ratio', '1.5')
@@ -0,0 +1,113 @@
+import pytest
+from datetime import date
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from drf_spectacular.generators import SchemaGenerator
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from books.models import Book
+from borrowing.models import Borrowing
+from payment.models import Payment
+
+User = get_user_model()
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email='user@example.com', password='pass')
+
+
+@pytest.fixture
+def payment(user):
+    book = Book.objects.create(title='Book', author='Author', cover='HARD', inventory=3, daily_fee=2)
+    borrowing = Borrowing.objects.create(
+        borrow_date=date(2025, 7, 1), expected_return_date=date(2025, 7, 5), book=book, user=user
+    )
+    return Payment.objects.create(
+        borrowing=borrowing, session_id='cs_1', session_url='https://example.com', money_to_pay='8.00',
+        type=Payment.TypeChoices.PAYMENT, status=Payment.StatusChoices.PENDING,
+    )
+
+
+def get(api_client, url, **params):
+    with CaptureQueriesContext(connection) as ctx:
+        resp = api_client.get(url, params)
+    assert resp.status_code == 200, resp.data
+    return resp.data, [q['sql'] for q in ctx.captured_queries]
+
+
+@pytest.mark.django_db
+def test_payment_fields_drop_nested_objects_and_joins(api_client, user, payment):
+    api_client.force_authenticate(user=user)
+    data, queries = get(api_client, reverse('payment-list'), fields='id,status,money_to_pay')
+    assert data['results'] == [{'id': payment.id, 'status': 'PENDING', 'money_to_pay': '8.00'}]
+    assert len(queries) == 1
+    assert 'books_book' not in queries[0]
+    assert 'accounts_user' not in queries[0]
+
+
+@pytest.mark.django_db
+def test_payment_nested_fields(api_client, user, payment):
+    api_client.force_authenticate(user=user)
+    data, queries = get(
+        api_client, reverse('payment-detail', args=[payment.id]), fields='id,borrowing.id,borrowing.book.title'
+    )
+    assert data == {'id': payment.id, 'borrowing': {'id': payment.borrowing_id, 'book': {'title': 'Book'}}}
+    # The book is joined but its inventory shards are not prefetched.
+    assert len(queries) == 1
+    assert 'books_book' in queries[0]
+    assert 'accounts_user' not in queries[0]
+
+
+@pytest.mark.django_db
+def test_expand_renders_unlisted_relations_as_ids(api_client, user, payment):
+    api_client.force_authenticate(user=user)
+    data, queries = get(api_client, reverse('payment-detail', args=[payment.id]), expand='borrowing')
+    borrowing = data['borrowing']
+    assert borrowing['book'] == payment.borrowing.book_id
+    assert borrowing['user'] == user.id
+    assert len(queries) == 1
+    assert 'books_book' not in queries[0]
+
+    data, _ = get(api_client, reverse('payment-detail', args=[payment.id]), expand='')
+    assert data['borrowing'] == payment.borrowing_id
+
+    data, _ = get(api_client, reverse('borrowing-list'), expand='book', fields='id,book.title,user')
+    assert data['results'] == [{'id': payment.borrowing_id, 'user': user.id, 'book': {'title': 'Book'}}]
+
+
+@pytest.mark.django_db
+def test_default_response_is_fully_expanded(api_client, user, payment):
+    api_client.force_authenticate(user=user)
+    data, _ = get(api_client, reverse('payment-detail', args=[payment.id]))
+    assert data['borrowing']['book']['inventory'] == 3
+    assert data['borrowing']['user']['email'] == 'user@example.com'
+
+
+@pytest.mark.django_db
+def test_book_fields(api_client, payment):
+    data, queries = get(api_client, reverse('book-list'), fields='id,title')
+    assert data['results'] == [{'id': payment.borrowing.book_id, 'title': 'Book'}]
+    assert not any('books_inventoryshard' in sql for sql in queries)
+
+    data, queries = get(api_client, reverse('book-list'), fields='inventory')
+    assert data['results'] == [{'inventory': 3}]
+    assert any('books_inventoryshard' in sql for sql in queries)
+
+
+def test_schema_documents_sparse_responses():
+    schema = SchemaGenerator().get_schema(request=None, public=True)
+    params = {p['name'] for p in schema['paths']['/api/payment/payments/']['get']['parameters']}
+    assert {'fields', 'expand'} <= params
+
+    payment = schema['components']['schemas']['Payment']
+    assert 'required' not in payment
+    assert {'type': 'integer'} in payment['properties']['borrowing']['oneOf']
+    # Request bodies still require their fields.
+    assert 'required' in schema['components']['schemas']['BookRequest']
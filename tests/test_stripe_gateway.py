@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import pytest
+import stripe
+from payment.gateway import StripeGateway, StripeUnavailable, get_gateway
+
+SERVER_ERROR = (500, {'error': {'type': 'api_error', 'message': 'Something went wrong.'}})
+
+
+@pytest.fixture
+def gateway(stripe_api):
+    return StripeGateway(api_url=stripe_api.url, read_timeout=0.3, deadline=2, max_attempts=3, backoff=0.01,
+                         breaker_failures=3, breaker_reset=0.2)
+
+
+def test_gateway_is_shared_per_process(stripe_api):
+    assert get_gateway() is get_gateway()
+
+
+def test_transient_failures_are_retried(gateway, stripe_api):
+    stripe_api.failures[1] = SERVER_ERROR
+    stripe_api.failures[2] = (429, {'error': {'type': 'rate_limit_error', 'message': 'Slow down.'}})
+    session = gateway.create_checkout_session(mode='payment')
+    assert session.id == 'cs_test_1'
+    assert len(stripe_api.requests) == 3
+    assert gateway.metrics()['retries'] == 2
+
+
+def test_retry_after_timeout_does_not_create_twice(gateway, stripe_api):
+    # The first attempt's reply is lost; the retry reuses its idempotency key.
+    stripe_api.delays[1] = 0.5
+    session = gateway.create_checkout_session(mode='payment')
+    assert len(stripe_api.requests) == 2
+    assert list(stripe_api.sessions) == [session.id]
+
+
+def test_client_errors_are_not_retried(gateway, stripe_api):
+    with pytest.raises(stripe.error.InvalidRequestError):
+        gateway.retrieve_checkout_session('cs_missing')
+    assert len(stripe_api.requests) == 1
+    assert gateway.breaker.state == 'closed'
+
+
+def test_slow_stripe_is_cut_off_at_the_deadline(stripe_api):
+    gateway = StripeGateway(api_url=stripe_api.url, read_timeout=5, deadline=0.5, max_attempts=5, backoff=0.01)
+    stripe_api.delay = 2
+    start = time.monotonic()
+    with pytest.raises(StripeUnavailable):
+        gateway.retrieve_checkout_session('cs_1')
+    assert time.monotonic() - start < 1.5
+
+
+def test_circuit_opens_then_recovers(gateway, stripe_api):
+    stripe_api.add_session('cs_1')
+    for number in range(1, 4):
+        stripe_api.failures[number] = SERVER_ERROR
+    with pytest.raises(StripeUnavailable):
+        gateway.retrieve_checkout_session('cs_1')
+    assert gateway.breaker.state == 'open'
+
+    # Fails fast without calling Stripe.
+    with pytest.raises(StripeUnavailable):
+        gateway.retrieve_checkout_session('cs_1')
+    assert len(stripe_api.requests) == 3
+    assert gateway.metrics()['rejected'] == 1
+
+    time.sleep(0.25)
+    assert gateway.retrieve_checkout_session('cs_1').id == 'cs_1'
+    assert gateway.breaker.state == 'closed'
+    metrics = gateway.metrics()
+    assert metrics['requests'] == 4
+    assert metrics['latency_p50'] is not None
+
+
+def test_failed_trial_reopens_the_circuit(gateway, stripe_api):
+    for number in range(1, 5):
+        stripe_api.failures[number] = SERVER_ERROR
+    with pytest.raises(StripeUnavailable):
+        gateway.retrieve_checkout_session('cs_1')
+    time.sleep(0.25)
+    with pytest.raises(StripeUnavailable):
+        gateway.retrieve_checkout_session('cs_1')
+    # Only the trial request went out before the circuit opened again.
+    assert len(stripe_api.requests) == 4
+    assert gateway.breaker.state == 'open'
+
+
+def test_cancelled_trial_does_not_hold_the_circuit(gateway, stripe_api):
+    stripe_api.add_session('cs_1')
+    for number in range(1, 4):
+        stripe_api.failures[number] = SERVER_ERROR
+    with pytest.raises(StripeUnavailable):
+        gateway.retrieve_checkout_session('cs_1')
+    time.sleep(0.25)
+
+    async def cancelled_trial():
+        call = asyncio.create_task(gateway.retrieve_checkout_session_async('cs_1'))
+        await asyncio.sleep(0.1)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    stripe_api.delays[4] = 1
+    asyncio.run(cancelled_trial())
+    assert gateway.breaker.state == 'half-open'
+    assert gateway.retrieve_checkout_session('cs_1').id == 'cs_1'
+    assert gateway.breaker.state == 'closed'
@@ -0,0 +1,125 @@
+import time
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from books.models import Book
+from borrowing.models import Borrowing
+from notifications.models import OutboxEvent
+from payment.models import Payment
+from payment.tasks import RECONCILE_MARGIN, RECONCILE_WATERMARK_KEY, reconcile_stripe_sessions
+
+User = get_user_model()
+
+
+@pytest.fixture
+def borrowing(db):
+    user = User.objects.create_user(email='user@example.com', password='pass')
+    book = Book.objects.create(title='Book', author='Author', cover='HARD', inventory=10, daily_fee=2)
+    return Borrowing.objects.create(
+        borrow_date='2025-07-01', expected_return_date='2025-07-05', book=book, user=user
+    )
+
+
+def add_payment(stripe_api, borrowing, session_id, local_status=Payment.StatusChoices.PENDING, **session):
+    stripe_api.add_session(session_id, **session)
+    return Payment.objects.create(
+        borrowing=borrowing, session_id=session_id, session_url='https://example.com', money_to_pay='8.00',
+        type=Payment.TypeChoices.PAYMENT, status=local_status,
+    )
+
+
+def lists(stripe_api):
+    return [params for method, path, params in stripe_api.requests if path.startswith('/v1/checkout/sessions?')]
+
+
+def status(payment):
+    payment.refresh_from_db()
+    return payment.status
+
+
+@pytest.mark.django_db
+def test_settled_sessions_update_their_payments(stripe_api, borrowing, settings):
+    paid = add_payment(stripe_api, borrowing, 'cs_paid', status='complete', payment_status='paid',
+                       payment_intent='pi_1')
+    expired = add_payment(stripe_api, borrowing, 'cs_expired', status='expired')
+    still_open = add_payment(stripe_api, borrowing, 'cs_open')
+    stripe_api.add_session('cs_someone_elses', status='complete', payment_status='paid')
+
+    assert reconcile_stripe_sessions() == 2
+    paid.refresh_from_db()
+    assert (paid.status, paid.payment_intent_id) == (Payment.StatusChoices.PAID, 'pi_1')
+    assert status(expired) == Payment.StatusChoices.CANCELLED
+    assert status(still_open) == Payment.StatusChoices.PENDING
+    assert OutboxEvent.objects.filter(kind=OutboxEvent.KindChoices.PAYMENT_PAID).count() == 1
+    created = stripe_api.sessions['cs_open']['created']
+    assert cache.get(RECONCILE_WATERMARK_KEY) <= created - settings.STRIPE_DEADLINE - RECONCILE_MARGIN
+
+
+@pytest.mark.django_db
+def test_pages_through_sessions_with_one_update_each(stripe_api, borrowing, settings):
+    settings.STRIPE_RECONCILE_PAGE_SIZE = 2
+    payments = [
+        add_payment(stripe_api, borrowing, f'cs_{i}', status='complete', payment_status='paid') for i in range(5)
+    ]
+    with CaptureQueriesContext(connection) as queries:
+        assert reconcile_stripe_sessions() == 5
+    assert len(lists(stripe_api)) == 3
+    assert lists(stripe_api)[1]['starting_after'] == 'cs_3'
+    updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "payment_payment"')]
+    assert len(updates) == 3
+    assert {status(p) for p in payments} == {Payment.StatusChoices.PAID}
+
+
+@pytest.mark.django_db
+def test_stale_open_sessions_are_expired(stripe_api, borrowing, settings):
+    cancelled = add_payment(stripe_api, borrowing, 'cs_cancelled', local_status=Payment.StatusChoices.CANCELLED)
+    too_old = add_payment(stripe_api, borrowing, 'cs_old', created=int(time.time()) - settings.STRIPE_SESSION_TTL - 60)
+    current = add_payment(stripe_api, borrowing, 'cs_current')
+    stripe_api.add_session('cs_someone_elses')
+
+    reconcile_stripe_sessions()
+    assert stripe_api.sessions['cs_cancelled']['status'] == 'expired'
+    assert stripe_api.sessions['cs_old']['status'] == 'expired'
+    assert status(too_old) == Payment.StatusChoices.CANCELLED
+    assert status(cancelled) == Payment.StatusChoices.CANCELLED
+    assert stripe_api.sessions['cs_current']['status'] == 'open'
+    assert status(current) == Payment.StatusChoices.PENDING
+    assert stripe_api.sessions['cs_someone_elses']['status'] == 'open'
+
+
+@pytest.mark.django_db
+def test_settled_sessions_are_not_listed_again(stripe_api, borrowing):
+    long_ago = int(time.time()) - 3600
+    add_payment(stripe_api, borrowing, 'cs_paid', status='complete', payment_status='paid', created=long_ago)
+    waiting = add_payment(stripe_api, borrowing, 'cs_waiting', created=long_ago + 60)
+
+    reconcile_stripe_sessions()
+    assert cache.get(RECONCILE_WATERMARK_KEY) == long_ago + 60
+
+    stripe_api.sessions['cs_waiting'].update(status='complete', payment_status='paid')
+    assert reconcile_stripe_sessions() == 1
+    assert lists(stripe_api)[-1]['created[gte]'] == str(long_ago + 60)
+    assert status(waiting) == Payment.StatusChoices.PAID
+    assert cache.get(RECONCILE_WATERMARK_KEY) > long_ago + 60
+
+    assert reconcile_stripe_sessions() == 0
+    assert int(lists(stripe_api)[-1]['created[gte]']) > long_ago + 60
+
+
+@pytest.mark.django_db
+def test_session_saved_after_a_run_is_still_reconciled(stripe_api, borrowing, settings):
+    # Stripe created the session, but our request had not committed its row yet.
+    stripe_api.add_session('cs_late', created=int(time.time()) - int(settings.STRIPE_DEADLINE))
+    reconcile_stripe_sessions()
+    assert cache.get(RECONCILE_WATERMARK_KEY) <= stripe_api.sessions['cs_late']['created']
+
+    late = Payment.objects.create(
+        borrowing=borrowing, session_id='cs_late', session_url='https://example.com', money_to_pay='8.00',
+        type=Payment.TypeChoices.PAYMENT,
+    )
+    stripe_api.sessions['cs_late'].update(status='complete', payment_status='paid')
+    assert reconcile_stripe_sessions() == 1
+    assert status(late) == Payment.StatusChoices.PAID
@@ -0,0 +1,185 @@
+import hashlib
+import hmac
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from books.models import Book
+from borrowing.models import Borrowing
+from notifications.models import OutboxEvent
+from payment.models import Payment, StripeEvent
+from payment.tasks import apply_stripe_events
+from src.celery import app
+
+User = get_user_model()
+
+SECRET = 'whsec_test'
+
+
+@pytest.fixture(autouse=True)
+def webhook_secret(settings):
+    settings.STRIPE_WEBHOOK_SECRET = SECRET
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def eager_celery():
+    app.conf.task_always_eager = True
+    yield
+    app.conf.task_always_eager = False
+
+
+@pytest.fixture
+def payments(db):
+    user = User.objects.create_user(email='user@example.com', password='pass')
+    book = Book.objects.create(title='Book', author='Author', cover='HARD', inventory=10, daily_fee=2)
+    borrowing = Borrowing.objects.create(
+        borrow_date='2025-07-01', expected_return_date='2025-07-05', book=book, user=user
+    )
+    return Payment.objects.bulk_create(
+        Payment(
+            borrowing=borrowing, session_id=f'cs_{i}', session_url='https://example.com', money_to_pay='8.00',
+            type=Payment.TypeChoices.PAYMENT, status=Payment.StatusChoices.PENDING,
+        )
+        for i in range(5)
+    )
+
+
+def make_event(event_id, event_type, obj, created=None):
+    return {
+        'id': event_id,
+        'object': 'event',
+        'type': event_type,
+        'created': created or int(time.time()),
+        'data': {'object': obj},
+    }
+
+
+def completed(event_id, session_id, intent='pi_1', payment_status='paid', created=None):
+    return make_event(event_id, 'checkout.session.completed', {
+        'id': session_id, 'object': 'checkout.session', 'payment_status': payment_status, 'payment_intent': intent,
+    }, created)
+
+
+def post_event(api_client, event, secret=SECRET):
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return api_client.post(
+        reverse('stripe-webhook'), payload, content_type='application/json',
+        HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}',
+    )
+
+
+def statuses():
+    return dict(Payment.objects.values_list('session_id', 'status'))
+
+
+@pytest.mark.django_db
+def test_bad_signature_is_rejected(api_client, payments):
+    resp = post_event(api_client, completed('evt_1', 'cs_0'), secret='whsec_other')
+    assert resp.status_code == 400
+    assert not StripeEvent.objects.exists()
+
+
+@pytest.mark.django_db
+def test_event_is_stored_once_and_applied_after_commit(
+        api_client, payments, eager_celery, django_capture_on_commit_callbacks):
+    event = completed('evt_1', 'cs_0')
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        assert post_event(api_client, event).status_code == 200
+        assert post_event(api_client, event).status_code == 200
+    assert StripeEvent.objects.count() == 1
+    # Nothing is applied within the request itself.
+    assert statuses()['cs_0'] == Payment.StatusChoices.PENDING
+
+    for callback in callbacks:
+        callback()
+    payment = Payment.objects.get(session_id='cs_0')
+    assert payment.status == Payment.StatusChoices.PAID
+    assert payment.payment_intent_id == 'pi_1'
+    assert StripeEvent.objects.get().processed_at is not None
+    assert OutboxEvent.objects.filter(
+        kind=OutboxEvent.KindChoices.PAYMENT_PAID, payload={'payment_id': payment.pk}
+    ).count() == 1
+
+
+@pytest.mark.django_db
+def test_unhandled_event_types_are_acknowledged_and_dropped(api_client, payments):
+    resp = post_event(api_client, make_event('evt_1', 'customer.created', {'id': 'cus_1'}))
+    assert resp.status_code == 200
+    assert not StripeEvent.objects.exists()
+
+
+@pytest.mark.django_db
+def test_expired_and_refunded_sessions_are_cancelled(api_client, payments):
+    now = int(time.time())
+    for event in [
+        make_event('evt_1', 'checkout.session.expired', {'id': 'cs_0', 'object': 'checkout.session'}, now),
+        completed('evt_2', 'cs_1', intent='pi_9', created=now),
+        make_event('evt_3', 'charge.refunded', {
+            'id': 'ch_1', 'object': 'charge', 'payment_intent': 'pi_9', 'refunded': True,
+        }, now + 1),
+        # An expiry can't undo a payment.
+        make_event('evt_4', 'checkout.session.expired', {'id': 'cs_2', 'object': 'checkout.session'}, now + 1),
+        completed('evt_5', 'cs_2', intent='pi_2', created=now),
+        # Paid later, by a delayed payment method.
+        completed('evt_6', 'cs_3', intent='pi_3', payment_status='unpaid', created=now),
+        make_event('evt_7', 'checkout.session.async_payment_succeeded', {
+            'id': 'cs_3', 'object': 'checkout.session', 'payment_status': 'paid', 'payment_intent': 'pi_3',
+        }, now + 5),
+    ]:
+        assert post_event(api_client, event).status_code == 200
+
+    assert apply_stripe_events() == 7
+    assert statuses() == {
+        'cs_0': Payment.StatusChoices.CANCELLED,
+        'cs_1': Payment.StatusChoices.CANCELLED,
+        'cs_2': Payment.StatusChoices.PAID,
+        'cs_3': Payment.StatusChoices.PAID,
+        'cs_4': Payment.StatusChoices.PENDING,
+    }
+
+
+@pytest.mark.django_db
+def test_events_are_applied_in_batches(api_client, payments, settings, django_assert_max_num_queries):
+    settings.STRIPE_EVENT_BATCH_SIZE = 2
+    for i in range(5):
+        assert post_event(api_client, completed(f'evt_{i}', f'cs_{i}', intent=f'pi_{i}')).status_code == 200
+
+    # Per batch: claim, load payments, bulk update, outbox rows, mark processed, plus savepoints.
+    with django_assert_max_num_queries(3 * 8):
+        assert apply_stripe_events() == 5
+    assert set(statuses().values()) == {Payment.StatusChoices.PAID}
+    assert OutboxEvent.objects.filter(kind=OutboxEvent.KindChoices.PAYMENT_PAID).count() == 5
+    assert apply_stripe_events() == 0
+
+
+@pytest.mark.django_db
+def test_success_page_reads_webhook_result_without_calling_stripe(api_client, payments, stripe_api):
+    url = reverse('stripe-success') + '?session_id=cs_0'
+    assert api_client.get(url).status_code == 202
+    post_event(api_client, completed('evt_1', 'cs_0'))
+    apply_stripe_events()
+    assert api_client.get(url).status_code == 200
+    assert stripe_api.requests == []
+
+
+def test_missing_webhook_secret_fails_at_startup():
+    env = {k: v for k, v in os.environ.items() if k != 'STRIPE_WEBHOOK_SECRET'}
+    env['STRIPE_WEBHOOK_SECRET'] = ''  # Not taken from a local .env either.
+    code = 'import django; django.setup(); import payment.views'
+    result = subprocess.run([sys.executable, '-c', code], env={**env, 'DJANGO_SETTINGS_MODULE': 'src.settings'},
+                            capture_output=True, text=True)
+    assert result.returncode != 0
+    assert 'ImproperlyConfigured: STRIPE_WEBHOOK_SECRET must be set' in result.stderr
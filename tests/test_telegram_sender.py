@@ -0,0 +1,135 @@
+import threading
+import time
+from concurrent.futures import wait
+from datetime import date
+
+import pytest
+from django.contrib.auth import get_user_model
+from books.models import Book
+from borrowing.models import Borrowing
+from notifications import sender as sender_module
+from notifications.sender import TelegramSender, TokenBucket, get_sender, shutdown_sender
+from notifications.tasks import notify_new_borrowing
+from notifications.telegram import TelegramError
+from src.celery import app
+
+
+@pytest.fixture
+def sender(telegram):
+    sender = TelegramSender(rate=1000, linger=0.2, backoff=0.01)
+    yield sender
+    sender.close(timeout=5)
+
+
+def test_queued_messages_are_coalesced_per_chat(telegram, sender):
+    futures = [sender.submit(f'event {i}', chat_id='42') for i in range(10)]
+    futures.append(sender.submit('other chat', chat_id='7'))
+    done, _ = wait(futures, timeout=5)
+    assert len(done) == 11 and all(f.exception() is None for f in futures)
+
+    assert [body['chat_id'] for _, body in telegram.messages] == ['42', '7']
+    assert telegram.messages[0][1]['text'] == '\n\n'.join(f'event {i}' for i in range(10))
+
+    metrics = sender.metrics()
+    assert metrics['queue_depth'] == 0
+    assert (metrics['queued'], metrics['sent'], metrics['requests'], metrics['failed']) == (11, 11, 2, 0)
+    assert metrics['send_latency_p50'] > 0
+
+
+def test_429_is_retried_after_retry_after(telegram, sender):
+    telegram.failures[1] = (429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': 1}})
+    start = time.monotonic()
+    sender.submit('hello', chat_id='42').result(timeout=5)
+    assert time.monotonic() - start >= 1
+    assert telegram.requests == 2
+    assert sender.metrics()['retries'] == 1
+
+
+def test_failures_back_off_then_give_up(telegram, settings):
+    sender = TelegramSender(rate=1000, linger=0, max_attempts=3, backoff=0.01)
+    telegram.failures.update({n: (500, {'ok': False, 'description': 'boom'}) for n in range(1, 4)})
+    with pytest.raises(TelegramError, match='boom'):
+        sender.submit('hello', chat_id='42').result(timeout=5)
+    assert telegram.requests == 3
+    assert sender.metrics()['failed'] == 1
+
+    # The sender keeps going after a dropped batch.
+    sender.submit('again', chat_id='42').result(timeout=5)
+    sender.close(timeout=5)
+    assert [body['text'] for _, body in telegram.messages] == ['again']
+
+
+def test_unexpected_errors_fail_the_batch_not_the_thread(telegram, sender, monkeypatch):
+    def broken(chat_id):
+        raise RuntimeError('cache down')
+
+    with monkeypatch.context() as m:
+        m.setattr(sender_module, 'wait_for_chat_slot', broken)
+        with pytest.raises(RuntimeError, match='cache down'):
+            sender.submit('hello', chat_id='42').result(timeout=5)
+    assert sender.metrics()['failed'] == 1
+
+    sender.submit('again', chat_id='42').result(timeout=5)
+    assert [body['text'] for _, body in telegram.messages] == ['again']
+
+
+def test_sender_with_a_dead_thread_is_replaced(telegram):
+    first = get_sender()
+    first.close(timeout=5)
+    assert get_sender() is not first
+    shutdown_sender(timeout=5)
+
+
+def test_close_flushes_the_queue(telegram, sender):
+    future = sender.submit('last words', chat_id='42')
+    sender.close(timeout=5)
+    assert future.done()
+    assert telegram.messages[0][1]['text'] == 'last words'
+
+
+def test_token_bucket_limits_rate_after_burst():
+    bucket = TokenBucket(rate=20, capacity=2)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # Two tokens are available at once, the other four refill at 20/s.
+    assert time.monotonic() - start >= 0.19
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_notification_tasks_are_coalesced(telegram):
+    user = get_user_model().objects.create_user(email='user@example.com', password='pass')
+    book = Book.objects.create(title='Book', author='Author', cover='HARD', inventory=5, daily_fee=2)
+    borrowings = [
+        Borrowing.objects.create(
+            borrow_date=date(2025, 7, 1), expected_return_date=date(2025, 7, 5), book=book, user=user
+        )
+        for _ in range(3)
+    ]
+    # As on a threaded worker: each task returns once its message is delivered.
+    threads = [threading.Thread(target=notify_new_borrowing, args=(b.id,)) for b in borrowings]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert len(telegram.messages) == 1
+    assert telegram.messages[0][1]['text'].count('New borrowing created') == 3
+
+
+@pytest.mark.django_db
+def test_failed_delivery_retries_the_task(telegram, settings):
+    settings.TELEGRAM_MAX_ATTEMPTS = 1
+    user = get_user_model().objects.create_user(email='user@example.com', password='pass')
+    book = Book.objects.create(title='Book', author='Author', cover='HARD', inventory=5, daily_fee=2)
+    borrowing = Borrowing.objects.create(
+        borrow_date=date(2025, 7, 1), expected_return_date=date(2025, 7, 5), book=book, user=user
+    )
+    telegram.failures[1] = (500, {'ok': False, 'description': 'boom'})
+    app.conf.task_always_eager = True
+    try:
+        result = notify_new_borrowing.delay(borrowing.id)
+    finally:
+        app.conf.task_always_eager = False
+    assert result.successful()
+    assert telegram.requests == 2
+    assert [body['text'] for _, body in telegram.messages][0].startswith('New borrowing created')
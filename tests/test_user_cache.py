@@ -0,0 +1,121 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from accounts.cache import LocalLRU, get_cached_user, local_users
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email='user@example.com', password='pass', first_name='Ann')
+
+
+@pytest.fixture
+def api_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    return client
+
+
+def user_queries(queries):
+    return [q for q in queries.captured_queries if 'FROM "accounts_user"' in q['sql']]
+
+
+@pytest.mark.django_db
+def test_user_is_queried_once(api_client):
+    assert api_client.get(reverse('user-profile')).status_code == 200
+    with CaptureQueriesContext(connection) as queries:
+        resp = api_client.get(reverse('user-profile'))
+    assert resp.data['first_name'] == 'Ann'
+    assert len(queries) == 0
+
+
+@pytest.mark.django_db
+def test_shared_cache_serves_other_processes(api_client, user):
+    api_client.get(reverse('user-profile'))
+    local_users.clear()  # As if the next request went to another worker.
+    with CaptureQueriesContext(connection) as queries:
+        assert api_client.get(reverse('user-profile')).status_code == 200
+    assert user_queries(queries) == []
+
+
+@pytest.mark.django_db
+def test_profile_update_is_seen_on_the_next_request(api_client):
+    api_client.get(reverse('user-profile'))
+    resp = api_client.patch(reverse('user-profile'), {'first_name': 'Bea'}, format='json')
+    assert resp.data['first_name'] == 'Bea'
+    assert api_client.get(reverse('user-profile')).data['first_name'] == 'Bea'
+
+
+@pytest.mark.django_db
+def test_deactivated_or_deleted_user_is_rejected(api_client, user):
+    api_client.get(reverse('user-profile'))
+    user.is_active = False
+    user.save()
+    assert api_client.get(reverse('user-profile')).status_code == 401
+
+    user.is_active = True
+    user.save()
+    assert api_client.get(reverse('user-profile')).status_code == 200
+    user.delete()
+    assert api_client.get(reverse('user-profile')).status_code == 401
+
+
+@pytest.mark.django_db
+def test_each_hit_is_a_separate_instance(api_client, user):
+    api_client.get(reverse('user-profile'))
+    (first, _), (second, _) = get_cached_user(user.pk), get_cached_user(user.pk)
+    assert first == second == user
+    assert first is not second
+    assert first.email == 'user@example.com' and not first._state.adding
+    assert cache.get(f'accounts:user:{user.pk}') is not None
+
+
+@pytest.mark.django_db
+def test_password_hash_is_not_cached(api_client, user):
+    api_client.get(reverse('user-profile'))
+    assert user.password not in repr(cache.get(f'accounts:user:{user.pk}'))
+
+    # Saving the cached user leaves the password alone.
+    resp = api_client.patch(reverse('user-profile'), {'first_name': 'Bea'}, format='json')
+    assert resp.status_code == 200
+    assert User.objects.get(pk=user.pk).check_password('pass')
+
+
+@pytest.mark.django_db
+def test_cached_user_is_rejected_for_a_token_from_before_a_password_change(user, monkeypatch):
+    # Set on the settings object itself: modules hold on to it, so
+    # override_settings(SIMPLE_JWT=...) would not reach them.
+    monkeypatch.setattr(api_settings, 'CHECK_REVOKE_TOKEN', True)
+    old_token = AccessToken.for_user(user)
+    user.set_password('new-pass')
+    user.save()
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    assert client.get(reverse('user-profile')).status_code == 200
+
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {old_token}')
+    with CaptureQueriesContext(connection) as queries:
+        resp = client.get(reverse('user-profile'))
+    assert resp.status_code == 401
+    assert resp.data['code'] == 'password_changed'
+    assert user_queries(queries) == []
+
+
+def test_local_lru_evicts_least_recent_and_expired():
+    lru = LocalLRU(2)
+    lru.set('a', 1, ttl=10)
+    lru.set('b', 2, ttl=10)
+    lru.get('a')
+    lru.set('c', 3, ttl=10)
+    assert (lru.get('a'), lru.get('b'), lru.get('c')) == (1, None, 3)
+
+    lru.set('d', 4, ttl=0)
+    assert lru.get('d') is None
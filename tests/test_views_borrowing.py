@@ -70,18 +70,18 @@ def test_list_non_staff_sees_only_own(api_client, book, user):
     api_client.force_authenticate(user=user)
     resp = api_client.get(reverse('borrowing-list'))
     assert resp.status_code == 200
-    assert len(resp.data) == 1
-    assert resp.data[0]['id'] == b.id
+    assert len(resp.data['results']) == 1
+    assert resp.data['results'][0]['id'] == b.id
 
 @pytest.mark.django_db
 def test_list_staff_filters(api_client, active_borrowing, user, staff_user):
     api_client.force_authenticate(user=staff_user)
     resp = api_client.get(reverse('borrowing-list'))
     assert resp.status_code == 200
-    assert isinstance(resp.data, list)
+    assert isinstance(resp.data['results'], list)
     resp2 = api_client.get(reverse('borrowing-list'), {'user_id': user.id})
     assert resp2.status_code == 200
-    assert all(item['user']['id'] == user.id for item in resp2.data)
+    assert all(item['user']['id'] == user.id for item in resp2.data['results'])
 
     
 @pytest.mark.django_db
@@ -89,10 +89,10 @@ def test_filter_is_active(api_client, active_borrowing, returned_borrowing, user
     api_client.force_authenticate(user=user)
     resp = api_client.get(reverse('borrowing-list'), {'is_active': 'true'})
     assert resp.status_code == 200
-    assert all(item['actual_return_date'] is None for item in resp.data)
+    assert all(item['actual_return_date'] is None for item in resp.data['results'])
     resp2 = api_client.get(reverse('borrowing-list'), {'is_active': 'false'})
     assert resp2.status_code == 200
-    assert all(item['actual_return_date'] is not None for item in resp2.data)
+    assert all(item['actual_return_date'] is not None for item in resp2.data['results'])
 
 @pytest.mark.django_db
 def test_return_book_action_creates_fine(api_client, active_borrowing, user, monkeypatch, book):
@@ -118,3 +118,50 @@ def test_return_book_action_idempotent(api_client, returned_borrowing, user):
     resp = api_client.post(url)
     assert resp.status_code == 400
     assert 'already returned' in resp.data['detail'].lower()
+
+@pytest.mark.django_db
+def test_list_cursor_pagination_walks_all_pages(api_client, book, user):
+    # Several borrowings share a borrow_date so the cursor has to tie-break on id.
+    created = [
+        Borrowing.objects.create(
+            borrow_date=date(2025, 7, 1 + i // 3),
+            expected_return_date=date(2025, 7, 10),
+            book=book,
+            user=user
+        )
+        for i in range(7)
+    ]
+    api_client.force_authenticate(user=user)
+    resp = api_client.get(reverse('borrowing-list'), {'page_size': 2})
+    assert resp.status_code == 200
+    assert resp.data['previous'] is None
+
+    seen = [item['id'] for item in resp.data['results']]
+    pages = [resp]
+    while resp.data['next']:
+        resp = api_client.get(resp.data['next'])
+        assert resp.status_code == 200
+        assert len(resp.data['results']) <= 2
+        seen.extend(item['id'] for item in resp.data['results'])
+        pages.append(resp)
+
+    expected = sorted(created, key=lambda b: (b.borrow_date, b.id), reverse=True)
+    assert seen == [b.id for b in expected]
+
+    back = api_client.get(pages[-1].data['previous'])
+    assert [item['id'] for item in back.data['results']] == [
+        item['id'] for item in pages[-2].data['results']
+    ]
+
+@pytest.mark.django_db
+def test_list_cursor_pagination_keeps_filters(api_client, active_borrowing, returned_borrowing, user):
+    api_client.force_authenticate(user=user)
+    resp = api_client.get(reverse('borrowing-list'), {'is_active': 'true', 'page_size': 1})
+    assert [item['id'] for item in resp.data['results']] == [active_borrowing.id]
+    assert resp.data['next'] is None
+
+@pytest.mark.django_db
+def test_list_invalid_cursor(api_client, user):
+    api_client.force_authenticate(user=user)
+    resp = api_client.get(reverse('borrowing-list'), {'cursor': 'not-a-cursor'})
+    assert resp.status_code == 404
@@ -5,7 +5,6 @@ from django.contrib.auth import get_user_model
 from books.models import Book
 from borrowing.models import Borrowing
 from payment.models import Payment
-import stripe
 
 User = get_user_model()
 
@@ -52,18 +51,16 @@ def payment_record(db, borrowing):
     )
 
 @pytest.mark.django_db
-def test_create_checkout_session_success(monkeypatch, api_client, user, borrowing):
+def test_create_checkout_session_success(stripe_api, api_client, user, borrowing):
     api_client.force_authenticate(user=user)
-    class DummySession:
-        id = 'sess_123'
-        url = 'http://checkout'
-    monkeypatch.setattr(stripe.checkout.Session, 'create', lambda **kwargs: DummySession())
-
     url = reverse('create-checkout-session')
     resp = api_client.post(url, {'borrowing_id': borrowing.id}, format='json')
     assert resp.status_code == 200
-    assert 'checkout_url' in resp.data
-    assert Payment.objects.filter(session_id='sess_123').exists()
+    assert resp.data['checkout_url'] == 'https://checkout.test/cs_test_1'
+    assert Payment.objects.filter(session_id='cs_test_1').exists()
+    (method, path, params), = stripe_api.requests
+    assert (method, path) == ('POST', '/v1/checkout/sessions')
+    assert params['line_items[0][price_data][unit_amount]'] == '800'
 
 @pytest.mark.django_db
 def test_create_checkout_session_not_found(api_client, user):
@@ -74,24 +71,32 @@ def test_create_checkout_session_not_found(api_client, user):
     assert resp.data['detail'] == 'Borrowing not found.'
 
 @pytest.mark.django_db
-def test_stripe_success_paid(monkeypatch, api_client, user, payment_record):
+def test_stripe_success_paid(stripe_api, api_client, user, payment_record):
     api_client.force_authenticate(user=user)
-    class DummySession:
-        payment_status = 'paid'
-    monkeypatch.setattr(stripe.checkout.Session, 'retrieve', lambda session_id: DummySession())
+    Payment.objects.filter(pk=payment_record.pk).update(status=Payment.StatusChoices.PAID)
 
     url = reverse('stripe-success') + '?session_id=sess_1'
     resp = api_client.get(url)
     assert resp.status_code == 200
+    assert resp.data['detail'] == 'Payment successful.'
+    assert stripe_api.requests == []
+
+@pytest.mark.django_db
+def test_stripe_success_pending(stripe_api, api_client, user, payment_record):
+    api_client.force_authenticate(user=user)
+
+    url = reverse('stripe-success') + '?session_id=sess_1'
+    resp = api_client.get(url)
+    assert resp.status_code == 202
+    assert resp.data['detail'] == 'Payment is being processed.'
     payment_record.refresh_from_db()
-    assert payment_record.status == Payment.StatusChoices.PAID
+    assert payment_record.status == Payment.StatusChoices.PENDING
+    assert stripe_api.requests == []
 
 @pytest.mark.django_db
-def test_stripe_success_not_paid(monkeypatch, api_client, user, payment_record):
+def test_stripe_success_not_paid(api_client, user, payment_record):
     api_client.force_authenticate(user=user)
-    class DummySession:
-        payment_status = 'unpaid'
-    monkeypatch.setattr(stripe.checkout.Session, 'retrieve', lambda session_id: DummySession())
+    Payment.objects.filter(pk=payment_record.pk).update(status=Payment.StatusChoices.CANCELLED)
 
     url = reverse('stripe-success') + '?session_id=sess_1'
     resp = api_client.get(url)
@@ -99,12 +104,8 @@ def test_stripe_success_not_paid(monkeypatch, api_client, user, payment_record):
     assert resp.data['detail'] == 'Payment not completed.'
 
 @pytest.mark.django_db
-def test_stripe_success_no_record(monkeypatch, api_client, user):
+def test_stripe_success_no_record(api_client, user):
     api_client.force_authenticate(user=user)
-    class DummySession:
-        payment_status = 'paid'
-    monkeypatch.setattr(stripe.checkout.Session, 'retrieve', lambda session_id: DummySession())
-
     url = reverse('stripe-success') + '?session_id=unknown'
     resp = api_client.get(url)
     assert resp.status_code == 404
@@ -119,12 +120,9 @@ def test_stripe_cancel_no_payment(api_client, user):
     assert resp.data['detail'] == 'Payment not found.'
 
 @pytest.mark.django_db
-def test_stripe_cancel_simple(monkeypatch, api_client, user, payment_record):
+def test_stripe_cancel_simple(stripe_api, api_client, user, payment_record):
     api_client.force_authenticate(user=user)
-    monkeypatch.setattr(stripe.checkout.Session, 'expire', lambda session_id: None)
-    class DummySession:
-        payment_intent = None
-    monkeypatch.setattr(stripe.checkout.Session, 'retrieve', lambda session_id: DummySession())
+    stripe_api.add_session('sess_1')
 
     url = reverse('stripe-cancel')
     resp = api_client.post(url, {'payment_id': payment_record.id}, format='json')
@@ -132,19 +130,13 @@ def test_stripe_cancel_simple(monkeypatch, api_client, user, payment_record):
     payment_record.refresh_from_db()
     assert payment_record.status == Payment.StatusChoices.CANCELLED
     assert resp.data['detail'] == 'Checkout session cancelled.'
+    assert stripe_api.sessions['sess_1']['status'] == 'expired'
 
 @pytest.mark.django_db
-def test_stripe_cancel_refund(monkeypatch, api_client, user, payment_record):
+def test_stripe_cancel_refund(stripe_api, api_client, user, payment_record):
     api_client.force_authenticate(user=user)
-    monkeypatch.setattr(stripe.checkout.Session, 'expire', lambda session_id: None)
-    class DummySession:
-        payment_intent = 'pi_1'
-    monkeypatch.setattr(stripe.checkout.Session, 'retrieve', lambda session_id: DummySession())
-
-    class DummyIntent:
-        charges = type('Charges', (), {'data': [type('Ch', (), {'id': 'ch_1'})]})
-    monkeypatch.setattr(stripe.PaymentIntent, 'retrieve', lambda pid, expand: DummyIntent())
-    monkeypatch.setattr(stripe.Refund, 'create', lambda **kwargs: None)
+    stripe_api.add_session('sess_1', status='complete', payment_status='paid', payment_intent='pi_1')
+    stripe_api.intents['pi_1'] = {'id': 'pi_1', 'object': 'payment_intent', 'latest_charge': 'ch_1'}
 
     url = reverse('stripe-cancel')
     resp = api_client.post(url, {'payment_id': payment_record.id}, format='json')
@@ -152,6 +144,16 @@ def test_stripe_cancel_refund(monkeypatch, api_client, user, payment_record):
     payment_record.refresh_from_db()
     assert payment_record.status == Payment.StatusChoices.CANCELLED
     assert resp.data['detail'] == 'Payment refunded and cancelled.'
+    assert [refund['charge'] for refund in stripe_api.refunds] == ['ch_1']
+
+@pytest.mark.django_db
+def test_stripe_outage_returns_503(stripe_api, api_client, user, borrowing, settings):
+    settings.STRIPE_MAX_ATTEMPTS = 1
+    stripe_api.failures[1] = (500, {'error': {'type': 'api_error', 'message': 'Boom'}})
+    api_client.force_authenticate(user=user)
+    resp = api_client.post(reverse('create-checkout-session'), {'borrowing_id': borrowing.id}, format='json')
+    assert resp.status_code == 503
+    assert not Payment.objects.filter(borrowing=borrowing).exists()
 
 @pytest.mark.django_db
 def test_payment_viewset_filters(api_client, user, other_user, borrowing, payment_record):
@@ -161,7 +163,7 @@ def test_payment_viewset_filters(api_client, user, other_user, borrowing, paymen
     assert resp.status_code == 200
     assert all(
     (item['borrowing']['id'] if isinstance(item['borrowing'], dict) else item['borrowing']) == borrowing.id
-    for item in resp.data
+    for item in resp.data['results']
 )
 
     other_payment = Payment.objects.create(
@@ -176,4 +178,4 @@ def test_payment_viewset_filters(api_client, user, other_user, borrowing, paymen
     other_user.save()
     api_client.force_authenticate(user=other_user)
     resp2 = api_client.get(url)
-    assert any(p['id'] == other_payment.id for p in resp2.data)
\ No newline at end of file
+    assert any(p['id'] == other_payment.id for p in resp2.data['results'])
\ No newline at end of file